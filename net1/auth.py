@@ -0,0 +1,81 @@
+# 登录认证：加盐的密码哈希和无状态的会话令牌
+#
+# 密码用PBKDF2-SHA256加随机盐保存，只在登录时验证一次；
+# 登录成功后签发HMAC签名的会话令牌，之后的请求只需在进程内验证签名和有效期，不需要查询数据库，
+# 用户id从令牌中取得，客户端无法冒充其他用户。
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+
+PASSWORD_SCHEME = 'pbkdf2_sha256'
+PASSWORD_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS', 200000))
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+def hash_password(password):
+    """生成密码哈希：pbkdf2_sha256$迭代次数$盐$哈希"""
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, PASSWORD_ITERATIONS)
+    return f"{PASSWORD_SCHEME}${PASSWORD_ITERATIONS}${_b64encode(salt)}${_b64encode(digest)}"
+
+def is_password_hash(stored):
+    return isinstance(stored, str) and stored.startswith(PASSWORD_SCHEME + '$')
+
+def verify_password(password, stored):
+    """验证密码（兼容旧数据中的明文密码，调用方应在验证通过后改存为哈希）"""
+    if not password or not stored:
+        return False
+    if not is_password_hash(stored):
+        return hmac.compare_digest(str(password).encode(), str(stored).encode())
+    try:
+        _, iterations, salt, digest = stored.split('$')
+        expected = hashlib.pbkdf2_hmac('sha256', str(password).encode(), _b64decode(salt), int(iterations))
+    except (ValueError, TypeError):
+        return False
+    return hmac.compare_digest(expected, _b64decode(digest))
+
+class SessionSigner:
+    """签发和验证会话令牌：base64(内容).base64(HMAC-SHA256签名)"""
+
+    def __init__(self, secret, ttl=7 * 24 * 3600):
+        """
+        secret: 签名密钥（多个工作进程必须相同）
+        ttl: 令牌有效期（秒）
+        """
+        self.key = secret.encode() if isinstance(secret, str) else secret
+        self.ttl = ttl
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self.key, payload.encode(), hashlib.sha256).digest())
+
+    def issue(self, user_id):
+        """签发令牌"""
+        payload = _b64encode(json.dumps({'uid': user_id, 'exp': int(time.time() + self.ttl)},
+                                        separators=(',', ':')).encode())
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token):
+        """验证令牌，有效时返回用户id，否则返回None（令牌不是字符串或格式不对时也返回None）"""
+        if not isinstance(token, str) or token.count('.') != 1:
+            return None
+        payload, signature = token.split('.')
+        # 按字节比较：令牌中有非ASCII字符时compare_digest不接受str
+        if not hmac.compare_digest(signature.encode(), self._sign(payload).encode()):
+            return None
+        try:
+            data = json.loads(_b64decode(payload))
+        except ValueError:
+            return None
+        exp = data.get('exp') if isinstance(data, dict) else None
+        if not isinstance(exp, (int, float)) or exp < time.time():
+            return None
+        return data.get('uid')
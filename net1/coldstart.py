@@ -0,0 +1,144 @@
+# 冷启动测试：反复启动新的服务进程，测量从启动进程到 / 和 /api/login 返回第一个字节的时间
+#
+# 用法：
+#   python coldstart.py --runs 10 --storage sqlite
+#   python coldstart.py --spawn dev --storage memory --output cold.json
+#   python coldstart.py --storage supabase --real-supabase --compare cold.json
+#
+# fly.io上 auto_stop_machines 会在空闲时停止机器，之后的第一个请求要等待Python启动、导入依赖
+# 和创建数据库客户端。每次测试都启动一个全新的进程，依次请求 / 和 /api/login：
+#   start_ms         启动进程到端口可以连接
+#   index_ttfb_ms    启动进程到 / 返回第一个字节
+#   login_ttfb_ms    启动进程到 /api/login 返回第一个字节（在 / 之后发送）
+#   login_ms         /api/login 自身的首字节时间（包括创建数据库客户端和第一次访问数据库）
+# sqlite和memory存储会先注册测试用户；内存数据库替身（默认的supabase）每次启动都是空的，
+# 登录只测到按用户名查询为止。
+
+import argparse
+import json
+import socket
+import statistics
+import sys
+import tempfile
+import time
+
+from loadtest import spawn_server, compare
+
+METRICS = ('start_ms', 'index_ttfb_ms', 'login_ttfb_ms', 'login_ms')
+
+def first_byte(url, method, path, body=None, timeout=60):
+    """发送一个请求，返回 (收到第一个字节的时间, 状态码, 响应体)"""
+    host, port = url.rsplit('//', 1)[1].split(':')
+    data = json.dumps(body).encode() if body is not None else b''
+    request = (f"{method} {path} HTTP/1.1\r\n"
+               f"Host: {host}:{port}\r\n"
+               f"Content-Type: application/json\r\n"
+               f"Content-Length: {len(data)}\r\n"
+               f"Connection: close\r\n\r\n").encode() + data
+    with socket.create_connection((host, int(port)), timeout=timeout) as sock:
+        sock.sendall(request)
+        chunks = [sock.recv(1)]
+        received = time.perf_counter()
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    response = b''.join(chunks)
+    head, _, payload = response.partition(b'\r\n\r\n')
+    return received, int(head.split()[1]), payload
+
+def stop(process):
+    process.terminate()
+    process.wait(timeout=35)
+
+def prepare(args, data_dir):
+    """sqlite和memory存储：先启动一次服务注册测试用户，数据保存在data_dir中"""
+    process, url = spawn_server(args.spawn, args.storage, args.db_latency_ms, data_dir, not args.real_supabase)
+    try:
+        first_byte(url, 'POST', '/api/register', {'username': args.username, 'password': args.password})
+    finally:
+        stop(process)
+
+def measure(args, data_dir):
+    """启动一次服务并测量，返回各项耗时（毫秒）"""
+    start = time.perf_counter()
+    process, url = spawn_server(args.spawn, args.storage, args.db_latency_ms, data_dir, not args.real_supabase)
+    try:
+        listening = time.perf_counter()
+        index_time, index_status, _ = first_byte(url, 'GET', '/')
+        login_start = time.perf_counter()
+        login_time, login_status, payload = first_byte(
+            url, 'POST', '/api/login', {'username': args.username, 'password': args.password})
+    finally:
+        stop(process)
+
+    try:
+        login_ok = json.loads(payload).get('success', False)
+    except ValueError:
+        login_ok = False
+    return {
+        'start_ms': (listening - start) * 1000,
+        'index_ttfb_ms': (index_time - start) * 1000,
+        'login_ttfb_ms': (login_time - start) * 1000,
+        'login_ms': (login_time - login_start) * 1000,
+        'index_status': index_status,
+        'login_status': login_status,
+        'login_ok': login_ok,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='net1 冷启动测试')
+    parser.add_argument('--runs', type=int, default=5, help='启动次数')
+    parser.add_argument('--spawn', choices=['dev', 'gunicorn'], default='gunicorn', help='启动方式')
+    parser.add_argument('--storage', choices=['supabase', 'sqlite', 'memory'], default='sqlite',
+                        help='使用的存储（supabase默认使用内存数据库替身）')
+    parser.add_argument('--real-supabase', action='store_true', help='supabase存储连接真实的Supabase（需要网络）')
+    parser.add_argument('--db-latency-ms', type=float, default=0, help='内存数据库替身每次调用的模拟延迟（毫秒）')
+    parser.add_argument('--username', default='coldstart', help='测试用户名')
+    parser.add_argument('--password', default='123456', help='测试用户密码（6位数字）')
+    parser.add_argument('--output', help='把结果保存为JSON文件，便于对比')
+    parser.add_argument('--compare', help='与之前保存的结果对比，有指标变差超过容忍比例时退出码为1')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='对比时允许变差的比例')
+    args = parser.parse_args()
+
+    runs = []
+    with tempfile.TemporaryDirectory(prefix='net1-coldstart-') as data_dir:
+        if args.storage != 'supabase':
+            prepare(args, data_dir)
+        for index in range(args.runs):
+            result = measure(args, data_dir)
+            runs.append(result)
+            print(f"第{index + 1}次  启动: {result['start_ms']:.0f}ms  /: {result['index_ttfb_ms']:.0f}ms  "
+                  f"/api/login: {result['login_ttfb_ms']:.0f}ms（请求自身 {result['login_ms']:.0f}ms，"
+                  f"{'登录成功' if result['login_ok'] else '登录失败'}）")
+
+    report = {
+        'spawn': args.spawn,
+        'storage': args.storage,
+        'real_supabase': args.real_supabase,
+        'runs': args.runs,
+        'login_ok': sum(result['login_ok'] for result in runs),
+        'errors': sum(result['index_status'] != 200 or result['login_status'] != 200 for result in runs),
+    }
+    for name in METRICS:
+        values = [result[name] for result in runs]
+        report[name] = round(statistics.median(values), 1)
+        report[f"{name}_min"] = round(min(values), 1)
+        report[f"{name}_max"] = round(max(values), 1)
+
+    print(f"中位数  启动: {report['start_ms']}ms  /: {report['index_ttfb_ms']}ms  "
+          f"/api/login: {report['login_ttfb_ms']}ms（请求自身 {report['login_ms']}ms）  错误: {report['errors']}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到: {args.output}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance,
+                                  metrics=[(name, False) for name in METRICS])
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
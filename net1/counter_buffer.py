@@ -0,0 +1,130 @@
+# 计数器写缓冲：在内存中合并每个用户的计数器更新，定时或积累到一定数量后批量写入数据库
+#
+# 计数器只增不减：同一用户在一个刷新周期内的多次更新只保留最大的一个（乱序到达的旧值不会覆盖新值），
+# 数据库中也只保留较大的值（见storage.py的set_counters）。数据库写入频率只和刷新周期有关，与点击频率无关。
+#
+# 批量写入失败时逐个用户重写：其他用户写入成功而单独失败的更新（如超出字段范围）被丢弃，
+# 不会让整批更新永远重试；全部失败时视为数据库不可用，整批留在缓冲中等待下次重试。
+
+import atexit
+import threading
+import time
+
+class CounterBuffer:
+    """按用户合并计数器更新，后台线程批量刷新"""
+
+    def __init__(self, flush, interval_ms=500, max_pending=200):
+        """
+        flush: 批量写入函数，参数为 {user_id: counter}
+        interval_ms: 刷新周期（毫秒）
+        max_pending: 待写入的用户数达到该值时立即刷新
+        """
+        self.flush_func = flush
+        self.interval = interval_ms / 1000
+        self.max_pending = max_pending
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.stats = {'updates': 0, 'flushes': 0, 'rows': 0, 'errors': 0, 'dropped': 0}
+
+        self.thread = threading.Thread(target=self._run, name='counter-buffer', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def set(self, user_id, counter):
+        """记录一次计数器更新，返回该用户待写入的值（与尚未写入的值取较大的）"""
+        with self.lock:
+            counter = max(counter, self.pending.get(user_id, counter))
+            self.pending[user_id] = counter
+            self.stats['updates'] += 1
+            full = len(self.pending) >= self.max_pending
+        if full:
+            self.wakeup.set()
+        return counter
+
+    def get(self, user_id, default=None):
+        """读取尚未写入数据库的计数器值，没有时返回default"""
+        with self.lock:
+            return self.pending.get(user_id, default)
+
+    def flush(self):
+        """把当前缓冲的更新写入数据库，返回写入的用户数；数据库不可用时放回缓冲等待下次重试"""
+        with self.flush_lock:
+            with self.lock:
+                items, self.pending = self.pending, {}
+            if not items:
+                return 0
+            try:
+                self.flush_func(items)
+                written, failed = len(items), {}
+            except Exception as e:
+                with self.lock:
+                    self.stats['errors'] += 1
+                print(f"计数器批量写入失败，逐个用户重试：{e}")
+                written, failed = self._flush_each(items)
+
+            with self.lock:
+                # 与刷新期间的新更新合并，保留较大的值
+                for user_id, counter in failed.items():
+                    self.pending[user_id] = max(counter, self.pending.get(user_id, counter))
+                if written:
+                    self.stats['flushes'] += 1
+                    self.stats['rows'] += written
+            if failed:
+                print(f"计数器写入失败，{len(failed)} 条更新将在下次重试")
+            return written
+
+    def _flush_each(self, items, probe=3):
+        """
+        逐个用户写入，返回 (写入的用户数, 需要重试的更新)
+
+        有用户写入成功时，单独失败的更新是这一行本身的问题，丢弃并计入dropped；
+        最先写入的probe个用户都失败时视为数据库不可用，不再继续尝试，全部留待重试
+        """
+        written, errors = 0, {}
+        for user_id, counter in items.items():
+            if not written and len(errors) >= probe:
+                return 0, items
+            try:
+                self.flush_func({user_id: counter})
+                written += 1
+            except Exception as e:
+                errors[user_id] = (counter, e)
+        if not written:
+            return 0, items
+        for user_id, (counter, e) in errors.items():
+            print(f"丢弃无法写入的计数器更新（用户 {user_id}，计数 {counter}）：{e}")
+        with self.lock:
+            self.stats['dropped'] += len(errors)
+        return written, {}
+
+    def get_stats(self):
+        """写缓冲统计"""
+        with self.lock:
+            return dict(self.stats, pending=len(self.pending))
+
+    def _run(self):
+        while not self.closed:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def close(self):
+        """停止后台线程并写入剩余的更新（进程退出时调用）"""
+        if self.closed:
+            return
+        self.closed = True
+        self.wakeup.set()
+        self.thread.join(timeout=5)
+        # 最后一次刷新失败时再试一次
+        for _ in range(2):
+            self.flush()
+            with self.lock:
+                if not self.pending:
+                    break
+            time.sleep(self.interval)
+        with self.lock:
+            if self.pending:
+                print(f"进程退出时仍有 {len(self.pending)} 条计数器更新未能写入")
@@ -0,0 +1,162 @@
+# Supabase数据库客户端：直接使用PostgREST接口，配置连接池、超时和HTTP/2，并统计健康指标
+#
+# 提供与supabase客户端相同的 table() 和 rpc() 用法。
+# 不同用途的请求（登录注册、读取、下注、计数器写入）通过各自的分舱（bulkhead）限制并发数，
+# 某一类请求变慢时只会占满自己的名额，不会占满整个连接池拖慢其他接口。
+
+import threading
+import time
+from collections import deque
+
+import httpx
+from postgrest import SyncPostgrestClient
+from postgrest.utils import SyncClient
+
+class BulkheadFull(Exception):
+    """分舱并发数已满"""
+
+class Bulkhead:
+    """限制一类请求的并发数，超过等待时间仍没有名额时立即失败"""
+
+    def __init__(self, name, limit, wait=0.2):
+        self.name = name
+        self.limit = limit
+        self.wait = wait
+        self.semaphore = threading.BoundedSemaphore(limit)
+        self.lock = threading.Lock()
+        self.stats = {'calls': 0, 'active': 0, 'rejected': 0, 'errors': 0, 'timeouts': 0}
+
+    def __enter__(self):
+        if not self.semaphore.acquire(timeout=self.wait):
+            with self.lock:
+                self.stats['rejected'] += 1
+            raise BulkheadFull(f"{self.name} 请求过多，请稍后重试")
+        with self.lock:
+            self.stats['calls'] += 1
+            self.stats['active'] += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        with self.lock:
+            self.stats['active'] -= 1
+            if exc_type is not None:
+                self.stats['errors'] += 1
+                if issubclass(exc_type, httpx.TimeoutException):
+                    self.stats['timeouts'] += 1
+        self.semaphore.release()
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, limit=self.limit)
+
+class HTTPMetrics:
+    """通过httpx事件钩子统计请求数、状态码、HTTP版本和延迟"""
+
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.stats = {'requests': 0, 'responses': 0, 'server_errors': 0, 'client_errors': 0}
+        self.versions = {}
+
+    def on_request(self, request):
+        request.extensions['start_time'] = time.perf_counter()
+        with self.lock:
+            self.stats['requests'] += 1
+
+    def on_response(self, response):
+        latency = time.perf_counter() - response.request.extensions.get('start_time', time.perf_counter())
+        with self.lock:
+            self.stats['responses'] += 1
+            if response.status_code >= 500:
+                self.stats['server_errors'] += 1
+            elif response.status_code >= 400:
+                self.stats['client_errors'] += 1
+            self.versions[response.http_version] = self.versions.get(response.http_version, 0) + 1
+            self.latencies.append(latency)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats, http_versions=dict(self.versions))
+            latencies = sorted(self.latencies)
+        if latencies:
+            stats['p50_ms'] = round(latencies[len(latencies) // 2] * 1000, 1)
+            stats['p99_ms'] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 1)
+        return stats
+
+class PooledPostgrestClient(SyncPostgrestClient):
+    """使用自定义连接池参数的PostgREST客户端"""
+
+    def __init__(self, base_url, headers, timeout, limits, http2, metrics):
+        self.limits = limits
+        self.http2 = http2
+        self.metrics = metrics
+        super().__init__(base_url, headers=headers, timeout=timeout)
+
+    def create_session(self, base_url, headers, timeout):
+        return SyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            limits=self.limits,
+            http2=self.http2,
+            event_hooks={'request': [self.metrics.on_request], 'response': [self.metrics.on_response]}
+        )
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+class SupabaseClient:
+    """带连接池、超时、分舱隔离和健康指标的Supabase数据库客户端"""
+
+    def __init__(self, url, key, pool_size=10, timeout=5.0, connect_timeout=3.0, pool_timeout=1.0,
+                 keepalive_expiry=60.0, http2=None, bulkheads=None):
+        """
+        url: Supabase项目地址
+        key: API密钥
+        pool_size: 连接池大小（同时也是保持的长连接数）
+        timeout: 每次请求的读写超时（秒）
+        connect_timeout: 建立连接的超时（秒）
+        pool_timeout: 等待连接池空闲连接的超时（秒），连接池占满时快速失败而不是一直等待
+        keepalive_expiry: 空闲长连接的保留时间（秒）
+        http2: 是否使用HTTP/2，为None时安装了h2就使用
+        bulkheads: {分舱名称: 并发上限}
+        """
+        self.pool_size = pool_size
+        self.http2 = _http2_available() if http2 is None else http2
+        self.metrics = HTTPMetrics()
+        self.postgrest = PooledPostgrestClient(
+            f"{url}/rest/v1",
+            headers={'apiKey': key, 'Authorization': f'Bearer {key}'},
+            timeout=httpx.Timeout(timeout, connect=connect_timeout, pool=pool_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size,
+                                keepalive_expiry=keepalive_expiry),
+            http2=self.http2,
+            metrics=self.metrics
+        )
+        self.bulkheads = {name: Bulkhead(name, limit) for name, limit in (bulkheads or {}).items()}
+
+    def table(self, name):
+        return self.postgrest.from_(name)
+
+    def rpc(self, fn, params):
+        return self.postgrest.rpc(fn, params)
+
+    def bulkhead(self, name):
+        """获取分舱（用法：with client.bulkhead('bet'): ...）"""
+        return self.bulkheads[name]
+
+    def get_stats(self):
+        """连接池配置、HTTP指标和各分舱的统计"""
+        return {
+            'pool_size': self.pool_size,
+            'http2': self.http2,
+            'http': self.metrics.get_stats(),
+            'bulkheads': {name: bulkhead.get_stats() for name, bulkhead in self.bulkheads.items()}
+        }
+
+    def close(self):
+        self.postgrest.aclose()
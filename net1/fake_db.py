@@ -0,0 +1,171 @@
+# 内存数据库替身：实现app.py用到的 table() 和 rpc() 接口，用于本地压测和调试，不需要连接Supabase
+#
+# 设置 FAKE_SUPABASE=1 后app.py使用它代替SupabaseClient（见README“压力测试”）。
+# 行为与 schema.sql 保持一致：用户名唯一、金币不能为负数、下注函数自己生成随机数，原子地检查余额并记录流水。
+# FAKE_SUPABASE_LATENCY_MS 可以给每次调用加上固定延迟，模拟到数据库的网络往返。
+# 数据只保存在当前进程中，多个gunicorn工作进程之间不共享，压测时使用单个工作进程。
+
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from db_client import Bulkhead
+from storage import BET_COST, BET_PAYOUT
+
+class FakeQuery:
+    """PostgREST查询构造器的最小实现（select/insert/update + eq）"""
+
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.action = 'select'
+        self.columns = '*'
+        self.values = None
+        self.filters = []
+
+    def select(self, columns='*'):
+        self.action = 'select'
+        self.columns = columns
+        return self
+
+    def insert(self, values):
+        self.action = 'insert'
+        self.values = values
+        return self
+
+    def update(self, values):
+        self.action = 'update'
+        self.values = values
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((column, value))
+        return self
+
+    def execute(self):
+        return self.db.call(f"{self.action} {self.table}", self._execute)
+
+    def _execute(self):
+        rows = self.db.tables.setdefault(self.table, [])
+        if self.action == 'insert':
+            return [self.db.insert_row(self.table, self.values)]
+
+        matched = [row for row in rows if all(row.get(column) == value for column, value in self.filters)]
+        if self.action == 'update':
+            for row in matched:
+                row.update(self.values)
+        if self.columns == '*':
+            return [dict(row) for row in matched]
+        columns = [column.strip() for column in self.columns.split(',')]
+        return [{column: row.get(column) for column in columns} for row in matched]
+
+class FakeRPC:
+    def __init__(self, db, fn, params):
+        self.db = db
+        self.fn = fn
+        self.params = params
+
+    def execute(self):
+        handler = getattr(self.db, f"rpc_{self.fn}", None)
+        if handler is None:
+            raise ValueError(f"未知的数据库函数：{self.fn}")
+        return self.db.call(f"rpc {self.fn}", lambda: handler(**self.params))
+
+class FakeSupabaseClient:
+    """与SupabaseClient接口相同的内存数据库，统计每种调用的次数"""
+
+    def __init__(self, latency_ms=0, bulkheads=None):
+        """
+        latency_ms: 每次调用的模拟延迟（毫秒）
+        bulkheads: {分舱名称: 并发上限}，与SupabaseClient相同
+        """
+        self.latency = latency_ms / 1000
+        self.lock = threading.Lock()
+        self.tables = {'users': [], 'bet_ledger': []}
+        self.calls = {}
+        self.bulkheads = {name: Bulkhead(name, limit) for name, limit in (bulkheads or {}).items()}
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, fn, params):
+        return FakeRPC(self, fn, params)
+
+    def bulkhead(self, name):
+        return self.bulkheads[name]
+
+    def call(self, name, func):
+        """执行一次“数据库调用”：模拟延迟，加锁执行，计数"""
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            return SimpleNamespace(data=func())
+
+    def insert_row(self, table, values):
+        rows = self.tables.setdefault(table, [])
+        row = dict(values)
+        if table == 'users':
+            if any(user['username'] == row['username'] for user in rows):
+                raise ValueError('duplicate key value violates unique constraint "users_username_key"')
+            row.setdefault('id', str(uuid.uuid4()))
+            row.setdefault('counter', 0)
+            row.setdefault('coins', 1000)
+            row.setdefault('created_at', datetime.now(timezone.utc).isoformat())
+        rows.append(row)
+        return dict(row)
+
+    def _find_user(self, user_id):
+        for row in self.tables['users']:
+            if row['id'] == user_id:
+                return row
+        return None
+
+    def rpc_place_bet(self, p_user_id):
+        user = self._find_user(p_user_id)
+        if user is None or user['coins'] < BET_COST:
+            coins = user['coins'] if user is not None else None
+            return [{'success': False, 'coins': coins, 'random_number': None, 'payout': None}]
+        random_number = random.randint(0, 10000)
+        payout = BET_PAYOUT if random_number % 2 == 1 else 0
+        user['coins'] += payout - BET_COST
+        self.tables['bet_ledger'].append({
+            'user_id': p_user_id, 'cost': BET_COST, 'payout': payout,
+            'random_number': random_number, 'balance_after': user['coins']
+        })
+        return [{'success': True, 'coins': user['coins'], 'random_number': random_number, 'payout': payout}]
+
+    def rpc_place_bets(self, p_user_id, p_count):
+        results = []
+        for _ in range(min(p_count, 50)):
+            results.extend(self.rpc_place_bet(p_user_id))
+        return results
+
+    def rpc_set_counters(self, p_items):
+        updated = 0
+        for item in p_items:
+            user = self._find_user(item['id'])
+            if user is not None:
+                user['counter'] = max(user['counter'], item['counter'])
+                updated += 1
+        return updated
+
+    def get_stats(self):
+        """调用统计（http.requests与SupabaseClient含义相同，是数据库调用总数）"""
+        with self.lock:
+            calls = dict(self.calls)
+            users = len(self.tables['users'])
+        return {
+            'backend': 'memory',
+            'latency_ms': self.latency * 1000,
+            'users': users,
+            'calls': calls,
+            'http': {'requests': sum(calls.values())},
+            'bulkheads': {name: bulkhead.get_stats() for name, bulkhead in self.bulkheads.items()}
+        }
+
+    def close(self):
+        pass
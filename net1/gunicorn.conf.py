@@ -0,0 +1,104 @@
+# Gunicorn 生产环境配置
+# 启动命令：gunicorn -c gunicorn.conf.py app:app
+#
+# 进程数和线程数根据机器的CPU核数和内存自动计算，也可以用环境变量覆盖：
+#   WEB_CONCURRENCY  工作进程数
+#   WEB_THREADS      每个进程的线程数
+#   WORKER_MEMORY_MB 估算的单个工作进程内存占用（默认80MB）
+#   CACHE_BUS_DIR    用户缓存失效通知的套接字目录
+#   STORAGE_BACKEND  数据存储（memory存储只能使用一个工作进程）
+#   SESSION_SECRET   会话令牌的签名密钥
+
+import multiprocessing
+import os
+import secrets
+
+def _memory_mb():
+    """读取机器（或容器）的可用内存，单位MB"""
+    # cgroup v2 / v1 的内存限制
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            if value.isdigit() and int(value) < 1 << 50:
+                return int(value) // (1024 * 1024)
+        except OSError:
+            pass
+    # 物理内存
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemTotal:'):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return 512
+
+def _default_workers():
+    """按CPU核数和内存计算工作进程数：CPU允许 2*核数+1 个，内存预留64MB给系统"""
+    # 内存存储的数据在进程内，多个进程会各自保存一份不同的数据
+    if os.environ.get('STORAGE_BACKEND') == 'memory':
+        return 1
+    cpus = multiprocessing.cpu_count()
+    worker_memory = int(os.environ.get('WORKER_MEMORY_MB', 80))
+    by_memory = (_memory_mb() - 64) // worker_memory
+    return max(1, min(2 * cpus + 1, by_memory))
+
+# 会话令牌的签名密钥：所有工作进程必须相同。线上应通过 fly secrets set SESSION_SECRET=... 设置，
+# 没有设置时在主进程中随机生成一个（重启后已签发的令牌失效）
+os.environ.setdefault('SESSION_SECRET', secrets.token_hex(32))
+
+# 多个工作进程之间通过本机套接字互相通知用户缓存失效（见user_cache.py）
+os.environ.setdefault('CACHE_BUS_DIR', '/tmp/net1-cache-bus')
+
+# 监听地址
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+
+# 请求处理都是在等待Supabase响应，用多线程工作进程（gthread）提高并发，
+# 256MB的机器上约2个进程，每个进程8个线程
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', _default_workers()))
+threads = int(os.environ.get('WEB_THREADS', 8))
+
+# 保持连接，减少反向代理到应用之间的重复握手
+keepalive = 5
+
+# 请求超时和优雅退出：收到SIGTERM后停止接受新请求，最多等待30秒处理完进行中的请求
+timeout = 30
+graceful_timeout = 30
+
+# 不预加载应用：Supabase客户端的HTTP连接不能在fork后的进程之间共享
+preload_app = False
+
+# 定期重启工作进程，防止内存缓慢增长撑满小内存机器（MAX_REQUESTS=0 表示不重启）
+max_requests = int(os.environ.get('MAX_REQUESTS', 2000))
+max_requests_jitter = 200
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+def on_starting(server):
+    server.log.info(f"启动 {workers} 个工作进程，每个进程 {threads} 个线程（内存 {_memory_mb()}MB）")
+
+def worker_int(worker):
+    worker.log.info(f"工作进程 {worker.pid} 收到中断信号，正在退出")
+
+def post_worker_init(worker):
+    # 工作进程加载完应用后，在后台预热存储（导入依赖、创建数据库客户端、建立连接），不阻塞第一个请求
+    import sys
+    import threading
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        threading.Thread(target=app_module.warm_up, name='warm-up', daemon=True).start()
+
+def worker_exit(server, worker):
+    # 工作进程退出前写入计数器缓冲中剩余的更新，再关闭存储（内存存储会写入最后一次快照）
+    import sys
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        app_module.counter_buffer.close()
+        app_module.storage.close()
+
+def on_exit(server):
+    server.log.info("服务已停止")
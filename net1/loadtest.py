@@ -0,0 +1,394 @@
+# 压力测试脚本：用asyncio并发发送请求，统计每秒请求数、延迟分位数、错误率和每个请求的数据库调用次数
+#
+# 用法：
+#   python loadtest.py --url http://localhost:8080 --username loadtest --password 123456
+#   python loadtest.py --path /api/get_user_data --concurrency 50 --duration 20
+#   python loadtest.py --mix counter=50,bet=25,get=15,batch=5,login=3,register=2
+#   python loadtest.py --spawn gunicorn --mix default --output base.json
+#   python loadtest.py --spawn gunicorn --mix default --compare base.json
+#
+# 只使用标准库，每个并发连接使用HTTP/1.1长连接。
+# 对比开发服务器（python app.py）和gunicorn（gunicorn -c gunicorn.conf.py app:app）时，
+# 用相同参数分别运行一次即可。
+# --spawn 会在本地启动一个不需要网络的服务，压测结束后关闭：默认使用内存数据库替身
+# （FAKE_SUPABASE=1，见fake_db.py）走Supabase的代码路径，--storage sqlite/memory 使用本机存储（见storage.py）。
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+# --mix default 使用的操作比例：以点击计数器和下注为主，少量登录和注册
+DEFAULT_MIX = 'counter=50,bet=25,get=15,batch=5,login=3,register=2'
+MIX_OPERATIONS = ('counter', 'bet', 'get', 'batch', 'login', 'register')
+
+# 压测结束后等待计数器写缓冲刷新（默认500毫秒一次），再统计数据库调用次数
+SETTLE_SECONDS = 1.0
+
+class HTTPConnection:
+    """基于asyncio的最小HTTP/1.1客户端（长连接，只支持带Content-Length的响应）"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, body=None, token=None):
+        """发送请求，返回 (状态码, 响应体)"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+        data = json.dumps(body).encode() if body is not None else b''
+        head = (f"{method} {path} HTTP/1.1\r\n"
+                f"Host: {self.host}:{self.port}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                + (f"Authorization: Bearer {token}\r\n" if token else "")
+                + "Connection: keep-alive\r\n\r\n")
+        try:
+            self.writer.write(head.encode() + data)
+            await self.writer.drain()
+
+            status_line = await self.reader.readuntil(b'\r\n')
+            status = int(status_line.split()[1])
+            headers = {}
+            while True:
+                line = await self.reader.readuntil(b'\r\n')
+                if line == b'\r\n':
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            if 'content-length' in headers:
+                payload = await self.reader.readexactly(int(headers['content-length']))
+            else:
+                payload = await self.reader.read()
+                headers['connection'] = 'close'
+
+            if headers.get('connection', '').lower() == 'close':
+                await self.close()
+            return status, payload
+        except (OSError, asyncio.IncompleteReadError):
+            await self.close()
+            raise
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+def percentile(values, p):
+    """计算分位数（values已排序）"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))
+    return values[index]
+
+async def prepare_user(conn, username, password):
+    """注册（已存在时忽略）并登录压测用户，返回用户信息（包含会话令牌）"""
+    await conn.request('POST', '/api/register', {'username': username, 'password': password})
+    status, payload = await conn.request('POST', '/api/login', {'username': username, 'password': password})
+    result = json.loads(payload)
+    if not result.get('success'):
+        raise SystemExit(f"登录压测用户失败：{result.get('message')}")
+    return dict(result['user'], token=result['token'])
+
+async def db_calls(host, port):
+    """
+    读取服务访问存储的总次数（/api/health，Supabase为HTTP请求数），读取失败时返回None
+
+    只统计处理这个请求的工作进程，压测多进程的服务时结果偏小
+    """
+    conn = HTTPConnection(host, port)
+    try:
+        status, payload = await conn.request('GET', '/api/health')
+        return json.loads(payload)['storage']['calls']
+    except (OSError, ValueError, KeyError, TypeError, asyncio.IncompleteReadError):
+        return None
+    finally:
+        await conn.close()
+
+def parse_mix(text):
+    """解析操作比例，如 counter=50,bet=25，返回 {操作: 权重}"""
+    if text == 'default':
+        text = DEFAULT_MIX
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in MIX_OPERATIONS:
+            raise SystemExit(f"不支持的操作：{name}（可选：{', '.join(MIX_OPERATIONS)}）")
+        mix[name] = float(weight or 1)
+    return mix
+
+class Stats:
+    """按操作统计请求数、延迟、错误（网络错误或非200）和失败（返回success=false，如金币不足）"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.failures = {}
+        self.status = {}
+
+    def record(self, name, latency, status, ok):
+        self.latencies.setdefault(name, []).append(latency)
+        self.status[status] = self.status.get(status, 0) + 1
+        if status != 200:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        elif not ok:
+            self.failures[name] = self.failures.get(name, 0) + 1
+
+    @property
+    def total(self):
+        return sum(len(values) for values in self.latencies.values())
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    return {
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p90_ms': round(percentile(latencies, 90) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'max_ms': round(latencies[-1] * 1000, 1) if latencies else 0,
+    }
+
+async def run(args):
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    mix = parse_mix(args.mix) if args.mix else None
+
+    setup = HTTPConnection(host, port)
+    if mix:
+        # 每个并发连接模拟一个独立的用户（用户名带上随机前缀，重复压测时不会冲突）
+        run_id = secrets.token_hex(3)
+        users = [await prepare_user(setup, f"{args.username}{run_id}u{index}", args.password)
+                 for index in range(args.concurrency)]
+    else:
+        users = [await prepare_user(setup, args.username, args.password)] * args.concurrency
+        run_id = None
+    await setup.close()
+    calls_before = await db_calls(host, port)
+
+    if args.body:
+        body = json.loads(args.body)
+    else:
+        # 默认请求体：用户由会话令牌识别，update_counter需要计数
+        body = {'counter': 1}
+
+    stats = Stats()
+    registered = 0
+    deadline = time.perf_counter() + args.duration
+
+    def next_request(user):
+        """按比例随机选择一个操作，返回 (操作名, 路径, 请求体, 令牌)"""
+        nonlocal registered
+        if not mix:
+            return args.path, args.path, body, user['token']
+        name = random.choices(list(mix), weights=list(mix.values()))[0]
+        if name == 'counter':
+            user['counter'] += 1
+            return name, '/api/update_counter', {'counter': user['counter']}, user['token']
+        if name == 'bet':
+            return name, '/api/bet_game', None, user['token']
+        if name == 'get':
+            return name, '/api/get_user_data', None, user['token']
+        if name == 'batch':
+            user['counter'] += 1
+            operations = [{'op': 'update_counter', 'counter': user['counter']},
+                          {'op': 'bet_game'}, {'op': 'get_user_data'}]
+            return name, '/api/batch', {'operations': operations}, user['token']
+        if name == 'login':
+            return name, '/api/login', {'username': user['username'], 'password': args.password}, None
+        registered += 1
+        return name, '/api/register', {'username': f"{args.username}{run_id}r{registered}",
+                                        'password': args.password}, None
+
+    async def worker(user):
+        conn = HTTPConnection(host, port)
+        while time.perf_counter() < deadline:
+            if args.requests and stats.total >= args.requests:
+                break
+            name, path, request_body, token = next_request(user)
+            start = time.perf_counter()
+            try:
+                status, payload = await conn.request('POST', path, request_body, token)
+                ok = status == 200 and json.loads(payload).get('success', False)
+            except (OSError, ValueError, asyncio.IncompleteReadError):
+                status, ok = 'error', False
+            stats.record(name, time.perf_counter() - start, status, ok)
+        await conn.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(dict(user)) for user in users))
+    elapsed = time.perf_counter() - start
+
+    await asyncio.sleep(SETTLE_SECONDS)
+    calls_after = await db_calls(host, port)
+
+    total = stats.total
+    errors = sum(stats.errors.values())
+    failures = sum(stats.failures.values())
+    report = {
+        'path': 'mix' if mix else args.path,
+        'mix': mix,
+        'concurrency': args.concurrency,
+        'requests': total,
+        'errors': errors,
+        'failures': failures,
+        'error_rate': round(errors / total, 4) if total else 0,
+        'elapsed': round(elapsed, 2),
+        'rps': round(total / elapsed, 1) if elapsed else 0,
+        **summarize([latency for values in stats.latencies.values() for latency in values]),
+        'db_calls': None,
+        'db_calls_per_request': None,
+        'operations': {
+            name: dict(summarize(values), requests=len(values),
+                       errors=stats.errors.get(name, 0), failures=stats.failures.get(name, 0))
+            for name, values in sorted(stats.latencies.items())
+        },
+        'status': {str(key): value for key, value in stats.status.items()},
+    }
+    if calls_before is not None and calls_after is not None:
+        report['db_calls'] = calls_after - calls_before
+        report['db_calls_per_request'] = round(report['db_calls'] / total, 3) if total else 0
+
+    print(f"接口: {report['path']}  并发: {report['concurrency']}  耗时: {report['elapsed']}秒")
+    print(f"请求数: {report['requests']}  错误: {report['errors']}（{report['error_rate']:.2%}）  "
+          f"失败: {report['failures']}  每秒请求数: {report['rps']}")
+    print(f"延迟 p50: {report['p50_ms']}ms  p90: {report['p90_ms']}ms  "
+          f"p99: {report['p99_ms']}ms  最大: {report['max_ms']}ms")
+    if report['db_calls'] is not None:
+        print(f"数据库调用: {report['db_calls']}  每个请求: {report['db_calls_per_request']}")
+    if mix:
+        for name, item in report['operations'].items():
+            print(f"  {name:<9} 请求: {item['requests']:<7} 错误: {item['errors']:<5} 失败: {item['failures']:<5} "
+                  f"p50: {item['p50_ms']}ms  p99: {item['p99_ms']}ms")
+    return report
+
+# 与基线对比的指标：(名称, 越大越好)
+COMPARE_METRICS = (('rps', True), ('p50_ms', False), ('p99_ms', False),
+                   ('error_rate', False), ('db_calls_per_request', False))
+
+def compare(report, baseline, tolerance, metrics=COMPARE_METRICS):
+    """与基线结果对比，打印每个指标的变化，返回变差超过容忍比例的指标"""
+    regressions = []
+    print(f"与基线对比（容忍 {tolerance:.0%}）：")
+    for name, higher_is_better in metrics:
+        old, new = baseline.get(name), report.get(name)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else (0 if new == old else float('inf'))
+        worse = -change if higher_is_better else change
+        # 错误率从0开始时按绝对值判断，避免偶尔一个错误就算作回归
+        if name == 'error_rate':
+            worse = new - old
+        flag = '  回归' if worse > tolerance else ''
+        if flag:
+            regressions.append(name)
+        print(f"  {name:<22} {old} -> {new}  ({change:+.1%}){flag}")
+    return regressions
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def spawn_server(kind, storage, latency_ms, data_dir, fake_supabase=True):
+    """
+    在本地启动服务（数据文件放在data_dir中），等待端口可以连接后返回 (进程, 地址)
+
+    fake_supabase为False时supabase存储连接真实的Supabase（需要网络）
+    """
+    port = free_port()
+    env = dict(os.environ, STORAGE_BACKEND=storage, PORT=str(port),
+               FAKE_SUPABASE='1', FAKE_SUPABASE_LATENCY_MS=str(latency_ms),
+               SQLITE_PATH=os.path.join(data_dir, 'net1.db'),
+               MEMORY_SNAPSHOT_PATH=os.path.join(data_dir, 'net1-snapshot.json'))
+    if not fake_supabase:
+        del env['FAKE_SUPABASE']
+    if kind == 'gunicorn':
+        # 只使用一个工作进程，并且不定期重启：内存数据不在进程之间共享（重启会清空数据），
+        # /api/health 的调用次数也只统计处理这个请求的工作进程，多进程时数据库调用数不准确
+        env['WEB_CONCURRENCY'] = '1'
+        env['MAX_REQUESTS'] = '0'
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app']
+    else:
+        command = [sys.executable, 'app.py']
+    # gunicorn的访问日志输出到stdout，压测时丢弃
+    process = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                               stdout=subprocess.DEVNULL)
+
+    url = f"http://127.0.0.1:{port}"
+    # 每10毫秒检查一次（冷启动测试用这里返回的时间计算启动耗时）
+    for _ in range(3000):
+        if process.poll() is not None:
+            raise SystemExit(f"服务启动失败（退出码 {process.returncode}）")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            return process, url
+        except OSError:
+            time.sleep(0.01)
+    process.terminate()
+    raise SystemExit('服务启动超时')
+
+def main():
+    parser = argparse.ArgumentParser(description='net1 压力测试')
+    parser.add_argument('--url', default='http://localhost:8080', help='服务地址')
+    parser.add_argument('--path', default='/api/bet_game', help='压测的接口')
+    parser.add_argument('--mix', help=f'按比例混合多种操作，如 {DEFAULT_MIX}（default表示使用该比例）')
+    parser.add_argument('--body', help='请求体JSON（请求头中带压测用户的会话令牌）')
+    parser.add_argument('--username', default='loadtest', help='压测用户名（不存在时自动注册）')
+    parser.add_argument('--password', default='123456', help='压测用户密码（6位数字）')
+    parser.add_argument('--concurrency', type=int, default=20, help='并发连接数')
+    parser.add_argument('--duration', type=float, default=10, help='压测时长（秒）')
+    parser.add_argument('--requests', type=int, default=0, help='最多发送的请求数（0表示不限制）')
+    parser.add_argument('--output', help='把结果保存为JSON文件，便于对比')
+    parser.add_argument('--compare', help='与之前保存的结果对比，有指标变差超过容忍比例时退出码为1')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='对比时允许变差的比例')
+    parser.add_argument('--spawn', choices=['dev', 'gunicorn'],
+                        help='在本地启动不需要网络的服务进行压测（忽略--url）')
+    parser.add_argument('--storage', choices=['supabase', 'sqlite', 'memory'], default='supabase',
+                        help='--spawn时使用的存储（supabase表示内存数据库替身）')
+    parser.add_argument('--db-latency-ms', type=float, default=0,
+                        help='--spawn时内存数据库替身每次调用的模拟延迟（毫秒）')
+    args = parser.parse_args()
+
+    process = None
+    data_dir = tempfile.TemporaryDirectory(prefix='net1-loadtest-')
+    if args.spawn:
+        process, args.url = spawn_server(args.spawn, args.storage, args.db_latency_ms, data_dir.name)
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=35)
+        data_dir.cleanup()
+
+    report['server'] = args.spawn or args.url
+    report['storage'] = args.storage if args.spawn else None
+    report['db_latency_ms'] = args.db_latency_ms if args.spawn and args.storage == 'supabase' else None
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到: {args.output}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
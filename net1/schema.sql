@@ -0,0 +1,121 @@
+-- net1 数据库结构（在Supabase的SQL编辑器中执行，可以重复执行）
+
+-- 用户表
+CREATE TABLE IF NOT EXISTS users (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  username TEXT UNIQUE NOT NULL,
+  password TEXT NOT NULL,
+  counter INTEGER NOT NULL DEFAULT 0,
+  coins INTEGER NOT NULL DEFAULT 1000,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS coins INTEGER NOT NULL DEFAULT 1000;
+
+-- 金币不能为负数（余额检查由place_bet中的条件更新保证，这里再加一道约束）
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'users_coins_non_negative') THEN
+    ALTER TABLE users ADD CONSTRAINT users_coins_non_negative CHECK (coins >= 0);
+  END IF;
+END $$;
+
+-- 下注流水表：只追加，不修改不删除
+CREATE TABLE IF NOT EXISTS bet_ledger (
+  id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+  user_id UUID NOT NULL REFERENCES users(id),
+  cost INTEGER NOT NULL,
+  payout INTEGER NOT NULL,
+  random_number INTEGER NOT NULL,
+  balance_after INTEGER NOT NULL,
+  created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS bet_ledger_user_id_created_at ON bet_ledger (user_id, created_at);
+
+REVOKE UPDATE, DELETE, TRUNCATE ON bet_ledger FROM anon, authenticated;
+
+-- 下面的函数都是SECURITY DEFINER（以表的所有者身份执行），只授权给服务端使用的service_role，
+-- anon/authenticated 密钥不能调用（否则客户端可以直接调用它们修改金币和计数器）
+
+-- 旧版本由调用方传入下注金额和奖励，删除以免继续被调用
+DROP FUNCTION IF EXISTS place_bets(UUID, INTEGER, INTEGER[], INTEGER[]);
+DROP FUNCTION IF EXISTS place_bet(UUID, INTEGER, INTEGER, INTEGER);
+
+-- 下注：在数据库中生成随机数（0-10000），花费100金币，单数获得200金币（与storage.py中的BET_COST、BET_PAYOUT一致）
+-- 一条语句完成余额检查、扣除下注金额和发放奖励，并记录流水
+-- 同一用户的并发下注在users行锁上排队，不会互相覆盖余额
+-- 返回 success=false 表示金币不足（或用户不存在），coins 为当前余额，random_number、payout 为NULL
+CREATE OR REPLACE FUNCTION place_bet(p_user_id UUID)
+RETURNS TABLE (success BOOLEAN, coins INTEGER, random_number INTEGER, payout INTEGER)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  c_cost CONSTANT INTEGER := 100;
+  c_payout CONSTANT INTEGER := 200;
+  v_random_number INTEGER := floor(random() * 10001)::INTEGER;
+  v_payout INTEGER;
+  v_coins INTEGER;
+BEGIN
+  v_payout := CASE WHEN v_random_number % 2 = 1 THEN c_payout ELSE 0 END;
+
+  UPDATE users AS u
+     SET coins = u.coins - c_cost + v_payout
+   WHERE u.id = p_user_id
+     AND u.coins >= c_cost
+  RETURNING u.coins INTO v_coins;
+
+  IF NOT FOUND THEN
+    RETURN QUERY SELECT FALSE, (SELECT u.coins FROM users AS u WHERE u.id = p_user_id), NULL::INTEGER, NULL::INTEGER;
+    RETURN;
+  END IF;
+
+  INSERT INTO bet_ledger (user_id, cost, payout, random_number, balance_after)
+  VALUES (p_user_id, c_cost, v_payout, v_random_number, v_coins);
+
+  RETURN QUERY SELECT TRUE, v_coins, v_random_number, v_payout;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION place_bet(UUID) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION place_bet(UUID) TO service_role;
+
+-- 批量更新计数器：p_items 为 [{"id": ..., "counter": ...}, ...]，一次调用更新多个用户，返回更新的行数
+-- 计数器只增不减，只保留较大的值：重试的旧批次、多个工作进程乱序写入都不会用旧值覆盖新值
+CREATE OR REPLACE FUNCTION set_counters(p_items JSONB)
+RETURNS INTEGER
+LANGUAGE sql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+  WITH updated AS (
+    UPDATE users AS u
+       SET counter = GREATEST(u.counter, i.counter)
+      FROM jsonb_to_recordset(p_items) AS i(id UUID, counter INTEGER)
+     WHERE u.id = i.id
+    RETURNING 1
+  )
+  SELECT count(*)::INTEGER FROM updated;
+$$;
+
+REVOKE EXECUTE ON FUNCTION set_counters(JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION set_counters(JSONB) TO service_role;
+
+-- 连续下注多次（最多50次，与批量接口的上限一致）：按顺序调用place_bet，一次数据库调用返回每次下注的结果
+CREATE OR REPLACE FUNCTION place_bets(p_user_id UUID, p_count INTEGER)
+RETURNS TABLE (success BOOLEAN, coins INTEGER, random_number INTEGER, payout INTEGER)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  FOR i IN 1 .. LEAST(COALESCE(p_count, 0), 50) LOOP
+    RETURN QUERY SELECT * FROM place_bet(p_user_id);
+  END LOOP;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION place_bets(UUID, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION place_bets(UUID, INTEGER) TO service_role;
@@ -1,4 +1,4 @@
-// 当前用户状态
+// 当前用户状态（currentUser.token为登录后签发的会话令牌）
 let currentUser = null;
 let currentCounter = 0;
 let currentCoins = 1000;
@@ -12,15 +12,74 @@ document.addEventListener('DOMContentLoaded', function() {
 async function checkLoginStatus() {
     // 检查本地存储中是否有用户信息
     const savedUser = localStorage.getItem('currentUser');
-    if (savedUser) {
+    if (savedUser && JSON.parse(savedUser).token) {
+        // 先用本地保存的数据显示主页，再在后台刷新为服务器上的最新数据（不需要重新登录）
         currentUser = JSON.parse(savedUser);
-        await loadUserData();
+        showUserData(currentUser.counter || 0, currentUser.coins ?? 1000);
         showMainPage();
+        loadUserData();
     } else {
         showLogin();
     }
 }
 
+// 调用需要登录的接口：带上会话令牌，令牌过期时回到登录页面
+async function apiPost(path, body) {
+    const response = await fetch(path, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Authorization': 'Bearer ' + currentUser.token
+        },
+        body: JSON.stringify(body || {})
+    });
+    const result = await response.json();
+    if (response.status === 401) {
+        localStorage.removeItem('currentUser');
+        currentUser = null;
+        showLogin();
+    }
+    return result;
+}
+
+// 批量请求：短时间内发起的多个操作合并为一次 /api/batch 请求，服务器按顺序执行并返回各自的结果
+const BATCH_DELAY = 20;
+const BATCH_MAX_OPERATIONS = 50;
+let batchQueue = [];
+let batchTimer = null;
+
+// 把操作加入队列，返回该操作的结果（与单独调用对应接口的返回相同）
+function queueOperation(op, params) {
+    return new Promise(function(resolve, reject) {
+        batchQueue.push({operation: Object.assign({op: op}, params), resolve: resolve, reject: reject});
+        if (batchQueue.length >= BATCH_MAX_OPERATIONS) {
+            flushBatch();
+        } else if (!batchTimer) {
+            batchTimer = setTimeout(flushBatch, BATCH_DELAY);
+        }
+    });
+}
+
+// 发送队列中的所有操作
+async function flushBatch() {
+    clearTimeout(batchTimer);
+    batchTimer = null;
+    const items = batchQueue;
+    batchQueue = [];
+    if (items.length === 0) {
+        return;
+    }
+    
+    try {
+        const result = await apiPost('/api/batch', {operations: items.map(item => item.operation)});
+        items.forEach(function(item, index) {
+            item.resolve(result.success ? result.results[index] : result);
+        });
+    } catch (error) {
+        items.forEach(item => item.reject(error));
+    }
+}
+
 // 显示注册页面
 function showRegister() {
     document.getElementById('registerForm').classList.remove('hidden');
@@ -133,9 +192,10 @@ document.getElementById('login').addEventListener('submit', async function(e) {
         
         if (result.success) {
             currentUser = result.user;
+            currentUser.token = result.token;
             // 保存用户信息到本地存储
-            localStorage.setItem('currentUser', JSON.stringify(currentUser));
-            await loadUserData();
+            // 登录接口已返回计数和金币，不需要再请求一次
+            showUserData(currentUser.counter, currentUser.coins);
             showMainPage();
         } else {
             alert(result.message);
@@ -146,26 +206,26 @@ document.getElementById('login').addEventListener('submit', async function(e) {
     }
 });
 
+// 显示计数和金币，并保存到本地存储（下次打开页面时先显示）
+function showUserData(counter, coins) {
+    currentCounter = counter;
+    currentCoins = coins;
+    document.getElementById('counter').textContent = currentCounter;
+    document.getElementById('coins').textContent = currentCoins;
+    if (currentUser) {
+        currentUser.counter = counter;
+        currentUser.coins = coins;
+        localStorage.setItem('currentUser', JSON.stringify(currentUser));
+    }
+}
+
 // 加载用户数据
 async function loadUserData() {
     try {
-        const response = await fetch('/api/get_user_data', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                user_id: currentUser.id
-            })
-        });
-        
-        const result = await response.json();
+        const result = await queueOperation('get_user_data');
         
         if (result.success) {
-            currentCounter = result.counter;
-            currentCoins = result.coins;
-            document.getElementById('counter').textContent = currentCounter;
-            document.getElementById('coins').textContent = currentCoins;
+            showUserData(result.counter, result.coins);
         } else {
             console.error('加载用户数据失败：', result.message);
         }
@@ -175,27 +235,44 @@ async function loadUserData() {
     }
 }
 
+// 计数器保存的防抖参数：停止点击500毫秒后保存，连续点击时最多每2秒保存一次
+const COUNTER_SAVE_DELAY = 500;
+const COUNTER_SAVE_MAX_WAIT = 2000;
+let counterSaveTimer = null;
+let counterFirstUnsaved = 0;
+let counterSavedValue = null;
+
 // 增加计数器
-async function incrementCounter() {
+function incrementCounter() {
     currentCounter++;
     document.getElementById('counter').textContent = currentCounter;
     
-    // 保存到数据库
+    // 只更新界面，合并一段时间内的点击后再保存到数据库
+    const now = Date.now();
+    if (!counterFirstUnsaved) {
+        counterFirstUnsaved = now;
+    }
+    clearTimeout(counterSaveTimer);
+    const delay = Math.min(COUNTER_SAVE_DELAY, counterFirstUnsaved + COUNTER_SAVE_MAX_WAIT - now);
+    counterSaveTimer = setTimeout(saveCounter, Math.max(0, delay));
+}
+
+// 保存计数器（发送的是当前总数，服务器以最后一次为准）
+async function saveCounter() {
+    clearTimeout(counterSaveTimer);
+    counterSaveTimer = null;
+    counterFirstUnsaved = 0;
+    if (!currentUser || currentCounter === counterSavedValue) {
+        return;
+    }
+    
+    const counter = currentCounter;
     try {
-        const response = await fetch('/api/update_counter', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                user_id: currentUser.id,
-                counter: currentCounter
-            })
-        });
-        
-        const result = await response.json();
+        const result = await queueOperation('update_counter', {counter: counter});
         
-        if (!result.success) {
+        if (result.success) {
+            counterSavedValue = counter;
+        } else {
             console.error('保存计数器失败：', result.message);
         }
     } catch (error) {
@@ -203,6 +280,28 @@ async function incrementCounter() {
     }
 }
 
+// 页面隐藏或关闭时立即发送未保存的计数器（sendBeacon在页面卸载后也能送达）
+function flushCounterOnHide() {
+    if (!counterSaveTimer || !currentUser) {
+        return;
+    }
+    clearTimeout(counterSaveTimer);
+    counterSaveTimer = null;
+    counterFirstUnsaved = 0;
+    // sendBeacon不能设置请求头，令牌放在请求体中
+    const body = JSON.stringify({token: currentUser.token, counter: currentCounter});
+    if (navigator.sendBeacon('/api/update_counter', new Blob([body], {type: 'application/json'}))) {
+        counterSavedValue = currentCounter;
+    }
+}
+
+document.addEventListener('visibilitychange', function() {
+    if (document.visibilityState === 'hidden') {
+        flushCounterOnHide();
+    }
+});
+window.addEventListener('pagehide', flushCounterOnHide);
+
 // BET游戏
 async function playBetGame() {
     if (currentCoins < 100) {
@@ -211,18 +310,15 @@ async function playBetGame() {
     }
     
     try {
-        const response = await fetch('/api/bet_game', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                user_id: currentUser.id,
-                current_coins: currentCoins
-            })
-        });
-        
-        const result = await response.json();
+        // 有未保存的计数器时和下注放在同一次批量请求中发送
+        if (counterSaveTimer) {
+            saveCounter();
+        }
+        // 余额由服务器原子扣减，不需要传当前金币数
+        const result = await queueOperation('bet_game');
+        if (!currentUser) {
+            return;
+        }
         
         if (result.success) {
             currentCoins = result.new_coins;
@@ -236,6 +332,11 @@ async function playBetGame() {
                 document.getElementById('gameResult').style.color = '#dc3545';
             }
         } else {
+            // 金币不足时服务器会返回实际余额
+            if (result.new_coins !== undefined) {
+                currentCoins = result.new_coins;
+                document.getElementById('coins').textContent = currentCoins;
+            }
             alert(result.message);
         }
         
@@ -247,6 +348,12 @@ async function playBetGame() {
 // 退出登录
 async function logout() {
     try {
+        // 先保存未保存的计数器
+        if (counterSaveTimer) {
+            await saveCounter();
+        }
+        counterSavedValue = null;
+        
         // 清除本地存储
         localStorage.removeItem('currentUser');
         currentUser = null;
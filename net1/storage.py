@@ -0,0 +1,527 @@
+# 数据存储：路由只通过这里的接口读写用户数据，具体存储由 STORAGE_BACKEND 选择
+#
+#   supabase  远程Supabase数据库（默认，通过db_client.py的连接池访问）
+#   sqlite    本机SQLite文件（WAL模式），没有网络往返，多个工作进程可以共用同一个文件
+#   memory    进程内存，定期把快照写入文件，重启时从快照恢复；只能使用一个工作进程
+#
+# 每种存储都保证与schema.sql相同的语义：用户名唯一、金币不能为负数、
+# 下注在一次调用中原子地完成余额检查、抽随机数、扣减和发奖，并追加一条下注流水。
+# 随机数和奖励由存储自己决定（Supabase在数据库函数中生成），调用方只能指定下注次数。
+
+import atexit
+import json
+import os
+import random
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# BET游戏：每次花费的金币和单数时获得的金币（与schema.sql中place_bet函数的常量一致）
+BET_COST = 100
+BET_PAYOUT = 200
+
+# 计数器的最大值（schema.sql中counter是PostgreSQL的INTEGER）
+COUNTER_MAX = 2 ** 31 - 1
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+def _roll():
+    """生成0-10000的随机数，单数获得奖励，返回 (随机数, 奖励)"""
+    random_number = random.randint(0, 10000)
+    return random_number, BET_PAYOUT if random_number % 2 == 1 else 0
+
+def _bet_result(success, coins, random_number=None, payout=None):
+    return {'success': success, 'coins': coins, 'random_number': random_number, 'payout': payout}
+
+def _new_user(username, password_hash):
+    return {
+        'id': str(uuid.uuid4()),
+        'username': username,
+        'password': password_hash,
+        'counter': 0,
+        'coins': 1000,
+        'created_at': _now()
+    }
+
+class Storage:
+    """存储接口：用户行是包含 id、username、password、counter、coins 的字典"""
+
+    name = None
+
+    def __init__(self):
+        self.stats_lock = threading.Lock()
+        self.calls = {}
+
+    def _count(self, operation):
+        with self.stats_lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+
+    def ping(self):
+        """检查存储可以访问（Supabase会创建客户端并建立连接），失败时抛出异常"""
+
+    def get_user(self, user_id):
+        """按id读取用户行，不存在时返回None"""
+        raise NotImplementedError
+
+    def get_user_by_username(self, username):
+        """按用户名读取用户行，不存在时返回None"""
+        raise NotImplementedError
+
+    def create_user(self, username, password_hash):
+        """创建用户并返回用户行，用户名已存在时返回None"""
+        raise NotImplementedError
+
+    def set_password(self, user_id, password_hash):
+        raise NotImplementedError
+
+    def place_bets(self, user_id, count):
+        """
+        按顺序下注count次（每次花费BET_COST，随机数为单数时获得BET_PAYOUT），原子地检查余额并记录流水
+
+        返回每次下注的 {'success': 是否成功, 'coins': 下注后的余额, 'random_number': 随机数, 'payout': 奖励}；
+        金币不足时success为False、random_number和payout为None，用户不存在时coins也为None
+        """
+        raise NotImplementedError
+
+    def set_counters(self, items):
+        """
+        批量写入计数器，items为 {user_id: counter}，返回更新的用户数
+
+        计数器只增不减，只保留存储中的值和新值中较大的一个（与schema.sql中的set_counters一致）
+        """
+        raise NotImplementedError
+
+    def get_stats(self):
+        """存储统计，calls为访问存储的总次数（Supabase为HTTP请求数）"""
+        with self.stats_lock:
+            calls = dict(self.calls)
+        return {'backend': self.name, 'calls': sum(calls.values()), 'operations': calls}
+
+    def close(self):
+        pass
+
+class SupabaseStorage(Storage):
+    """Supabase存储：不同用途的请求使用各自的分舱（见db_client.py）"""
+
+    name = 'supabase'
+
+    def __init__(self, create_client):
+        """
+        create_client: 创建SupabaseClient（或测试用的FakeSupabaseClient）的函数，
+        第一次访问数据库时才调用，导入httpx等依赖和创建客户端不占用启动时间
+        """
+        super().__init__()
+        self.create_client = create_client
+        self._client = None
+        self.client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self.client_lock:
+                if self._client is None:
+                    self._client = self.create_client()
+        return self._client
+
+    def ping(self):
+        with self.client.bulkhead('read'):
+            self.client.table('users').select('id').eq('id', '00000000-0000-0000-0000-000000000000').execute()
+
+    def get_user(self, user_id):
+        self._count('get_user')
+        with self.client.bulkhead('read'):
+            result = self.client.table('users').select('*').eq('id', user_id).execute()
+        return result.data[0] if result.data else None
+
+    def get_user_by_username(self, username):
+        self._count('get_user_by_username')
+        with self.client.bulkhead('auth'):
+            result = self.client.table('users').select('*').eq('username', username).execute()
+        return result.data[0] if result.data else None
+
+    def create_user(self, username, password_hash):
+        self._count('create_user')
+        with self.client.bulkhead('auth'):
+            result = self.client.table('users').select('username').eq('username', username).execute()
+            if result.data:
+                return None
+            result = self.client.table('users').insert({
+                'username': username,
+                'password': password_hash,
+                'counter': 0,
+                'coins': 1000
+            }).execute()
+        return result.data[0] if result.data else None
+
+    def set_password(self, user_id, password_hash):
+        self._count('set_password')
+        with self.client.bulkhead('auth'):
+            self.client.table('users').update({'password': password_hash}).eq('id', user_id).execute()
+
+    def place_bets(self, user_id, count):
+        # 函数定义见schema.sql（随机数在数据库中生成）；只下注一次时调用place_bet
+        self._count('place_bets')
+        with self.client.bulkhead('bet'):
+            if count == 1:
+                result = self.client.rpc('place_bet', {'p_user_id': user_id}).execute()
+            else:
+                result = self.client.rpc('place_bets', {'p_user_id': user_id, 'p_count': count}).execute()
+        if not result.data or len(result.data) != count:
+            raise RuntimeError('下注结果与下注次数不一致')
+        return [_bet_result(row['success'], row['coins'], row['random_number'], row['payout'])
+                for row in result.data]
+
+    def set_counters(self, items):
+        self._count('set_counters')
+        with self.client.bulkhead('counter'):
+            result = self.client.rpc('set_counters', {
+                'p_items': [{'id': user_id, 'counter': counter} for user_id, counter in items.items()]
+            }).execute()
+        return result.data
+
+    def get_stats(self):
+        if self._client is None:
+            return dict(super().get_stats(), calls=0, client=None)
+        client_stats = self._client.get_stats()
+        return dict(super().get_stats(), calls=client_stats['http']['requests'], client=client_stats)
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+  id TEXT PRIMARY KEY,
+  username TEXT UNIQUE NOT NULL,
+  password TEXT NOT NULL,
+  counter INTEGER NOT NULL DEFAULT 0,
+  coins INTEGER NOT NULL DEFAULT 1000 CHECK (coins >= 0),
+  created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bet_ledger (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id TEXT NOT NULL REFERENCES users(id),
+  cost INTEGER NOT NULL,
+  payout INTEGER NOT NULL,
+  random_number INTEGER NOT NULL,
+  balance_after INTEGER NOT NULL,
+  created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bet_ledger_user_id_created_at ON bet_ledger (user_id, created_at);
+"""
+
+class SQLiteStorage(Storage):
+    """本机SQLite存储（WAL模式：读不阻塞写，多个进程可以同时打开）"""
+
+    name = 'sqlite'
+
+    def __init__(self, path, busy_timeout_ms=5000):
+        """
+        path: 数据库文件路径（fly.io上应放在挂载的卷中，否则重新部署后数据丢失）
+        busy_timeout_ms: 其他进程正在写入时的等待时间（毫秒）
+        """
+        super().__init__()
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        # 每个线程使用自己的连接
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        conn = self._connection()
+        conn.executescript(SQLITE_SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            # isolation_level=None：自己控制事务（BEGIN IMMEDIATE）
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            # WAL模式下NORMAL只在检查点时同步到磁盘，断电最多丢失最近的事务，不会损坏数据库
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """写事务：开始时就获取写锁，避免读后再升级为写锁时与其他进程死锁"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            # COMMIT失败（如SQLITE_BUSY）时事务仍然打开，也要回滚，否则这个线程的连接一直持有写锁
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+
+    def ping(self):
+        self._connection().execute('SELECT 1')
+
+    def get_user(self, user_id):
+        self._count('get_user')
+        row = self._connection().execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
+        return dict(row) if row else None
+
+    def get_user_by_username(self, username):
+        self._count('get_user_by_username')
+        row = self._connection().execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
+        return dict(row) if row else None
+
+    def create_user(self, username, password_hash):
+        self._count('create_user')
+        user = _new_user(username, password_hash)
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    'INSERT INTO users (id, username, password, counter, coins, created_at) '
+                    'VALUES (:id, :username, :password, :counter, :coins, :created_at)', user)
+        except sqlite3.IntegrityError:
+            return None
+        return user
+
+    def set_password(self, user_id, password_hash):
+        self._count('set_password')
+        with self._transaction() as conn:
+            conn.execute('UPDATE users SET password = ? WHERE id = ?', (password_hash, user_id))
+
+    def place_bets(self, user_id, count):
+        self._count('place_bets')
+        results = []
+        with self._transaction() as conn:
+            for _ in range(count):
+                random_number, payout = _roll()
+                updated = conn.execute(
+                    'UPDATE users SET coins = coins - ? + ? WHERE id = ? AND coins >= ?',
+                    (BET_COST, payout, user_id, BET_COST)).rowcount
+                row = conn.execute('SELECT coins FROM users WHERE id = ?', (user_id,)).fetchone()
+                if row is None:
+                    results.append(_bet_result(False, None))
+                    continue
+                if not updated:
+                    results.append(_bet_result(False, row['coins']))
+                    continue
+                conn.execute(
+                    'INSERT INTO bet_ledger (user_id, cost, payout, random_number, balance_after, created_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (user_id, BET_COST, payout, random_number, row['coins'], _now()))
+                results.append(_bet_result(True, row['coins'], random_number, payout))
+        return results
+
+    def set_counters(self, items):
+        self._count('set_counters')
+        with self._transaction() as conn:
+            cursor = conn.executemany('UPDATE users SET counter = MAX(counter, ?) WHERE id = ?',
+                                      [(counter, user_id) for user_id, counter in items.items()])
+        return cursor.rowcount
+
+    def get_stats(self):
+        return dict(super().get_stats(), path=self.path, connections=len(self.connections))
+
+    def close(self):
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for conn in connections:
+            conn.close()
+
+class MemoryStorage(Storage):
+    """
+    进程内存存储，定期写快照
+
+    用户表整体写入快照文件（先写临时文件再替换，不会留下写了一半的快照）；
+    下注流水只追加新增的部分到 <快照文件>.ledger（每行一条JSON）。
+    两次快照之间进程崩溃会丢失这段时间的修改，正常退出时会写入最后一次快照。
+    """
+
+    name = 'memory'
+
+    def __init__(self, snapshot_path=None, snapshot_interval=5.0):
+        """
+        snapshot_path: 快照文件路径，为None时不保存（重启后数据丢失，适合压测）
+        snapshot_interval: 快照周期（秒），只在数据有变化时写入
+        """
+        super().__init__()
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.lock = threading.Lock()
+        self.snapshot_lock = threading.Lock()
+        self.users = {}
+        self.usernames = {}
+        self.ledger = []
+        self.ledger_size = 0
+        self.dirty = False
+        self.snapshots = 0
+        self.closed = False
+        self.wakeup = threading.Event()
+
+        if snapshot_path:
+            self._load()
+            self.thread = threading.Thread(target=self._run, name='memory-snapshot', daemon=True)
+            self.thread.start()
+        atexit.register(self.close)
+
+    def _load(self):
+        """从快照文件恢复"""
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+            for user in snapshot['users']:
+                self.users[user['id']] = user
+                self.usernames[user['username']] = user['id']
+            self.ledger_size = snapshot.get('ledger_size', 0)
+            print(f"从快照恢复了 {len(self.users)} 个用户：{self.snapshot_path}")
+        self._truncate_ledger()
+
+    def _truncate_ledger(self):
+        """
+        把流水文件截断到快照中记录的条数
+
+        快照先追加流水再替换用户快照，两步之间崩溃时流水文件中会多出快照里没有的下注，
+        不截断的话这些流水会和之后重新发生的下注重复
+        """
+        path = f"{self.snapshot_path}.ledger"
+        if not os.path.exists(path):
+            return
+        with open(path, 'r+b') as f:
+            for _ in range(self.ledger_size):
+                if not f.readline():
+                    break
+            offset = f.tell()
+            size = f.seek(0, os.SEEK_END)
+            if size > offset:
+                f.truncate(offset)
+                f.flush()
+                os.fsync(f.fileno())
+                print(f"流水文件中有 {size - offset} 字节不在快照中，已截断：{path}")
+
+    def get_user(self, user_id):
+        self._count('get_user')
+        with self.lock:
+            user = self.users.get(user_id)
+            return dict(user) if user else None
+
+    def get_user_by_username(self, username):
+        self._count('get_user_by_username')
+        with self.lock:
+            user = self.users.get(self.usernames.get(username))
+            return dict(user) if user else None
+
+    def create_user(self, username, password_hash):
+        self._count('create_user')
+        with self.lock:
+            if username in self.usernames:
+                return None
+            user = _new_user(username, password_hash)
+            self.users[user['id']] = user
+            self.usernames[username] = user['id']
+            self.dirty = True
+            return dict(user)
+
+    def set_password(self, user_id, password_hash):
+        self._count('set_password')
+        with self.lock:
+            user = self.users.get(user_id)
+            if user is not None:
+                user['password'] = password_hash
+                self.dirty = True
+
+    def place_bets(self, user_id, count):
+        self._count('place_bets')
+        results = []
+        with self.lock:
+            user = self.users.get(user_id)
+            for _ in range(count):
+                if user is None:
+                    results.append(_bet_result(False, None))
+                    continue
+                if user['coins'] < BET_COST:
+                    results.append(_bet_result(False, user['coins']))
+                    continue
+                random_number, payout = _roll()
+                user['coins'] += payout - BET_COST
+                # 没有快照文件时流水无处保存，不在内存中累积
+                if self.snapshot_path:
+                    self.ledger.append({
+                        'user_id': user_id, 'cost': BET_COST, 'payout': payout, 'random_number': random_number,
+                        'balance_after': user['coins'], 'created_at': _now()
+                    })
+                self.dirty = True
+                results.append(_bet_result(True, user['coins'], random_number, payout))
+        return results
+
+    def set_counters(self, items):
+        self._count('set_counters')
+        updated = 0
+        with self.lock:
+            for user_id, counter in items.items():
+                user = self.users.get(user_id)
+                if user is not None:
+                    user['counter'] = max(user['counter'], counter)
+                    updated += 1
+            self.dirty = self.dirty or updated > 0
+        return updated
+
+    def snapshot(self):
+        """把当前数据写入快照文件，没有变化时跳过，返回是否写入"""
+        if not self.snapshot_path:
+            return False
+        with self.snapshot_lock:
+            with self.lock:
+                if not self.dirty:
+                    return False
+                users = [dict(user) for user in self.users.values()]
+                ledger, self.ledger = self.ledger, []
+                self.dirty = False
+            try:
+                # 先追加流水，再替换用户快照；快照中记录已写入的流水条数
+                if ledger:
+                    with open(f"{self.snapshot_path}.ledger", 'a', encoding='utf-8') as f:
+                        f.writelines(json.dumps(item, ensure_ascii=False) + '\n' for item in ledger)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    self.ledger_size += len(ledger)
+                    ledger = []
+                temp_path = f"{self.snapshot_path}.tmp"
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'users': users, 'ledger_size': self.ledger_size, 'time': _now()},
+                              f, ensure_ascii=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.snapshot_path)
+            except OSError as e:
+                with self.lock:
+                    # 写入失败时放回未写入的流水，下次重试
+                    self.ledger[:0] = ledger
+                    self.dirty = True
+                print(f"写入快照失败，将在下次重试：{e}")
+                return False
+            self.snapshots += 1
+            return True
+
+    def _run(self):
+        while not self.closed:
+            self.wakeup.wait(self.snapshot_interval)
+            self.snapshot()
+
+    def get_stats(self):
+        with self.lock:
+            users = len(self.users)
+            pending_ledger = len(self.ledger)
+        return dict(super().get_stats(), users=users, snapshot_path=self.snapshot_path,
+                    snapshots=self.snapshots, pending_ledger=pending_ledger)
+
+    def close(self):
+        """停止快照线程并写入最后一次快照（进程退出时调用）"""
+        if self.closed:
+            return
+        self.closed = True
+        self.wakeup.set()
+        self.snapshot()
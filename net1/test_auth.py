@@ -0,0 +1,81 @@
+# 登录认证测试：密码哈希和会话令牌
+
+import time
+
+import pytest
+
+from auth import hash_password, verify_password, is_password_hash, SessionSigner, _b64encode
+
+def test_password_hash():
+    stored = hash_password('123456')
+    assert is_password_hash(stored)
+    assert verify_password('123456', stored)
+    assert not verify_password('654321', stored)
+    # 旧数据中的明文密码
+    assert verify_password('123456', '123456')
+    assert not verify_password('', stored)
+
+def test_session_roundtrip():
+    signer = SessionSigner('secret')
+    assert signer.verify(signer.issue('user-1')) == 'user-1'
+
+def test_session_rejects_tampered_or_foreign_tokens():
+    signer = SessionSigner('secret')
+    token = signer.issue('user-1')
+    payload, signature = token.split('.')
+    assert SessionSigner('other-secret').verify(token) is None
+    assert signer.verify(f"{payload}.{signature[:-1]}x") is None
+    assert signer.verify(f"{signer.issue('user-2').split('.')[0]}.{signature}") is None
+
+def test_session_expired():
+    signer = SessionSigner('secret', ttl=-1)
+    assert signer.verify(signer.issue('user-1')) is None
+
+def test_session_rejects_malformed_tokens():
+    signer = SessionSigner('secret')
+    for token in (None, '', 5, 1.5, ['a.b'], {'token': 'a.b'}, 'abc', 'a.b.c', 'a.b', 'ä.ö', '!!!.???'):
+        assert signer.verify(token) is None
+
+def test_session_rejects_signed_non_object_payload():
+    # 签名正确但内容不是对象或没有有效期
+    signer = SessionSigner('secret')
+    for content in (b'[1, 2]', b'"text"', b'{"uid": "user-1"}', b'{"uid": "user-1", "exp": "never"}'):
+        payload = _b64encode(content)
+        assert signer.verify(f"{payload}.{signer._sign(payload)}") is None
+    payload = _b64encode(f'{{"uid": "user-1", "exp": {int(time.time()) + 60}}}'.encode())
+    assert signer.verify(f"{payload}.{signer._sign(payload)}") == 'user-1'
+
+@pytest.fixture
+def client(monkeypatch):
+    """使用内存存储的测试客户端（需要安装flask）"""
+    pytest.importorskip('flask')
+    monkeypatch.setenv('STORAGE_BACKEND', 'memory')
+    monkeypatch.setenv('MEMORY_SNAPSHOT_PATH', '')
+    import app
+    return app.app.test_client()
+
+def test_require_session_rejects_bad_bodies(client):
+    for body in ({'token': 5}, {'token': ['a.b']}, ['token'], 'token', None, {}):
+        response = client.post('/api/get_user_data', json=body)
+        assert response.status_code == 401
+    response = client.post('/api/update_counter', data=b'not json', content_type='application/json')
+    assert response.status_code == 401
+
+def test_require_session_accepts_token_in_body(client):
+    import app
+
+    user = app.storage.create_user('session-user', hash_password('123456'))
+    response = client.post('/api/get_user_data', json={'token': app.sessions.issue(user['id'])})
+    assert response.status_code == 200 and response.get_json()['success']
+
+def test_update_counter_rejects_out_of_range_values(client):
+    import app
+
+    user = app.storage.create_user('counter-user', hash_password('123456'))
+    headers = {'Authorization': f"Bearer {app.sessions.issue(user['id'])}"}
+    for counter in (True, -1, 2 ** 31, 2 ** 70, 1.5, '5', None):
+        response = client.post('/api/update_counter', json={'counter': counter}, headers=headers)
+        assert response.get_json()['success'] is False
+    assert app.counter_buffer.get(user['id']) is None
+    response = client.post('/api/update_counter', json={'counter': 2 ** 31 - 1}, headers=headers)
+    assert response.get_json()['success'] is True
@@ -0,0 +1,80 @@
+# 计数器写缓冲测试：合并更新时保留较大的值，写入失败时保留在缓冲中
+
+from counter_buffer import CounterBuffer
+
+def make_buffer(flush):
+    # 刷新周期很长，测试中手动调用flush
+    return CounterBuffer(flush, interval_ms=3600 * 1000)
+
+def test_set_keeps_larger_value():
+    written = []
+    buffer = make_buffer(written.append)
+    assert buffer.set('u1', 5) == 5
+    assert buffer.set('u1', 3) == 5
+    assert buffer.set('u1', 8) == 8
+    assert buffer.get('u1') == 8
+    assert buffer.flush() == 1
+    assert written == [{'u1': 8}]
+    assert buffer.get('u1') is None
+    buffer.close()
+
+def test_failed_flush_merges_with_newer_updates():
+    calls = []
+    down = [True]
+
+    def flush(items):
+        calls.append(dict(items))
+        if len(calls) == 1:
+            # 写入期间到达了更新（u1较大、u2较小）
+            buffer.set('u1', 9)
+            buffer.set('u2', 1)
+        if down[0]:
+            raise RuntimeError('数据库不可用')
+
+    buffer = make_buffer(flush)
+    buffer.set('u1', 4)
+    buffer.set('u2', 6)
+    assert buffer.flush() == 0
+    down[0] = False
+    assert buffer.flush() == 2
+    assert calls[-1] == {'u1': 9, 'u2': 6}
+    assert buffer.get_stats()['errors'] == 1
+    buffer.close()
+
+def test_failed_row_dropped_when_others_succeed():
+    written = {}
+
+    def flush(items):
+        if any(counter > 2 ** 31 - 1 for counter in items.values()):
+            raise OverflowError('integer out of range')
+        written.update(items)
+
+    buffer = make_buffer(flush)
+    buffer.set('u1', 5)
+    buffer.set('u2', 2 ** 70)
+    buffer.set('u3', 7)
+    assert buffer.flush() == 2
+    assert written == {'u1': 5, 'u3': 7}
+    assert buffer.get('u2') is None
+    stats = buffer.get_stats()
+    assert stats['dropped'] == 1 and stats['pending'] == 0
+    buffer.close()
+
+def test_outage_keeps_all_updates():
+    calls = []
+
+    def flush(items):
+        calls.append(items)
+        raise ConnectionError('数据库不可用')
+
+    buffer = make_buffer(flush)
+    for index in range(10):
+        buffer.set(f'u{index}', index)
+    assert buffer.flush() == 0
+    # 一次批量写入加上最多3次逐个试探，不会逐个重写全部用户
+    assert len(calls) == 4
+    stats = buffer.get_stats()
+    assert stats['pending'] == 10 and stats['dropped'] == 0
+    buffer.flush_func = lambda items: None
+    assert buffer.flush() == 10
+    buffer.close()
@@ -0,0 +1,107 @@
+# 存储测试：三种存储（Supabase使用fake_db.py中的内存数据库替身）的下注语义相同
+#
+# 运行：python -m pytest -q test_storage.py（supabase需要安装httpx、postgrest，未安装时跳过）
+
+import pytest
+
+from storage import BET_COST, BET_PAYOUT, SupabaseStorage, SQLiteStorage, MemoryStorage
+
+@pytest.fixture(params=['supabase', 'sqlite', 'memory'])
+def storage(request, tmp_path):
+    if request.param == 'supabase':
+        pytest.importorskip('httpx')
+        from fake_db import FakeSupabaseClient
+        storage = SupabaseStorage(lambda: FakeSupabaseClient(bulkheads={'auth': 4, 'read': 4, 'bet': 4, 'counter': 2}))
+    elif request.param == 'sqlite':
+        storage = SQLiteStorage(str(tmp_path / 'net1.db'))
+    else:
+        storage = MemoryStorage(str(tmp_path / 'snapshot.json'), snapshot_interval=3600)
+    yield storage
+    storage.close()
+
+def test_place_bets_computes_payout(storage):
+    user = storage.create_user('player', 'hash')
+    rows = storage.place_bets(user['id'], 5)
+    assert len(rows) == 5
+    coins = 1000
+    for row in rows:
+        assert row['success']
+        assert 0 <= row['random_number'] <= 10000
+        assert row['payout'] == (BET_PAYOUT if row['random_number'] % 2 == 1 else 0)
+        coins += row['payout'] - BET_COST
+        assert row['coins'] == coins
+    assert storage.get_user(user['id'])['coins'] == coins
+
+def test_place_bets_insufficient_coins(storage):
+    user = storage.create_user('player', 'hash')
+    rows = []
+    while not rows or rows[-1]['success']:
+        rows.extend(storage.place_bets(user['id'], 10))
+    failed = rows[-1]
+    assert failed['coins'] < BET_COST
+    assert failed['random_number'] is None and failed['payout'] is None
+    assert storage.get_user(user['id'])['coins'] == failed['coins']
+
+def test_place_bets_unknown_user(storage):
+    rows = storage.place_bets('00000000-0000-0000-0000-000000000000', 2)
+    assert [row['coins'] for row in rows] == [None, None]
+    assert not any(row['success'] for row in rows)
+
+def test_set_counters_keeps_larger_value(storage):
+    first = storage.create_user('player', 'hash')
+    second = storage.create_user('other', 'hash')
+    assert storage.set_counters({first['id']: 10, second['id']: 3}) == 2
+    # 重试的旧批次或其他工作进程的旧值不会覆盖较新的值
+    storage.set_counters({first['id']: 7, second['id']: 5})
+    assert storage.get_user(first['id'])['counter'] == 10
+    assert storage.get_user(second['id'])['counter'] == 5
+
+def test_sqlite_rolls_back_when_commit_fails(tmp_path, monkeypatch):
+    import sqlite3
+    from functools import partial
+
+    class BusyOnCommit(sqlite3.Connection):
+        fail = False
+
+        def execute(self, sql, *args):
+            if sql == 'COMMIT' and BusyOnCommit.fail:
+                BusyOnCommit.fail = False
+                raise sqlite3.OperationalError('database is locked')
+            return super().execute(sql, *args)
+
+    monkeypatch.setattr(sqlite3, 'connect', partial(sqlite3.connect, factory=BusyOnCommit))
+    storage = SQLiteStorage(str(tmp_path / 'net1.db'))
+    BusyOnCommit.fail = True
+    with pytest.raises(sqlite3.OperationalError):
+        storage.create_user('player', 'hash')
+    conn = storage._connection()
+    assert not conn.in_transaction
+    assert storage.get_user_by_username('player') is None
+    # 连接没有继续持有写锁，之后的写入正常
+    assert storage.create_user('player', 'hash') is not None
+    storage.close()
+
+def ledger_lines(snapshot_path):
+    with open(f"{snapshot_path}.ledger", encoding='utf-8') as f:
+        return f.readlines()
+
+def test_memory_restore_truncates_ledger(tmp_path):
+    path = str(tmp_path / 'snapshot.json')
+    storage = MemoryStorage(path, snapshot_interval=3600)
+    user = storage.create_user('player', 'hash')
+    storage.place_bets(user['id'], 3)
+    storage.close()
+    assert len(ledger_lines(path)) == 3
+
+    # 模拟追加流水后、替换快照前崩溃：流水文件中多出两条完整记录和半条记录
+    with open(f"{path}.ledger", 'a', encoding='utf-8') as f:
+        f.write('{"user_id": "x"}\n{"user_id": "y"}\n{"user_')
+
+    storage = MemoryStorage(path, snapshot_interval=3600)
+    assert storage.ledger_size == 3
+    assert len(ledger_lines(path)) == 3
+    storage.place_bets(user['id'], 2)
+    storage.close()
+    lines = ledger_lines(path)
+    assert len(lines) == 5
+    assert all(line.endswith('\n') and '"user_id": "x"' not in line for line in lines)
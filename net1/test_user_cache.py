@@ -0,0 +1,37 @@
+# 用户缓存测试：读取数据库期间用户被修改或失效时，不把读到的旧数据放入缓存
+
+from user_cache import UserCache
+
+def test_put_skips_rows_invalidated_during_read():
+    cache = UserCache()
+    version = cache.version()
+    # 读取数据库期间，另一个请求写入了计数器并删除了缓存
+    cache.invalidate('u1')
+    cache.put({'id': 'u1', 'username': 'player', 'counter': 1}, version)
+    assert cache.get('u1') is None
+    assert cache.get_stats()['stale_puts'] == 1
+
+    # 重新读取后可以放入缓存，其他用户不受影响
+    version = cache.version()
+    cache.put({'id': 'u1', 'username': 'player', 'counter': 2}, version)
+    cache.put({'id': 'u2', 'username': 'other', 'counter': 3}, version)
+    assert cache.get('u1')['counter'] == 2
+    assert cache.get_by_username('other')['counter'] == 3
+
+def test_put_skips_rows_updated_during_read():
+    cache = UserCache()
+    version = cache.version()
+    cache.update('u1', coins=900)
+    cache.put({'id': 'u1', 'username': 'player', 'coins': 1000}, version)
+    assert cache.get('u1') is None
+
+def test_pruned_invalidations_are_treated_as_stale():
+    cache = UserCache(max_size=2)
+    version = cache.version()
+    for user_id in ('u1', 'u2', 'u3'):
+        cache.invalidate(user_id)
+    # u1的失效记录已被丢弃，无法确认读取是否过期，不放入缓存
+    cache.put({'id': 'u1', 'counter': 1}, version)
+    assert cache.get('u1') is None
+    cache.put({'id': 'u1', 'counter': 1}, cache.version())
+    assert cache.get('u1')['counter'] == 1
@@ -0,0 +1,196 @@
+# 用户缓存：进程内按用户id缓存用户行（TTL过期 + LRU淘汰），写接口直接更新缓存
+#
+# 多进程部署时，可以用本机的Unix数据报套接字做一个简单的发布/订阅：
+# 每个进程在 CACHE_BUS_DIR 目录下绑定一个套接字，某个进程修改了用户数据后
+# 向目录下其他进程的套接字发送用户id，收到的进程删除自己缓存中的这个用户。
+#
+# 读取数据库和放入缓存之间，其他请求或进程可能修改并失效了同一个用户。
+# 每次失效都递增一个版本号并按用户记录下来，读取前先取版本号（version），
+# 放入缓存时如果该用户在这之后被失效过，就不放入读到的旧数据。
+
+import atexit
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+class UserCache:
+    """按用户id缓存用户行，支持按用户名查找"""
+
+    def __init__(self, max_size=10000, ttl=300, bus=None):
+        """
+        max_size: 最多缓存的用户数，超出时淘汰最久未使用的
+        ttl: 缓存有效期（秒）
+        bus: 跨进程失效通知（InvalidationBus），为None时只在本进程内有效
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.rows = OrderedDict()
+        self.usernames = {}
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0, 'stale_puts': 0}
+        # 失效版本号：每个用户最后一次失效时的版本，只保留最近max_size个用户，
+        # 更早被丢弃的记录用pruned表示（版本不晚于pruned的读取一律视为可能过期）
+        self.generation = 0
+        self.invalidated = OrderedDict()
+        self.pruned = 0
+        self.bus = bus
+        if bus is not None:
+            bus.subscribe(lambda user_id: self.invalidate(user_id, publish=False))
+
+    def get(self, user_id):
+        """读取用户行（副本），不存在或已过期时返回None"""
+        with self.lock:
+            item = self.rows.get(user_id)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    self._remove(user_id)
+                self.stats['misses'] += 1
+                return None
+            self.rows.move_to_end(user_id)
+            self.stats['hits'] += 1
+            return dict(item[1])
+
+    def get_by_username(self, username):
+        """按用户名读取用户行"""
+        with self.lock:
+            user_id = self.usernames.get(username)
+        if user_id is None:
+            with self.lock:
+                self.stats['misses'] += 1
+            return None
+        return self.get(user_id)
+
+    def version(self):
+        """读取数据库之前调用，返回当前版本号，之后传给put"""
+        with self.lock:
+            return self.generation
+
+    def put(self, row, version=None):
+        """
+        缓存从数据库读取的用户行（需要包含id）
+
+        version: 读取数据库之前取得的版本号；该用户在这之后被修改或失效过时不放入缓存
+        """
+        with self.lock:
+            user_id = row['id']
+            if version is not None and (self.pruned > version or self.invalidated.get(user_id, 0) > version):
+                self.stats['stale_puts'] += 1
+                return
+            self._remove(user_id)
+            self.rows[user_id] = (time.monotonic() + self.ttl, dict(row))
+            if row.get('username') is not None:
+                self.usernames[row['username']] = user_id
+            while len(self.rows) > self.max_size:
+                self._remove(next(iter(self.rows)))
+                self.stats['evictions'] += 1
+
+    def update(self, user_id, **fields):
+        """用写接口的结果更新已缓存的用户，并通知其他进程删除该用户的缓存"""
+        with self.lock:
+            item = self.rows.get(user_id)
+            if item is not None:
+                item[1].update(fields)
+            self._bump(user_id)
+        if self.bus is not None:
+            self.bus.publish(user_id)
+
+    def invalidate(self, user_id, publish=True):
+        """删除用户的缓存"""
+        with self.lock:
+            if self._remove(user_id):
+                self.stats['invalidations'] += 1
+            self._bump(user_id)
+        if publish and self.bus is not None:
+            self.bus.publish(user_id)
+
+    def _bump(self, user_id):
+        """记录用户被修改或失效（调用方持有锁），进行中的读取不会再把旧数据放入缓存"""
+        self.generation += 1
+        self.invalidated[user_id] = self.generation
+        self.invalidated.move_to_end(user_id)
+        while len(self.invalidated) > self.max_size:
+            _, generation = self.invalidated.popitem(last=False)
+            self.pruned = generation
+
+    def _remove(self, user_id):
+        item = self.rows.pop(user_id, None)
+        if item is None:
+            return False
+        username = item[1].get('username')
+        if self.usernames.get(username) == user_id:
+            del self.usernames[username]
+        return True
+
+    def get_stats(self):
+        """缓存统计"""
+        with self.lock:
+            stats = dict(self.stats, size=len(self.rows), max_size=self.max_size, ttl=self.ttl)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0
+        if self.bus is not None:
+            stats['bus'] = self.bus.get_stats()
+        return stats
+
+class InvalidationBus:
+    """本机多进程之间的失效通知（Unix数据报套接字）"""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}.sock")
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self.sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sender.setblocking(False)
+        self.handlers = []
+        self.stats = {'sent': 0, 'received': 0, 'dropped': 0}
+        threading.Thread(target=self._listen, name='cache-bus', daemon=True).start()
+        atexit.register(self.close)
+
+    def subscribe(self, handler):
+        self.handlers.append(handler)
+
+    def publish(self, user_id):
+        """通知其他进程（发送失败的进程视为已退出，删除它的套接字文件）"""
+        message = str(user_id).encode()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if path == self.path or not name.endswith('.sock'):
+                continue
+            try:
+                self.sender.sendto(message, path)
+                self.stats['sent'] += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except (BlockingIOError, OSError):
+                # 对方接收缓冲区已满，丢弃这条通知（缓存仍会在TTL后过期）
+                self.stats['dropped'] += 1
+
+    def _listen(self):
+        while True:
+            try:
+                message = self.sock.recv(1024)
+            except OSError:
+                return
+            self.stats['received'] += 1
+            for handler in self.handlers:
+                handler(message.decode())
+
+    def close(self):
+        """关闭套接字并删除套接字文件"""
+        self.sock.close()
+        self.sender.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def get_stats(self):
+        return dict(self.stats, peers=sum(1 for name in os.listdir(self.directory) if name.endswith('.sock')) - 1)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+微批调度模块 - 把并发到达的请求合并为一次批量调用
+
+请求到达后最多等待 max_wait_ms 毫秒，或凑满 max_batch_size 条后，作为一个批次交给批量函数处理，
+结果再分发回各个等待的调用方。用于本地模型：一次批量generate的吞吐远高于逐条调用。
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Any, Dict
+
+class MicroBatchScheduler:
+    """动态微批调度器"""
+
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], max_batch_size: int = 8,
+                 max_wait_ms: float = 20, name: str = 'micro-batch'):
+        """
+        初始化调度器
+
+        Args:
+            batch_fn: 批量处理函数，输入请求列表，返回等长的结果列表
+            max_batch_size: 最大批次大小
+            max_wait_ms: 批次最长等待时间（毫秒），从批次中第一条请求到达开始计时
+            name: 工作线程名
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._metrics = {
+            'requests': 0,
+            'batches': 0,
+            'max_batch_size': 0,
+            'max_queue_depth': 0,
+            'total_wait': 0.0,
+            'total_batch_time': 0.0,
+            'batch_sizes': {},
+        }
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, item: Any) -> Future:
+        """
+        提交一条请求
+
+        Args:
+            item: 请求内容
+
+        Returns:
+            结果Future
+        """
+        future = Future()
+        self._queue.put((item, future, time.time()))
+        with self._lock:
+            self._metrics['requests'] += 1
+            self._metrics['max_queue_depth'] = max(self._metrics['max_queue_depth'], self._queue.qsize())
+        return future
+
+    def __call__(self, item: Any) -> Any:
+        """提交请求并等待结果"""
+        return self.submit(item).result()
+
+    def _collect(self) -> List:
+        """收集一个批次：阻塞等待第一条请求，然后在等待窗口内尽量凑满批次"""
+        batch = [self._queue.get()]
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        """工作线程主循环"""
+        while True:
+            batch = self._collect()
+            items = [item for item, _, _ in batch]
+            start_time = time.time()
+
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"批量函数返回 {len(results)} 条结果，期望 {len(items)} 条")
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+
+            with self._lock:
+                metrics = self._metrics
+                metrics['batches'] += 1
+                metrics['max_batch_size'] = max(metrics['max_batch_size'], len(batch))
+                metrics['total_wait'] += sum(start_time - submitted for _, _, submitted in batch)
+                metrics['total_batch_time'] += time.time() - start_time
+                metrics['batch_sizes'][len(batch)] = metrics['batch_sizes'].get(len(batch), 0) + 1
+
+    def metrics(self) -> Dict:
+        """
+        调度指标
+
+        Returns:
+            包含当前队列深度、批次数、平均批次大小、平均排队时间等的字典
+        """
+        with self._lock:
+            metrics = dict(self._metrics, batch_sizes=dict(self._metrics['batch_sizes']))
+        batches = metrics['batches']
+        processed = sum(size * count for size, count in metrics['batch_sizes'].items())
+        metrics['queue_depth'] = self._queue.qsize()
+        metrics['avg_batch_size'] = round(processed / batches, 2) if batches else 0
+        metrics['avg_wait_ms'] = round(metrics.pop('total_wait') / processed * 1000, 2) if processed else 0
+        metrics['avg_batch_ms'] = round(metrics.pop('total_batch_time') / batches * 1000, 2) if batches else 0
+        return metrics
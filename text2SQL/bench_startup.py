@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+启动耗时基准 - 基于 python -X importtime 统计入口模块的导入耗时，并测量交互模式出现第一个提示的时间
+
+用法:
+    python bench_startup.py                # 默认检查 main、run
+    python bench_startup.py --top 15       # 显示导入最慢的15个模块
+    python bench_startup.py --save output/startup_bench.json
+    python bench_startup.py --compare output/startup_bench.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import List, Dict
+
+def measure_import(module: str, repeat: int = 3) -> Dict:
+    """
+    测量导入模块的耗时
+
+    Args:
+        module: 模块名
+        repeat: 重复次数（取最小值）
+
+    Returns:
+        {'module', 'total_ms', 'modules': [(模块名, 累计耗时ms)]}
+    """
+    best = None
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(f"导入 {module} 失败:\n{completed.stderr[-2000:]}")
+
+        entries = []
+        for line in completed.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            # 格式: "import time:  自身耗时(us) | 累计耗时(us) | 模块名（缩进表示嵌套层级）"
+            self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+            entries.append((name.rstrip(), int(cumulative_us) / 1000.0, len(name) - len(name.lstrip())))
+
+        # 顶层导入（缩进最小）的累计耗时之和即总导入耗时
+        top_level = min(indent for _, _, indent in entries)
+        total = sum(ms for _, ms, indent in entries if indent == top_level)
+        if best is None or total < best['total_ms']:
+            best = {
+                'module': module,
+                'total_ms': round(total, 2),
+                'modules': sorted(((name.strip(), round(ms, 2)) for name, ms, _ in entries),
+                                  key=lambda item: item[1], reverse=True)
+            }
+    return best
+
+def measure_first_prompt(timeout: float = 30) -> float:
+    """
+    测量交互模式从启动进程到出现第一个输入提示的时间
+
+    Args:
+        timeout: 超时时间（秒）
+
+    Returns:
+        耗时（毫秒）
+    """
+    start_time = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-u', 'main.py', '--interactive'],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    try:
+        buffer = b''
+        while time.perf_counter() - start_time < timeout:
+            chunk = process.stdout.read1(1024)
+            if not chunk:
+                break
+            buffer += chunk
+            if '请输入选择'.encode('utf-8') in buffer:
+                return round((time.perf_counter() - start_time) * 1000, 2)
+        raise RuntimeError("没有等到交互模式的输入提示")
+    finally:
+        process.kill()
+        process.wait()
+
+def main(argv: List[str] = None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description='SQL Copilot 启动耗时基准')
+    parser.add_argument('--modules', nargs='+', default=['main', 'run'], help='要测量的入口模块')
+    parser.add_argument('--top', type=int, default=10, help='显示导入最慢的模块数')
+    parser.add_argument('--repeat', type=int, default=3, help='重复次数（取最小值）')
+    parser.add_argument('--save', type=str, help='把结果保存为JSON，便于对比')
+    parser.add_argument('--compare', type=str, help='与之前保存的JSON结果对比')
+    args = parser.parse_args(argv)
+
+    report = {'python': sys.version.split()[0], 'imports': [], 'first_prompt_ms': None}
+
+    for module in args.modules:
+        result = measure_import(module, args.repeat)
+        report['imports'].append(result)
+        print(f"\nimport {module}: {result['total_ms']:.2f}ms")
+        for name, ms in result['modules'][:args.top]:
+            print(f"  {ms:>9.2f}ms  {name}")
+
+    try:
+        report['first_prompt_ms'] = measure_first_prompt()
+        print(f"\n交互模式首个提示耗时: {report['first_prompt_ms']:.2f}ms")
+    except RuntimeError as e:
+        print(f"\n交互模式测量失败: {e}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        previous = {item['module']: item['total_ms'] for item in baseline.get('imports', [])}
+        print(f"\n与 {args.compare} 对比:")
+        for item in report['imports']:
+            if item['module'] in previous:
+                print(f"  import {item['module']}: {previous[item['module']]:.2f}ms -> {item['total_ms']:.2f}ms")
+        if baseline.get('first_prompt_ms') and report['first_prompt_ms']:
+            print(f"  交互模式首个提示: {baseline['first_prompt_ms']:.2f}ms -> {report['first_prompt_ms']:.2f}ms")
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or '.', exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print(f"结果已保存到: {args.save}")
+
+if __name__ == "__main__":
+    main()
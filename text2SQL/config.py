@@ -22,16 +22,31 @@ class Config:
         self.db_name = os.getenv('DB_NAME', 'gamestore')
         self.db_charset = os.getenv('DB_CHARSET', 'utf8mb4')
         
+        # 数据库方言配置：生成SQL时使用的方言，以及评测的目标数据库（逗号分隔，第一个为主目标）
+        self.db_dialect = os.getenv('DB_DIALECT', 'mysql')
+        self.eval_targets = [item.strip() for item in os.getenv('EVAL_TARGETS', '').split(',') if item.strip()]
+        self.database_urls = {
+            'postgresql': os.getenv('POSTGRES_URL', f'postgresql+psycopg2://{self.db_user}:{self.db_password}@{self.db_host}:5432/{self.db_name}'),
+            'sqlite': os.getenv('SQLITE_URL', 'sqlite:///./output/gamestore.db'),
+            'duckdb': os.getenv('DUCKDB_URL', 'duckdb:///./output/gamestore.duckdb'),
+        }
+        
         # 模型配置
         self.model_type = os.getenv('MODEL_TYPE', 'qwen')
         self.qwen_turbo_model = 'qwen-turbo'
         self.qwen_coder_model = 'qwen-coder-plus'
         self.local_model_path = '/root/autodl-tmp/models/Qwen/Qwen2___5-Coder-7B-Instruct'
+        self.local_batch_size = int(os.getenv('LOCAL_BATCH_SIZE', '8'))
+        self.local_batch_wait_ms = float(os.getenv('LOCAL_BATCH_WAIT_MS', '20'))
         
         # LLM参数配置
         self.temperature = float(os.getenv('TEMPERATURE', '0.1'))
         self.max_tokens = int(os.getenv('MAX_TOKENS', '1000'))
         
+        # 提示词预算配置：提示词token数不超过 上下文长度 - 最大生成长度
+        self.context_window = int(os.getenv('CONTEXT_WINDOW', '8192'))
+        self.prompt_token_budget = int(os.getenv('PROMPT_TOKEN_BUDGET', str(self.context_window - self.max_tokens)))
+        
         # 文件路径配置
         self.data_dir = './insurance/data'
         self.table_description_file = f'{self.data_dir}/数据表字段说明-精简1.txt'
@@ -42,10 +57,52 @@ class Config:
         # 输出配置
         self.output_dir = './output'
         self.sql_result_file = f'{self.output_dir}/sql_result.xlsx'
+        self.schema_snapshot_file = f'{self.output_dir}/schema_snapshot.bin'
+        
+        # 服务模式配置
+        self.server_host = os.getenv('SERVER_HOST', '127.0.0.1')
+        self.server_port = int(os.getenv('SERVER_PORT', '8765'))
+        self.server_workers = int(os.getenv('SERVER_WORKERS', '16'))
+        self.server_cache_size = int(os.getenv('SERVER_CACHE_SIZE', '1024'))
+        
+        # 流水线配置（生成与评测并发执行）
+        self.pipeline_queue_size = int(os.getenv('PIPELINE_QUEUE_SIZE', '8'))
+        self.generate_workers = int(os.getenv('GENERATE_WORKERS', '4'))
+        self.evaluate_workers = int(os.getenv('EVALUATE_WORKERS', '4'))
+        self.eval_chunk_size = int(os.getenv('EVAL_CHUNK_SIZE', '1000'))
+        self.sql_dedup = os.getenv('SQL_DEDUP', '1') == '1'
+        self.sql_dedup_cache_size = int(os.getenv('SQL_DEDUP_CACHE_SIZE', '2000'))
+        self.sandbox_allow_writes = os.getenv('SANDBOX_ALLOW_WRITES', '0') == '1'
+        
+        # 汇总表配置（需先运行 python summary_tables.py --refresh 构建汇总表）
+        self.summary_tables = os.getenv('SUMMARY_TABLES', '0') == '1'
+        # 距上次刷新超过这么多秒的汇总表不用于改写，也不加入提示词（0表示只要求刷新过）
+        self.summary_max_staleness = float(os.getenv('SUMMARY_MAX_STALENESS', '300'))
+        # 增量刷新只收录写入超过这么多秒的记录（与 summary_tables.py --settle-seconds 保持一致）
+        self.summary_settle_seconds = float(os.getenv('SUMMARY_SETTLE_SECONDS', '300'))
+        
+        # SQL自动修复配置（0表示不修复）
+        self.repair_retries = int(os.getenv('REPAIR_RETRIES', '0'))
+        self.repair_budget = float(os.getenv('REPAIR_BUDGET', '30'))
+        
+        # few-shot示例库配置（0表示不注入示例）
+        self.example_store_file = f'{self.output_dir}/example_store.json'
+        self.example_store_max_size = int(os.getenv('EXAMPLE_STORE_MAX_SIZE', '5000'))
+        self.few_shot_k = int(os.getenv('FEW_SHOT_K', '3'))
+        
+    def get_database_url(self, dialect: str = None) -> str:
+        """
+        获取数据库连接URL
         
-    def get_database_url(self) -> str:
-        """获取数据库连接URL"""
-        return f'mysql+mysqlconnector://{self.db_user}:{self.db_password}@{self.db_host}:{self.db_port}/{self.db_name}?charset={self.db_charset}'
+        Args:
+            dialect: 数据库方言（mysql/postgresql/sqlite/duckdb），默认使用生成SQL时的方言
+        """
+        dialect = (dialect or self.db_dialect).lower()
+        if dialect == 'mysql':
+            return f'mysql+mysqlconnector://{self.db_user}:{self.db_password}@{self.db_host}:{self.db_port}/{self.db_name}?charset={self.db_charset}'
+        if dialect not in self.database_urls:
+            raise ValueError(f"没有 {dialect} 数据库的连接配置")
+        return self.database_urls[dialect]
     
     def ensure_output_dir(self):
         """确保输出目录存在"""
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+数据库方言模块 - MySQL、PostgreSQL、SQLite、DuckDB 的连接、连接池参数、提示词说明和SQL转换
+
+生成SQL时在提示词中说明目标数据库的语法；评测的数据库与生成时的方言不同时，
+用sqlglot把SQL转换为目标数据库的语法（未安装sqlglot时原样执行）。
+"""
+
+from typing import Dict, List
+
+class Dialect:
+    """数据库方言"""
+
+    def __init__(self, name: str, title: str, sqlglot_name: str, prompt_hint: str,
+                 server: bool = True, connect_args: Dict = None):
+        """
+        初始化方言
+
+        Args:
+            name: 方言名（与SQLAlchemy的dialect.name一致）
+            title: 显示名称
+            sqlglot_name: sqlglot中的方言名
+            prompt_hint: 提示词中的语法说明
+            server: 是否为需要网络连接的数据库服务（决定连接池参数）
+            connect_args: 传给数据库驱动的连接参数
+        """
+        self.name = name
+        self.title = title
+        self.sqlglot_name = sqlglot_name
+        self.prompt_hint = prompt_hint
+        self.server = server
+        self.connect_args = connect_args or {}
+
+    def engine_options(self, workers: int) -> Dict:
+        """
+        按并发评测数调整的create_engine参数
+
+        Args:
+            workers: 并发评测数
+
+        Returns:
+            create_engine的关键字参数
+        """
+        workers = max(1, workers)
+        options = {'pool_size': workers}
+        if self.server:
+            # 网络数据库：预检测断开的连接，定期回收，允许短时间超出连接池大小；
+            # 嵌入式数据库连接开销很小，不需要预检测和回收（内存SQLite使用按线程的连接池）
+            options.update(max_overflow=workers, pool_pre_ping=True, pool_recycle=1800, pool_timeout=30)
+        if self.connect_args:
+            options['connect_args'] = dict(self.connect_args)
+        return options
+
+    def __repr__(self) -> str:
+        return f"Dialect({self.name!r})"
+
+DIALECTS = {
+    'mysql': Dialect(
+        'mysql', 'MySQL', 'mysql',
+        '目标数据库为MySQL：标识符用反引号，日期函数用DATE_FORMAT、DATE_SUB、CURDATE，分页用LIMIT。'),
+    'postgresql': Dialect(
+        'postgresql', 'PostgreSQL', 'postgres',
+        '目标数据库为PostgreSQL：大小写敏感的标识符用双引号，日期函数用TO_CHAR、CURRENT_DATE - INTERVAL，'
+        '字符串拼接用||，分页用LIMIT/OFFSET。'),
+    'sqlite': Dialect(
+        'sqlite', 'SQLite', 'sqlite',
+        '目标数据库为SQLite：日期函数用DATE、STRFTIME，没有DATE_FORMAT，字符串拼接用||，分页用LIMIT。',
+        server=False, connect_args={'check_same_thread': False}),
+    'duckdb': Dialect(
+        'duckdb', 'DuckDB', 'duckdb',
+        '目标数据库为DuckDB：日期函数用STRFTIME、DATE_TRUNC、CURRENT_DATE - INTERVAL，字符串拼接用||，分页用LIMIT。',
+        server=False),
+}
+
+_ALIASES = {'postgres': 'postgresql', 'pg': 'postgresql', 'sqlite3': 'sqlite'}
+
+def get_dialect(name: str) -> Dialect:
+    """
+    按名称获取方言
+
+    Args:
+        name: 方言名（mysql/postgresql/sqlite/duckdb）
+
+    Returns:
+        方言
+    """
+    key = (name or 'mysql').lower()
+    key = _ALIASES.get(key, key)
+    if key not in DIALECTS:
+        raise ValueError(f"不支持的数据库方言: {name}，可选: {', '.join(DIALECTS)}")
+    return DIALECTS[key]
+
+def dialect_of_url(database_url: str) -> Dialect:
+    """
+    根据数据库连接URL判断方言
+
+    Args:
+        database_url: 如 mysql+mysqlconnector://...、sqlite:///...
+
+    Returns:
+        方言
+    """
+    scheme = database_url.split(':', 1)[0]
+    return get_dialect(scheme.split('+', 1)[0])
+
+def parse_dialects(text: str) -> List[str]:
+    """
+    解析逗号分隔的方言列表
+
+    Args:
+        text: 如 "sqlite,mysql"
+
+    Returns:
+        规范化后的方言名列表（去重，保持顺序）
+    """
+    names = []
+    for item in (text or '').split(','):
+        if item.strip():
+            name = get_dialect(item.strip()).name
+            if name not in names:
+                names.append(name)
+    return names
+
+def transpile_sql(sql: str, source: str, target: str) -> str:
+    """
+    把SQL从一种方言转换为另一种方言
+
+    Args:
+        sql: SQL语句
+        source: 生成SQL时的方言
+        target: 执行SQL的数据库方言
+
+    Returns:
+        转换后的SQL；方言相同、未安装sqlglot或转换失败时返回原SQL
+    """
+    source, target = get_dialect(source), get_dialect(target)
+    if source.name == target.name:
+        return sql
+
+    from sql_normalizer import _load_sqlglot
+
+    sqlglot = _load_sqlglot()
+    if not sqlglot:
+        return sql
+    try:
+        return sqlglot.transpile(sql, read=source.sqlglot_name, write=target.sqlglot_name)[0]
+    except Exception:
+        return sql
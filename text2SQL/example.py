@@ -7,6 +7,7 @@ from sql_generator import SQLGeneratorFactory, batch_generate_sql
 from sql_evaluator import SQLEvaluator, evaluate_sql_results
 from utils import read_file_content, split_queries
 from config import config
+from schema_model import load_schema
 
 def example_single_query():
     """单个查询示例"""
@@ -17,8 +18,8 @@ def example_single_query():
     # 创建生成器
     generator = SQLGeneratorFactory.create_generator("qwen_turbo")
     
-    # 读取数据表描述
-    table_description = read_file_content(config.table_description_file)
+    # 加载数据表结构模型
+    table_description = load_schema()
     
     # 单个查询
     query = "查询所有客户的姓名和联系电话"
@@ -45,8 +46,8 @@ def example_batch_queries():
     sample_queries = queries[:3]
     print(f"处理 {len(sample_queries)} 个查询问题")
     
-    # 读取数据表描述
-    table_description = read_file_content(config.table_description_file)
+    # 加载数据表结构模型
+    table_description = load_schema()
     
     # 批量生成SQL
     results = batch_generate_sql(
@@ -92,7 +93,7 @@ def example_different_models():
     print("=" * 50)
     
     query = "查询每种保险类型的保险金额的平均值、最大值和最小值"
-    table_description = read_file_content(config.table_description_file)
+    table_description = load_schema()
     
     models = ["qwen_turbo", "qwen_coder"]
     
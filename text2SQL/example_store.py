@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+示例库模块 - 保存已验证的"问题→SQL"对，并按相似度检索few-shot示例
+
+评测中"能否运行"为Yes的结果会被收集到本地示例库，使用可增量更新的BM25索引检索，
+生成SQL时把最相似的几条示例注入提示词，提高首次生成的成功率。
+"""
+
+import json
+import math
+import os
+import threading
+from collections import OrderedDict, Counter
+from typing import List, Dict, Tuple, Iterable
+
+from config import config
+from utils import clean_query, tokenize, WORD_PATTERN
+
+def normalize_question(question: str) -> str:
+    """用于去重的问题规范化：去掉空白和标点，统一小写"""
+    return ''.join(WORD_PATTERN.findall(clean_query(question).lower()))
+
+class ExampleStore:
+    """已验证示例库（增量BM25索引）"""
+
+    def __init__(self, file_path: str = None, max_size: int = None, k1: float = 1.5, b: float = 0.75):
+        """
+        初始化示例库
+
+        Args:
+            file_path: 持久化文件路径（JSON），为None时只保存在内存
+            max_size: 最大示例数，超出时淘汰最早加入的示例
+            k1: BM25参数k1
+            b: BM25参数b
+        """
+        self.file_path = file_path
+        self.max_size = max_size or config.example_store_max_size
+        self.k1 = k1
+        self.b = b
+
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._keys: Dict[str, int] = {}
+        self._docs: "OrderedDict[int, Tuple[str, str, Counter]]" = OrderedDict()
+        self._doc_lengths: Dict[int, int] = {}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._total_length = 0
+        self.dirty = False
+
+        if file_path and os.path.exists(file_path):
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, question: str, sql: str) -> bool:
+        """
+        加入一条已验证示例；问题重复时用新的SQL覆盖旧示例
+
+        Args:
+            question: 自然语言问题
+            sql: 已验证可运行的SQL
+
+        Returns:
+            是否加入成功
+        """
+        question = clean_query(str(question or ''))
+        sql = str(sql or '').strip()
+        key = normalize_question(question)
+        if not key or not sql:
+            return False
+
+        with self._lock:
+            old_id = self._keys.get(key)
+            if old_id is not None:
+                if self._docs[old_id][1] == sql:
+                    self._docs.move_to_end(old_id)
+                    return False
+                self._remove(old_id)
+
+            doc_id = self._next_id
+            self._next_id += 1
+            terms = Counter(tokenize(question))
+            self._keys[key] = doc_id
+            self._docs[doc_id] = (question, sql, terms)
+            self._doc_lengths[doc_id] = sum(terms.values())
+            self._total_length += self._doc_lengths[doc_id]
+            for term, tf in terms.items():
+                self._postings.setdefault(term, {})[doc_id] = tf
+
+            while len(self._docs) > self.max_size:
+                self._remove(next(iter(self._docs)))
+
+            self.dirty = True
+            return True
+
+    def add_results(self, results: Iterable[Dict]) -> int:
+        """
+        从评测结果中收集"能否运行"为Yes的示例
+
+        Args:
+            results: 结果字典列表（包含QA、SQL、能否运行）
+
+        Returns:
+            新加入的示例数
+        """
+        added = 0
+        for result in results:
+            if result and result.get('能否运行') == 'Yes':
+                added += int(self.add(result.get('QA'), result.get('SQL')))
+        return added
+
+    def _remove(self, doc_id: int) -> None:
+        """从索引中删除一条示例（调用方持有锁）"""
+        question, _, terms = self._docs.pop(doc_id)
+        self._keys.pop(normalize_question(question), None)
+        self._total_length -= self._doc_lengths.pop(doc_id)
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+
+    def search(self, query: str, k: int = None) -> List[Tuple[str, str, float]]:
+        """
+        检索与问题最相似的示例
+
+        Args:
+            query: 自然语言问题
+            k: 返回数量
+
+        Returns:
+            [(问题, SQL, 得分)]，按得分降序
+        """
+        k = config.few_shot_k if k is None else k
+        if k <= 0:
+            return []
+
+        with self._lock:
+            doc_count = len(self._docs)
+            if not doc_count:
+                return []
+
+            avg_length = self._total_length / doc_count
+            scores: Dict[int, float] = {}
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [(self._docs[doc_id][0], self._docs[doc_id][1], score) for doc_id, score in best]
+
+    def format_examples(self, query: str, k: int = None) -> str:
+        """
+        把检索到的示例格式化为提示词片段
+
+        Args:
+            query: 自然语言问题
+            k: 示例数量
+
+        Returns:
+            提示词片段，没有示例时返回空字符串
+        """
+        examples = self.search(query, k)
+        if not examples:
+            return ""
+
+        parts = ["以下是已验证可以正确运行的类似问题和SQL，可供参考："]
+        for question, sql, _ in examples:
+            parts.append(f"问题：{question}\n```sql\n{sql}\n```")
+        return '\n'.join(parts) + '\n'
+
+    def load(self) -> None:
+        """从文件加载示例"""
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as file:
+                for item in json.load(file):
+                    self.add(item['QA'], item['SQL'])
+            self.dirty = False
+            print(f"已加载 {len(self)} 条已验证示例: {self.file_path}")
+        except Exception as e:
+            print(f"加载示例库出错: {e}")
+
+    def save(self) -> None:
+        """保存示例到文件（先写临时文件再替换，避免中途失败损坏示例库）"""
+        if not self.file_path or not self.dirty:
+            return
+
+        with self._lock:
+            items = [{'QA': question, 'SQL': sql} for question, sql, _ in self._docs.values()]
+            self.dirty = False
+
+        try:
+            os.makedirs(os.path.dirname(self.file_path) or '.', exist_ok=True)
+            tmp_path = f"{self.file_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(items, file, ensure_ascii=False, indent=0)
+            os.replace(tmp_path, self.file_path)
+            print(f"示例库已保存: {self.file_path} ({len(items)} 条)")
+        except Exception as e:
+            print(f"保存示例库出错: {e}")
@@ -9,25 +9,80 @@ import sys
 from typing import List
 
 from config import config
-from utils import read_file_content, split_queries, save_results_to_excel, ensure_directory
-from sql_generator import batch_generate_sql, SQLGeneratorFactory
-from sql_evaluator import evaluate_sql_results
+from utils import save_results_to_excel, ensure_directory
+from sql_generator import batch_generate_sql, stream_generate_sql, SQLGeneratorFactory
+from stream_io import iter_queries
+from sql_evaluator import evaluate_sql_results, evaluate_sql_stream
+from schema_model import load_schema
+from dialects import DIALECTS, parse_dialects
 
-def main():
-    """主函数"""
+# 注意：dashscope、pandas、SQLAlchemy、asyncio等较重的模块都在首次使用时才导入，
+# 启动耗时可用 python bench_startup.py 检查
+
+def main(argv: List[str] = None):
+    """
+    主函数
+    
+    Args:
+        argv: 命令行参数（默认使用sys.argv）
+    """
     parser = argparse.ArgumentParser(description='SQL Copilot - 自助式数据报表开发工具')
-    parser.add_argument('--mode', choices=['generate', 'evaluate', 'full'], default='full',
-                       help='运行模式: generate(仅生成SQL), evaluate(仅评测), full(完整流程)')
+    parser.add_argument('--mode', choices=['generate', 'evaluate', 'full', 'serve'], default='full',
+                       help='运行模式: generate(仅生成SQL), evaluate(仅评测), full(完整流程), serve(HTTP服务)')
     parser.add_argument('--model', choices=['qwen_turbo', 'qwen_coder', 'local_qwen'], 
                        default='qwen_turbo', help='使用的模型类型')
     parser.add_argument('--input', type=str, help='输入文件路径')
     parser.add_argument('--output', type=str, help='输出文件路径')
     parser.add_argument('--qa-file', type=str, default=config.qa_list_2_file, 
-                       help='查询问题文件路径')
+                       help='查询问题文件路径（=====分隔的文本，或含QA/question字段的.jsonl/.csv）')
+    parser.add_argument('--dedup-queries', action='store_true',
+                       help='读取查询问题时跳过重复的问题')
     parser.add_argument('--table-desc', type=str, default=config.table_description_file,
                        help='数据表描述文件路径')
+    parser.add_argument('--pipeline', action='store_true',
+                       help='full模式下以流水线方式并发生成和评测（不经过Excel中转）')
+    parser.add_argument('--queue-size', type=int, default=config.pipeline_queue_size,
+                       help='流水线队列容量')
+    parser.add_argument('--generate-workers', type=int, default=config.generate_workers,
+                       help='流水线并发生成数')
+    parser.add_argument('--evaluate-workers', type=int, default=config.evaluate_workers,
+                       help='流水线并发评测数')
+    parser.add_argument('--repair-retries', type=int, default=config.repair_retries,
+                       help='流水线中SQL执行出错时的最大修复次数（0表示不修复）')
+    parser.add_argument('--repair-budget', type=float, default=config.repair_budget,
+                       help='每个问题的修复时间预算（秒）')
+    parser.add_argument('--few-shot-k', type=int, default=config.few_shot_k,
+                       help='从已验证示例库注入的示例数（0表示不注入）')
+    parser.add_argument('--example-store', type=str, default=config.example_store_file,
+                       help='已验证示例库文件路径')
+    parser.add_argument('--token-budget', type=int, default=config.prompt_token_budget,
+                       help='提示词token预算，表结构超出时逐级压缩（0表示不限制）')
+    parser.add_argument('--dialect', choices=list(DIALECTS), default=config.db_dialect,
+                       help='生成SQL使用的数据库方言（提示词中说明对应语法）')
+    parser.add_argument('--targets', type=str, default=','.join(config.eval_targets),
+                       help='评测的目标数据库，逗号分隔，第一个为主目标，如 sqlite,mysql（默认与--dialect相同）')
+    parser.add_argument('--stream', action='store_true',
+                       help='generate模式下逐条读取问题并分块写出结果，evaluate模式下分块流式评测大文件（输出.csv或.jsonl）')
+    parser.add_argument('--chunk-size', type=int, default=config.eval_chunk_size,
+                       help='流式生成/评测每块行数')
+    parser.add_argument('--resume', action='store_true',
+                       help='流式评测从输出文件已有的行数处继续')
+    parser.add_argument('--shards', type=int, default=1,
+                       help='generate/full模式下把问题按序号取模分为N个分片，多进程并行运行后按原顺序合并')
+    parser.add_argument('--shard-index', type=int,
+                       help='只运行指定序号（0开始）的分片，不合并（用于多台机器分别运行）')
+    parser.add_argument('--processes', type=int,
+                       help='分片运行的并行进程数（默认为CPU核数和分片数中较小者）')
+    parser.add_argument('--merge-shards', action='store_true',
+                       help='只按原顺序合并已有的分片结果文件')
+    parser.add_argument('--host', type=str, default=config.server_host,
+                       help='serve模式的监听地址')
+    parser.add_argument('--port', type=int, default=config.server_port,
+                       help='serve模式的监听端口')
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    config.db_dialect = args.dialect
+    config.eval_targets = parse_dialects(args.targets)
     
     # 确保输出目录存在
     config.ensure_output_dir()
@@ -36,6 +91,21 @@ def main():
     print("SQL Copilot - 自助式数据报表开发工具")
     print("=" * 60)
     
+    if args.mode == 'serve':
+        import asyncio
+        from server import serve
+        asyncio.run(serve(args.host, args.port))
+        return
+    
+    if args.shards > 1 and args.mode in ['generate', 'full']:
+        sharded_sql(args)
+        return
+    
+    if args.mode == 'full' and args.pipeline:
+        print(f"\n开始流水线生成与评测，使用模型: {args.model}")
+        pipeline_sql(args)
+        return
+    
     if args.mode in ['generate', 'full']:
         print(f"\n开始生成SQL查询，使用模型: {args.model}")
         generate_sql(args)
@@ -44,22 +114,48 @@ def main():
         print(f"\n开始评测SQL查询结果")
         evaluate_sql(args)
 
+def load_example_store(args):
+    """加载已验证示例库（--few-shot-k 为0时不使用）"""
+    if args.few_shot_k <= 0:
+        return None
+    
+    from example_store import ExampleStore
+    config.few_shot_k = args.few_shot_k
+    return ExampleStore(args.example_store)
+
 def generate_sql(args):
     """生成SQL查询"""
     try:
-        # 读取数据表描述
-        table_description = read_file_content(args.table_desc)
+        # 加载数据表结构模型
+        table_description = load_schema(args.table_desc)
         if not table_description:
             print(f"无法读取数据表描述文件: {args.table_desc}")
             return
         
-        # 读取查询问题
-        qa_content = read_file_content(args.qa_file)
-        if not qa_content:
+        if not os.path.exists(args.qa_file):
             print(f"无法读取查询问题文件: {args.qa_file}")
             return
         
-        queries = split_queries(qa_content)
+        if args.stream:
+            # 逐条读取问题、按块写出结果，不把问题和结果整体放入内存
+            output_file = args.output or f"{config.output_dir}/sql_result_{args.model}.jsonl"
+            stats = stream_generate_sql(
+                queries=iter_queries(args.qa_file, dedup=args.dedup_queries),
+                output_file=output_file,
+                generator_type=args.model,
+                table_description=table_description,
+                chunk_size=args.chunk_size,
+                example_store=load_example_store(args),
+                token_budget=args.token_budget
+            )
+            average = stats['time'] / stats['total'] if stats['total'] else 0
+            print(f"\nSQL生成完成！共 {stats['total']} 个查询，结果已保存到: {output_file}")
+            print(f"总耗时: {stats['time']:.2f}秒")
+            print(f"平均耗时: {average:.2f}秒/查询")
+            return
+        
+        # 读取查询问题
+        queries = list(iter_queries(args.qa_file, dedup=args.dedup_queries))
         print(f"读取到 {len(queries)} 个查询问题")
         
         # 设置输出文件
@@ -70,7 +166,9 @@ def generate_sql(args):
             queries=queries,
             generator_type=args.model,
             table_description=table_description,
-            output_file=output_file
+            output_file=output_file,
+            example_store=load_example_store(args),
+            token_budget=args.token_budget
         )
         
         print(f"\nSQL生成完成！结果已保存到: {output_file}")
@@ -87,17 +185,97 @@ def generate_sql(args):
         import traceback
         traceback.print_exc()
 
+def pipeline_sql(args):
+    """流水线方式生成并评测SQL"""
+    try:
+        from pipeline import run_pipeline
+        
+        table_description = load_schema(args.table_desc)
+        if not table_description:
+            print(f"无法读取数据表描述文件: {args.table_desc}")
+            return
+        
+        if not os.path.exists(args.qa_file):
+            print(f"无法读取查询问题文件: {args.qa_file}")
+            return
+        
+        queries = list(iter_queries(args.qa_file, dedup=args.dedup_queries))
+        print(f"读取到 {len(queries)} 个查询问题")
+        
+        output_file = args.output or f"{config.output_dir}/sql_result_{args.model}.xlsx"
+        
+        results = run_pipeline(
+            queries=queries,
+            generator_type=args.model,
+            table_description=table_description,
+            output_file=output_file,
+            example_store=load_example_store(args),
+            token_budget=args.token_budget,
+            queue_size=args.queue_size,
+            generate_workers=args.generate_workers,
+            evaluate_workers=args.evaluate_workers,
+            repair_retries=args.repair_retries,
+            repair_budget=args.repair_budget
+        )
+        
+        if results:
+            print(f"\n流水线完成！结果已保存到: {output_file}")
+        
+    except Exception as e:
+        print(f"流水线运行出错: {e}")
+        import traceback
+        traceback.print_exc()
+
+def sharded_sql(args):
+    """分片方式生成（并评测）SQL"""
+    try:
+        from sharding import run_sharded, run_shard, merge_shards, shard_outputs
+        
+        if not os.path.exists(args.qa_file):
+            print(f"无法读取查询问题文件: {args.qa_file}")
+            return
+        
+        if args.merge_shards:
+            outputs = shard_outputs(args)
+            merged_file = outputs['evaluate'] or outputs['generate']
+            total = merge_shards(merged_file, args.shards, args.chunk_size)
+            print(f"已合并 {total} 条结果到: {merged_file}")
+        elif args.shard_index is not None:
+            run_shard(args, args.shard_index)
+        else:
+            run_sharded(args)
+        
+    except Exception as e:
+        print(f"分片运行出错: {e}")
+        import traceback
+        traceback.print_exc()
+
 def evaluate_sql(args):
     """评测SQL查询"""
     try:
         # 确定输入文件
-        input_file = args.input or f"{config.output_dir}/sql_result_{args.model}.xlsx"
+        # 流式模式下generate输出的是.jsonl
+        ext = 'jsonl' if args.stream else 'xlsx'
+        input_file = args.input or f"{config.output_dir}/sql_result_{args.model}.{ext}"
         
         if not os.path.exists(input_file):
             print(f"输入文件不存在: {input_file}")
             print("请先运行生成模式或指定正确的输入文件")
             return
         
+        if args.stream:
+            # 分块流式评测，不把整个文件读入内存
+            output_file = args.output or os.path.splitext(input_file)[0] + '_eval.jsonl'
+            stats = evaluate_sql_stream(
+                input_file=input_file,
+                output_file=output_file,
+                chunk_size=args.chunk_size,
+                resume=args.resume
+            )
+            if stats:
+                print(f"\n评测完成！结果已保存到: {output_file}")
+            return
+        
         # 设置输出文件
         output_file = args.output or input_file
         
@@ -107,8 +285,15 @@ def evaluate_sql(args):
             output_file=output_file
         )
         
-        if not result_df.empty:
+        if result_df is not None and not result_df.empty:
             print(f"\n评测完成！结果已保存到: {output_file}")
+            
+            # 收集运行成功的结果到示例库
+            example_store = load_example_store(args)
+            if example_store is not None:
+                added = example_store.add_results(result_df.to_dict('records'))
+                print(f"新增已验证示例: {added} 条")
+                example_store.save()
         
     except Exception as e:
         print(f"评测SQL时出错: {e}")
@@ -138,8 +323,8 @@ def interactive_mode():
         print(f"创建生成器失败: {e}")
         return
     
-    # 读取数据表描述
-    table_description = read_file_content(config.table_description_file)
+    # 加载数据表结构模型
+    table_description = load_schema(config.table_description_file)
     if not table_description:
         print("无法读取数据表描述文件")
         return
@@ -186,7 +371,14 @@ SQL Copilot 使用帮助:
 1. 命令行模式:
    python main.py --mode generate --model qwen_turbo
    python main.py --mode evaluate --input result.xlsx
+   python main.py --mode evaluate --input result.csv --stream --chunk-size 1000 --resume
+   python main.py --mode full --qa-file questions.jsonl --stream --dedup-queries
+   python main.py --mode full --qa-file questions.jsonl --shards 4
    python main.py --mode full --model qwen_coder
+   python main.py --mode full --pipeline --generate-workers 4 --evaluate-workers 4
+   python main.py --mode full --pipeline --repair-retries 2 --repair-budget 30
+   python main.py --mode full --pipeline --dialect mysql --targets sqlite,mysql
+   python main.py --mode serve --host 127.0.0.1 --port 8765
 
 2. 交互式模式:
    python main.py --interactive
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+流水线模块 - 生成SQL与评测SQL并发执行
+
+生成出的每条SQL直接放入有界队列，由评测协程并发消费；队列满时生成端等待（背压），
+整个过程不再经过Excel文件中转。问题可以是迭代器（按需读取）；传入sink时，
+每个问题（包括修复）完成后按输入顺序交给sink增量写出，结果不保留在内存中。
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Dict, Optional
+
+from config import config
+from utils import print_progress, save_results_to_excel
+from sql_generator import SQLGenerator, SQLGeneratorFactory
+from sql_evaluator import SQLEvaluator, create_evaluator
+
+class PipelineStats:
+    """流水线统计信息"""
+
+    def __init__(self, total: Optional[int]):
+        self.total = total
+        self.generated = 0
+        self.evaluated = 0
+        self.success = 0
+        self.generate_time = 0.0
+        self.evaluate_time = 0.0
+        self.wall_time = 0.0
+        self.max_queue_depth = 0
+        self.first_try_success = 0
+        self.repair_calls = 0
+        self.repair_time = 0.0
+        self.repaired = 0
+
+    def report(self) -> None:
+        """打印统计报告"""
+        serial_time = self.generate_time + self.evaluate_time
+        success_rate = (self.success / self.evaluated) * 100 if self.evaluated else 0
+
+        print(f"\n流水线完成!")
+        print(f"总查询数: {self.total}")
+        print(f"成功执行: {self.success}")
+        print(f"成功率: {success_rate:.1f}%")
+        print(f"生成累计耗时: {self.generate_time:.2f}秒")
+        print(f"评测累计耗时: {self.evaluate_time:.2f}秒")
+        print(f"实际总耗时: {self.wall_time:.2f}秒")
+        if self.wall_time > 0:
+            print(f"相对串行加速比: {serial_time / self.wall_time:.2f}x")
+        print(f"队列最大深度: {self.max_queue_depth}")
+
+        if self.repair_calls:
+            gain = (self.success - self.first_try_success) / self.total * 100 if self.total else 0
+            print(f"\n自动修复统计:")
+            print(f"首次成功: {self.first_try_success}")
+            print(f"修复成功: {self.repaired}")
+            print(f"额外调用次数: {self.repair_calls}")
+            print(f"额外耗时: {self.repair_time:.2f}秒")
+            print(f"准确率提升: {gain:.1f}个百分点")
+            if gain > 0:
+                print(f"每提升1个百分点: {self.repair_calls / gain:.2f}次调用, {self.repair_time / gain:.2f}秒")
+
+class SQLPipeline:
+    """生成-评测流水线"""
+
+    def __init__(self, generator: SQLGenerator, evaluator: SQLEvaluator,
+                 queue_size: int = None, generate_workers: int = None,
+                 evaluate_workers: int = None, repair_retries: int = None,
+                 repair_budget: float = None):
+        """
+        初始化流水线
+
+        Args:
+            generator: SQL生成器
+            evaluator: SQL评测器
+            queue_size: 生成结果队列容量（背压阈值）
+            generate_workers: 并发生成数
+            evaluate_workers: 并发评测数
+            repair_retries: 执行出错时的最大修复次数（0表示不修复）
+            repair_budget: 每个问题的修复时间预算（秒，从开始生成计时）
+        """
+        self.generator = generator
+        self.evaluator = evaluator
+        self.queue_size = queue_size or config.pipeline_queue_size
+        self.generate_workers = max(1, generate_workers or config.generate_workers)
+        self.evaluate_workers = max(1, evaluate_workers or config.evaluate_workers)
+        self.repair_retries = config.repair_retries if repair_retries is None else repair_retries
+        self.repair_budget = repair_budget or config.repair_budget
+
+    def run(self, queries: Iterable[str], table_description: str = None,
+            sink: Callable[[List[Dict]], None] = None) -> List[Dict]:
+        """
+        运行流水线
+
+        Args:
+            queries: 查询列表或迭代器
+            table_description: 数据表描述
+            sink: 按输入顺序接收已完成结果的函数（如RecordWriter.write），为None时结果全部保留并返回
+
+        Returns:
+            结果列表（与输入顺序一致）；传入sink时为空列表，统计见self.stats
+        """
+        self.evaluator.begin_run()
+        results, stats = asyncio.run(self._run(queries, table_description, sink))
+        self.stats = stats
+        stats.report()
+        self.evaluator.report_run()
+        self.generator.report_prompt_stats()
+        scheduler = getattr(self.generator, 'scheduler', None)
+        if scheduler is not None:
+            print(f"微批调度: {scheduler.metrics()}")
+        return results
+
+    def _remember(self, result: Dict) -> None:
+        """把运行成功的问题和SQL加入生成器的示例库"""
+        example_store = getattr(self.generator, 'example_store', None)
+        if example_store is not None:
+            example_store.add(result['QA'], result['SQL'])
+
+    async def _run(self, queries: Iterable[str], table_description: str = None,
+                   sink: Callable[[List[Dict]], None] = None):
+        """流水线主协程"""
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=self.generate_workers + self.evaluate_workers)
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        # 进行中的结果按序号保存，完成后按输入顺序交给sink或加入ordered
+        results: Dict[int, Dict] = {}
+        finished = set()
+        ordered: List[Dict] = []
+        next_index = 0
+        stats = PipelineStats(len(queries) if hasattr(queries, '__len__') else None)
+        pending = iter(enumerate(queries))
+        started_at: Dict[int, float] = {}
+        repairs = []
+        start_time = time.time()
+
+        def finish(index: int):
+            # 问题（包括修复）完成，写出从next_index开始已连续完成的结果
+            nonlocal next_index
+            finished.add(index)
+            done = []
+            while next_index in finished:
+                finished.remove(next_index)
+                done.append(results.pop(next_index))
+                started_at.pop(next_index, None)
+                next_index += 1
+            if sink is not None:
+                sink(done)
+            else:
+                ordered.extend(done)
+
+        async def produce():
+            # 多个生成协程共享同一个迭代器，按顺序领取问题
+            for index, query in pending:
+                started_at[index] = time.time()
+                sql, use_time, prompt_tokens = await loop.run_in_executor(
+                    executor, self.generator.generate_sql_with_stats, query, table_description)
+                results[index] = {
+                    'QA': query,
+                    'SQL': sql,
+                    'time': round(use_time, 2),
+                    'prompt_tokens': prompt_tokens
+                }
+                stats.generated += 1
+                stats.generate_time += use_time
+
+                # 队列满时在此等待，评测跟不上时生成端自动放慢
+                await queue.put(index)
+                stats.max_queue_depth = max(stats.max_queue_depth, queue.qsize())
+
+        async def consume():
+            while True:
+                index = await queue.get()
+                if index is None:
+                    queue.task_done()
+                    return
+
+                result = results[index]
+                eval_start = time.time()
+                success, columns = await loop.run_in_executor(
+                    executor, self.evaluator.evaluate_columns, result['SQL'])
+                stats.evaluate_time += time.time() - eval_start
+
+                result.update(columns)
+                result_content = columns['执行结果']
+                stats.evaluated += 1
+                stats.success += int(success)
+                stats.first_try_success += int(success)
+                if success:
+                    self._remember(result)
+
+                # 修复在独立任务中进行，不阻塞评测队列
+                if not success and self.repair_retries > 0 and result_content.startswith('SQL执行错误'):
+                    repairs.append(asyncio.create_task(repair(index, result_content)))
+                else:
+                    finish(index)
+
+                print_progress(stats.evaluated, stats.total,
+                               f"{'成功' if success else '失败'} {result['QA'][:50]}")
+                queue.task_done()
+
+        async def repair(index: int, error: str):
+            try:
+                await repair_result(index, error)
+            finally:
+                finish(index)
+
+        async def repair_result(index: int, error: str):
+            result = results[index]
+            result['修复次数'] = 0
+
+            for _ in range(self.repair_retries):
+                if time.time() - started_at[index] > self.repair_budget:
+                    break
+
+                repair_start = time.time()
+                sql, _ = await loop.run_in_executor(
+                    executor, self.generator.repair_sql,
+                    result['QA'], result['SQL'], error, table_description)
+                success, columns = await loop.run_in_executor(
+                    executor, self.evaluator.evaluate_columns, sql)
+                stats.repair_calls += 1
+                stats.repair_time += time.time() - repair_start
+
+                result['修复次数'] += 1
+                if not sql:
+                    continue
+
+                result['SQL'] = sql
+                result.update(columns)
+                if success:
+                    stats.success += 1
+                    stats.repaired += 1
+                    self._remember(result)
+                    break
+                error = columns['执行结果']
+
+        try:
+            consumers = [asyncio.create_task(consume()) for _ in range(self.evaluate_workers)]
+            await asyncio.gather(*(produce() for _ in range(self.generate_workers)))
+
+            for _ in consumers:
+                await queue.put(None)
+            await asyncio.gather(*consumers)
+            await asyncio.gather(*repairs)
+        finally:
+            executor.shutdown(wait=False)
+
+        stats.wall_time = time.time() - start_time
+        stats.total = next_index
+        return ordered, stats
+
+def run_pipeline(queries: Iterable[str], generator_type: str = "qwen_turbo",
+                 table_description: str = None, output_file: str = None,
+                 database_url: str = None, example_store=None, sink: Callable[[List[Dict]], None] = None,
+                 **kwargs) -> List[Dict]:
+    """
+    以流水线方式生成并评测SQL的便捷函数
+
+    Args:
+        queries: 查询列表或迭代器
+        generator_type: 生成器类型
+        table_description: 数据表描述
+        output_file: 输出文件路径
+        database_url: 数据库连接URL
+        example_store: 已验证示例库（注入few-shot示例，并收集本次成功的结果）
+        sink: 按输入顺序接收已完成结果的函数（传入时结果不保留，返回空列表）
+        **kwargs: 传给SQLPipeline的参数（queue_size, generate_workers, evaluate_workers,
+                  repair_retries, repair_budget）以及token_budget（提示词token预算）
+
+    Returns:
+        结果列表
+    """
+    evaluator = create_evaluator(database_url)
+    if not evaluator.test_connection():
+        print("数据库连接失败，无法运行流水线")
+        return []
+
+    generator = SQLGeneratorFactory.create_generator(generator_type, example_store=example_store,
+                                                     token_budget=kwargs.pop('token_budget', None))
+    if generator_type == "local_qwen":
+        # 本地模型不支持多线程并发推理，并发请求经微批调度合并为批量generate
+        generator.enable_batching()
+        kwargs['generate_workers'] = config.local_batch_size
+
+    pipeline = SQLPipeline(generator, evaluator, **kwargs)
+
+    print(f"开始流水线生成与评测，使用模型: {generator_type}")
+    if hasattr(queries, '__len__'):
+        print(f"总共 {len(queries)} 个查询")
+    results = pipeline.run(queries, table_description, sink)
+
+    if output_file:
+        save_results_to_excel(results, output_file)
+
+    if example_store is not None:
+        example_store.save()
+
+    return results
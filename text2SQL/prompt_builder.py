@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+提示词预算模块 - 统计提示词token数，并把表结构压缩到给定预算内
+
+表结构超出预算时按以下顺序逐级压缩：
+1. 去掉表说明和字段说明
+2. 去掉与问题相关度低的字段（主键始终保留）
+3. 去掉与问题相关度低的数据表
+4. 只剩一张表仍然超出时，去掉它与问题相关度低的字段（主键保留）
+仍然超出预算时返回LEVEL_OVER_BUDGET，由调用方记录
+"""
+
+import re
+from typing import List, Tuple, Callable
+
+from utils import tokenize
+from schema_model import Table, as_schema
+
+_CJK_PATTERN = re.compile(r'[　-〿一-鿿＀-￯]')
+
+# 压缩级别
+LEVEL_FULL = 0
+LEVEL_NO_DESCRIPTIONS = 1
+LEVEL_RELEVANT_COLUMNS = 2
+LEVEL_RELEVANT_TABLES = 3
+LEVEL_TRUNCATED_COLUMNS = 4
+LEVEL_OVER_BUDGET = 5
+
+def estimate_tokens(text: str) -> int:
+    """
+    本地近似估算token数：中文字符约1个token，其余字符约4个字符1个token
+
+    Args:
+        text: 文本
+
+    Returns:
+        估算的token数
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+class PromptBudget:
+    """表结构token预算"""
+
+    def __init__(self, schema_budget: int, count_tokens: Callable[[str], int] = None):
+        """
+        初始化预算
+
+        Args:
+            schema_budget: 表结构部分可用的token数
+            count_tokens: token计数函数，默认使用本地近似估算
+        """
+        self.schema_budget = schema_budget
+        self.count_tokens = count_tokens or estimate_tokens
+
+    def fit(self, table_description, query: str) -> Tuple[str, int]:
+        """
+        把表结构压缩到预算内
+
+        Args:
+            table_description: Schema对象或字段说明文本
+            query: 自然语言查询（用于判断相关度）
+
+        Returns:
+            (表结构文本, 压缩级别)，压缩到最后仍超出预算时级别为LEVEL_OVER_BUDGET
+        """
+        schema = as_schema(table_description)
+        text = schema.render()
+        if self.count_tokens(text) <= self.schema_budget or not schema.tables:
+            return text, LEVEL_FULL
+
+        text = schema.render(with_descriptions=False)
+        if self.count_tokens(text) <= self.schema_budget:
+            return text, LEVEL_NO_DESCRIPTIONS
+
+        query_terms = set(tokenize(query))
+        ranked = []
+        for table in schema.tables:
+            columns = [column for column in table.described_columns()
+                       if column.primary_key or _relevance(query_terms, column.name, column.description) > 0]
+            score = _relevance(query_terms, table.name, table.title, table.description)
+            score += sum(_relevance(query_terms, column.name, column.description) for column in columns)
+            ranked.append((table, columns, score))
+
+        text = _render(ranked)
+        if self.count_tokens(text) <= self.schema_budget:
+            return text, LEVEL_RELEVANT_COLUMNS
+
+        # 按相关度从低到高去掉数据表，至少保留一张
+        ranked_by_score = sorted(ranked, key=lambda item: item[2])
+        kept = ranked
+        while len(ranked_by_score) > 1:
+            ranked_by_score.pop(0)
+            kept = [item for item in ranked if item in ranked_by_score]
+            text = _render(kept)
+            if self.count_tokens(text) <= self.schema_budget:
+                return text, LEVEL_RELEVANT_TABLES
+
+        # 只剩一张表：按相关度从低到高去掉非主键字段
+        table, columns, score = kept[0]
+        removable = sorted((column for column in columns if not column.primary_key),
+                           key=lambda column: _relevance(query_terms, column.name, column.description))
+        while removable:
+            removed = removable.pop(0)
+            columns = [column for column in columns if column is not removed]
+            text = _render([(table, columns, score)])
+            if self.count_tokens(text) <= self.schema_budget:
+                return text, LEVEL_TRUNCATED_COLUMNS
+        return text, LEVEL_OVER_BUDGET
+
+def _relevance(query_terms: set, *texts: str) -> int:
+    """文本与问题共有的词项数"""
+    terms = set()
+    for text in texts:
+        if text:
+            terms.update(tokenize(text))
+    return len(terms & query_terms)
+
+def _render(ranked: List[Tuple[Table, list, int]]) -> str:
+    """渲染压缩后的表结构（只保留字段名）"""
+    return '\n\n'.join(table.render(with_descriptions=False, columns=columns)
+                       for table, columns, _ in ranked) + '\n'
+
+def count_messages_tokens(messages: List[dict], count_tokens: Callable[[str], int] = None) -> int:
+    """
+    统计消息列表的token数（每条消息额外计4个token的格式开销）
+
+    Args:
+        messages: 消息列表
+        count_tokens: token计数函数
+
+    Returns:
+        token数
+    """
+    count_tokens = count_tokens or estimate_tokens
+    return sum(count_tokens(message.get('content', '')) + 4 for message in messages)
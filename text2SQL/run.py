@@ -4,22 +4,18 @@
 SQL Copilot 启动脚本
 """
 
-import sys
-import os
-import subprocess
+import importlib.util
 from pathlib import Path
 
 def check_dependencies():
-    """检查依赖包是否安装"""
+    """检查依赖包是否安装（只查找不导入，避免拖慢启动）"""
     required_packages = [
         'dashscope', 'pandas', 'sqlalchemy', 'openai'
     ]
     
     missing_packages = []
     for package in required_packages:
-        try:
-            __import__(package)
-        except ImportError:
+        if importlib.util.find_spec(package) is None:
             missing_packages.append(package)
     
     if missing_packages:
@@ -60,12 +56,23 @@ def show_menu():
     print("6. 退出")
     print("=" * 60)
 
+def run_main(argv):
+    """在当前进程中运行main.py（复用已导入的模块和已建立的连接）"""
+    import main as sql_copilot
+    
+    try:
+        sql_copilot.main(argv)
+    except SystemExit as e:
+        if e.code:
+            raise
+
 def run_example():
     """运行示例"""
     print("运行SQL Copilot示例...")
     try:
-        subprocess.run([sys.executable, "example.py"], check=True)
-    except subprocess.CalledProcessError as e:
+        import example
+        example.main()
+    except Exception as e:
         print(f"运行示例失败: {e}")
     except KeyboardInterrupt:
         print("\n示例运行被中断")
@@ -74,8 +81,9 @@ def run_interactive():
     """运行交互式模式"""
     print("启动交互式模式...")
     try:
-        subprocess.run([sys.executable, "main.py", "--interactive"], check=True)
-    except subprocess.CalledProcessError as e:
+        import main as sql_copilot
+        sql_copilot.interactive_mode()
+    except Exception as e:
         print(f"启动交互式模式失败: {e}")
     except KeyboardInterrupt:
         print("\n交互式模式被中断")
@@ -93,12 +101,8 @@ def run_batch_generate():
     model = model_map.get(choice, 'qwen_turbo')
     
     try:
-        subprocess.run([
-            sys.executable, "main.py", 
-            "--mode", "generate", 
-            "--model", model
-        ], check=True)
-    except subprocess.CalledProcessError as e:
+        run_main(["--mode", "generate", "--model", model])
+    except (Exception, SystemExit) as e:
         print(f"批量生成失败: {e}")
     except KeyboardInterrupt:
         print("\n批量生成被中断")
@@ -107,11 +111,8 @@ def run_evaluation():
     """评测SQL结果"""
     print("评测SQL结果...")
     try:
-        subprocess.run([
-            sys.executable, "main.py", 
-            "--mode", "evaluate"
-        ], check=True)
-    except subprocess.CalledProcessError as e:
+        run_main(["--mode", "evaluate"])
+    except (Exception, SystemExit) as e:
         print(f"评测失败: {e}")
     except KeyboardInterrupt:
         print("\n评测被中断")
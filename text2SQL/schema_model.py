@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+"""
+数据表结构模型 - 解析建表语句和字段说明，构建紧凑的内存模型
+
+表名、字段名、类型等标识符统一使用sys.intern驻留，类使用__slots__减少内存占用。
+解析结果会缓存为二进制快照（marshal），源文件未变化时直接加载快照，避免重复解析文本。
+裁剪、校验、渲染提示词都基于同一个模型完成。
+"""
+
+import marshal
+import os
+import re
+import sys
+from typing import List, Dict, Optional, Iterable
+
+from config import config
+
+_SNAPSHOT_VERSION = 1
+
+_CREATE_TABLE_PATTERN = re.compile(r'CREATE\s+TABLE\s+`?(\w+)`?\s*\((.*?)\n\s*\)\s*;', re.IGNORECASE | re.DOTALL)
+_HEADER_PATTERN = re.compile(r'^(.*?)（(\w+)）：(.*)$')
+_COLUMN_DESC_PATTERN = re.compile(r'^(\w+)（(.*)）$')
+_TABLE_REF_PATTERN = re.compile(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+`?(\w+)`?', re.IGNORECASE)
+_IDENTIFIER_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+class Column:
+    """数据表字段"""
+
+    __slots__ = ('name', 'type', 'nullable', 'default', 'primary_key', 'description')
+
+    def __init__(self, name: str, type: str = '', nullable: bool = True, default: Optional[str] = None,
+                 primary_key: bool = False, description: str = ''):
+        self.name = sys.intern(name)
+        self.type = sys.intern(type)
+        self.nullable = nullable
+        self.default = default
+        self.primary_key = primary_key
+        self.description = description
+
+    def to_tuple(self) -> tuple:
+        return (self.name, self.type, self.nullable, self.default, self.primary_key, self.description)
+
+    def __repr__(self) -> str:
+        return f"Column({self.name!r}, {self.type!r})"
+
+class Table:
+    """数据表"""
+
+    __slots__ = ('name', 'title', 'description', 'columns', 'primary_key', '_column_map')
+
+    def __init__(self, name: str, title: str = '', description: str = '',
+                 columns: List[Column] = None, primary_key: List[str] = None):
+        self.name = sys.intern(name)
+        self.title = title
+        self.description = description
+        self.columns = columns or []
+        self.primary_key = [sys.intern(column) for column in (primary_key or [])]
+        self._column_map = {column.name.lower(): column for column in self.columns}
+
+    def column(self, name: str) -> Optional[Column]:
+        """按名称（不区分大小写）查找字段"""
+        return self._column_map.get(name.lower())
+
+    def add_column(self, column: Column) -> None:
+        """添加字段"""
+        self.columns.append(column)
+        self._column_map[column.name.lower()] = column
+
+    def described_columns(self) -> List[Column]:
+        """有字段说明的字段（字段说明文件中的精简字段集）"""
+        described = [column for column in self.columns if column.description]
+        return described or self.columns
+
+    def render(self, with_descriptions: bool = True, columns: Iterable[Column] = None) -> str:
+        """
+        渲染为字段说明格式的文本
+
+        Args:
+            with_descriptions: 是否包含表说明和字段说明
+            columns: 要渲染的字段，默认为有说明的字段
+
+        Returns:
+            文本，如"用户表（users）：...\\nuserId（用户ID（主键））、..."
+        """
+        columns = self.described_columns() if columns is None else list(columns)
+        if with_descriptions:
+            header = f"{self.title or self.name}（{self.name}）：{self.description}"
+            items = [f"{column.name}（{column.description}）" if column.description else column.name
+                     for column in columns]
+        else:
+            header = f"{self.title or self.name}（{self.name}）"
+            items = [f"{column.name}（主键）" if column.primary_key else column.name for column in columns]
+        return header + '\n' + '、'.join(items)
+
+    def to_tuple(self) -> tuple:
+        return (self.name, self.title, self.description, tuple(self.primary_key),
+                tuple(column.to_tuple() for column in self.columns))
+
+    def __repr__(self) -> str:
+        return f"Table({self.name!r}, {len(self.columns)} columns)"
+
+class Schema:
+    """数据库结构模型"""
+
+    __slots__ = ('tables', '_table_map', '_rendered')
+
+    def __init__(self, tables: List[Table] = None):
+        self.tables = tables or []
+        self._table_map = {table.name.lower(): table for table in self.tables}
+        self._rendered = None
+
+    def table(self, name: str) -> Optional[Table]:
+        """按名称（不区分大小写）查找数据表"""
+        return self._table_map.get(name.lower())
+
+    def add_table(self, table: Table) -> None:
+        """添加数据表"""
+        self.tables.append(table)
+        self._table_map[table.name.lower()] = table
+        self._rendered = None
+
+    def render(self, with_descriptions: bool = True) -> str:
+        """渲染为提示词使用的数据表描述文本"""
+        if with_descriptions and self._rendered is not None:
+            return self._rendered
+
+        text = '\n\n'.join(table.render(with_descriptions) for table in self.tables) + '\n'
+        if with_descriptions:
+            self._rendered = text
+        return text
+
+    def __str__(self) -> str:
+        return self.render()
+
+    def __len__(self) -> int:
+        return len(self.tables)
+
+    def referenced_tables(self, *texts: str) -> List[Table]:
+        """
+        找出文本（SQL、错误信息、问题等）中提到的数据表
+
+        Args:
+            *texts: 文本
+
+        Returns:
+            数据表列表（保持模型中的顺序）
+        """
+        words = set()
+        for text in texts:
+            if text:
+                words.update(word.lower() for word in _IDENTIFIER_PATTERN.findall(text))
+        return [table for table in self.tables if table.name.lower() in words]
+
+    def prune(self, *texts: str) -> 'Schema':
+        """
+        裁剪为文本中提到的数据表
+
+        Args:
+            *texts: 文本
+
+        Returns:
+            只包含相关数据表的子模型；没有匹配到任何表时返回自身
+        """
+        tables = self.referenced_tables(*texts)
+        return Schema(tables) if tables else self
+
+    def unknown_tables(self, sql: str) -> List[str]:
+        """
+        校验SQL中FROM/JOIN等引用的数据表是否都存在
+
+        Args:
+            sql: SQL语句
+
+        Returns:
+            不存在的数据表名列表
+        """
+        unknown = []
+        for name in _TABLE_REF_PATTERN.findall(sql or ''):
+            if name.lower() not in self._table_map and name not in unknown:
+                unknown.append(name)
+        return unknown
+
+    def to_tuple(self) -> tuple:
+        return tuple(table.to_tuple() for table in self.tables)
+
+    @classmethod
+    def from_tuple(cls, data: tuple) -> 'Schema':
+        """从快照数据还原模型"""
+        tables = []
+        for name, title, description, primary_key, columns in data:
+            tables.append(Table(name, title, description,
+                                [Column(*column) for column in columns], list(primary_key)))
+        return cls(tables)
+
+def parse_create_sql(text: str) -> Schema:
+    """
+    解析建表语句
+
+    Args:
+        text: 建表语句文本
+
+    Returns:
+        数据库结构模型（不含说明）
+    """
+    schema = Schema()
+    for table_name, body in _CREATE_TABLE_PATTERN.findall(text or ''):
+        table = Table(table_name)
+        primary_key = []
+
+        for line in body.split('\n'):
+            line = line.strip().rstrip(',')
+            if not line:
+                continue
+
+            upper = line.upper()
+            if upper.startswith('PRIMARY KEY'):
+                primary_key = [name.strip(' `') for name in line[line.find('(') + 1:line.rfind(')')].split(',')]
+                continue
+            if upper.startswith(('KEY ', 'UNIQUE', 'INDEX', 'CONSTRAINT', 'FOREIGN KEY')):
+                continue
+
+            parts = line.split()
+            default = re.search(r'\bDEFAULT\s+(\'[^\']*\'|\S+)', line, re.IGNORECASE)
+            column = Column(
+                name=parts[0].strip('`'),
+                type=parts[1] if len(parts) > 1 else '',
+                nullable='NOT NULL' not in upper,
+                default=default.group(1) if default else None,
+                primary_key='PRIMARY KEY' in upper
+            )
+            table.add_column(column)
+
+        for name in primary_key:
+            column = table.column(name)
+            if column:
+                column.primary_key = True
+        table.primary_key = [sys.intern(column.name) for column in table.columns if column.primary_key]
+        schema.add_table(table)
+
+    return schema
+
+def parse_description(text: str, schema: Schema = None) -> Schema:
+    """
+    解析字段说明，并合并到已有的结构模型中
+
+    Args:
+        text: 字段说明文本（按空行分隔，每段首行为表说明，第二行为"字段（说明）、..."）
+        schema: 已有的结构模型（来自建表语句），为None时新建
+
+    Returns:
+        数据库结构模型；表和字段顺序以字段说明为准，字段说明中没有的表排在最后
+    """
+    schema = schema or Schema()
+    ordered = []
+
+    for block in re.split(r'\n\s*\n', text or ''):
+        lines = [line.strip() for line in block.strip().split('\n') if line.strip()]
+        if not lines:
+            continue
+
+        match = _HEADER_PATTERN.match(lines[0])
+        if not match:
+            continue
+
+        title, table_name, description = match.groups()
+        table = schema.table(table_name) or Table(table_name)
+        table.title = title
+        table.description = description
+
+        described = []
+        for item in '、'.join(lines[1:]).split('、'):
+            item_match = _COLUMN_DESC_PATTERN.match(item.strip())
+            if not item_match:
+                continue
+
+            column_name, column_description = item_match.groups()
+            column = table.column(column_name)
+            if column is None:
+                column = Column(column_name, primary_key='主键' in column_description)
+                table.add_column(column)
+            column.description = column_description
+            described.append(column)
+
+        # 有说明的字段按说明中的顺序排在前面
+        rest = [column for column in table.columns if column not in described]
+        table.columns = described + rest
+        ordered.append(table)
+
+    for table in schema.tables:
+        if table not in ordered:
+            ordered.append(table)
+    return Schema(ordered)
+
+def _source_signature(*paths: str) -> tuple:
+    """源文件签名（路径、修改时间、大小），用于判断快照是否过期"""
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((os.path.abspath(path), stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((os.path.abspath(path), 0, 0))
+    return tuple(signature)
+
+def build_schema(description_file: str = None, create_sql_file: str = None) -> Schema:
+    """
+    从源文件解析结构模型（不使用快照）
+
+    Args:
+        description_file: 字段说明文件路径
+        create_sql_file: 建表语句文件路径
+
+    Returns:
+        数据库结构模型
+    """
+    from utils import read_file_content
+
+    description_file = description_file or config.table_description_file
+    create_sql_file = create_sql_file or config.create_sql_file
+
+    create_sql = read_file_content(create_sql_file) if os.path.exists(create_sql_file) else ''
+    return parse_description(read_file_content(description_file), parse_create_sql(create_sql))
+
+_schema_cache: Dict[tuple, Schema] = {}
+
+def load_schema(description_file: str = None, create_sql_file: str = None,
+                snapshot_file: str = None) -> Schema:
+    """
+    加载结构模型：优先使用进程内缓存，其次使用二进制快照，最后解析源文件并写入快照
+
+    Args:
+        description_file: 字段说明文件路径
+        create_sql_file: 建表语句文件路径
+        snapshot_file: 快照文件路径
+
+    Returns:
+        数据库结构模型
+    """
+    description_file = description_file or config.table_description_file
+    create_sql_file = create_sql_file or config.create_sql_file
+    snapshot_file = snapshot_file or config.schema_snapshot_file
+
+    signature = _source_signature(description_file, create_sql_file)
+    schema = _schema_cache.get(signature)
+    if schema is None:
+        schema = _load_source_schema(description_file, create_sql_file, snapshot_file, signature)
+        _schema_cache[signature] = schema
+
+    if config.summary_tables:
+        # 提示词中只加入目标数据库中刷新过且没有过期的汇总表，快照和缓存只保存原始表结构
+        from summary_tables import add_summary_tables, fresh_summary_names
+        schema = add_summary_tables(schema, fresh_summary_names())
+    return schema
+
+def _load_source_schema(description_file: str, create_sql_file: str, snapshot_file: str, signature) -> Schema:
+    """从快照读取原始表结构，快照不存在或已过期时重新解析并保存快照"""
+    schema = None
+
+    try:
+        with open(snapshot_file, 'rb') as file:
+            version, snapshot_signature, data = marshal.load(file)
+        if version == _SNAPSHOT_VERSION and snapshot_signature == signature:
+            schema = Schema.from_tuple(data)
+    except (OSError, ValueError, EOFError, TypeError):
+        schema = None
+
+    if schema is None:
+        schema = build_schema(description_file, create_sql_file)
+        try:
+            os.makedirs(os.path.dirname(snapshot_file) or '.', exist_ok=True)
+            tmp_file = f"{snapshot_file}.tmp"
+            with open(tmp_file, 'wb') as file:
+                marshal.dump((_SNAPSHOT_VERSION, signature, schema.to_tuple()), file)
+            os.replace(tmp_file, snapshot_file)
+        except OSError as e:
+            print(f"保存数据表结构快照出错: {e}")
+    return schema
+
+def as_schema(table_description) -> Schema:
+    """
+    把数据表描述统一转换为结构模型
+
+    Args:
+        table_description: Schema对象或字段说明文本
+
+    Returns:
+        数据库结构模型
+    """
+    if isinstance(table_description, Schema):
+        return table_description
+    return parse_description(str(table_description or ''))
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+服务模式 - 常驻的asyncio HTTP服务
+
+进程启动时加载表结构模型、数据库连接池，生成器按模型懒加载后常驻内存，
+每个请求只需付出模型调用和SQL执行的时间。相同的并发问题会合并为一次模型调用。
+
+接口（JSON）：
+    POST /generate  {"question": "...", "model": "qwen_turbo"}
+    POST /validate  {"sql": "..."}
+    POST /execute   {"sql": "..."}
+    GET  /health
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Tuple
+
+from config import config
+from utils import clean_query, validate_sql
+from schema_model import load_schema
+from sql_generator import SQLGeneratorFactory
+from sql_evaluator import SQLEvaluator
+
+_STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+_MAX_BODY_SIZE = 1024 * 1024
+
+_MODELS = ('qwen_turbo', 'qwen_coder', 'local_qwen')
+
+class HTTPError(Exception):
+    """请求错误"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class SQLCopilotService:
+    """常驻服务状态：表结构、生成器、评测器、结果缓存"""
+
+    def __init__(self, cache_size: int = None, workers: int = None):
+        """
+        初始化服务
+
+        Args:
+            cache_size: 生成结果缓存条数
+            workers: 执行阻塞调用（模型调用、SQL执行）的线程数
+        """
+        self.schema = load_schema()
+        self.evaluator = SQLEvaluator()
+        self.executor = ThreadPoolExecutor(max_workers=workers or config.server_workers)
+        self.cache_size = config.server_cache_size if cache_size is None else cache_size
+
+        self._generators = {}
+        self._generator_lock = asyncio.Lock()
+        self._cache: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.stats = {'requests': 0, 'model_calls': 0, 'coalesced': 0, 'cache_hits': 0}
+
+    async def _run(self, func, *args):
+        """在线程池中执行阻塞调用"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def get_generator(self, model: str):
+        """获取（必要时创建）常驻的生成器实例"""
+        generator = self._generators.get(model)
+        if generator is not None:
+            return generator
+
+        async with self._generator_lock:
+            if model not in self._generators:
+                generator = await self._run(SQLGeneratorFactory.create_generator, model)
+                if hasattr(generator, 'enable_batching'):
+                    # 本地模型：并发请求合并为批量generate
+                    generator.enable_batching()
+                self._generators[model] = generator
+            return self._generators[model]
+
+    async def generate(self, question: str, model: str) -> Dict:
+        """
+        生成SQL；相同模型的相同问题并发到达时只调用一次模型
+
+        Args:
+            question: 自然语言问题
+            model: 生成器类型
+
+        Returns:
+            {'sql', 'time', 'prompt_tokens', 'source'}
+        """
+        key = (model, clean_query(question))
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.stats['cache_hits'] += 1
+            return dict(cached, source='cache')
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.stats['coalesced'] += 1
+            return dict(await asyncio.shield(future), source='coalesced')
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            generator = await self.get_generator(model)
+            self.stats['model_calls'] += 1
+            sql, use_time, prompt_tokens = await self._run(
+                generator.generate_sql_with_stats, key[1], self.schema)
+            result = {'sql': sql, 'time': round(use_time, 3), 'prompt_tokens': prompt_tokens}
+            future.set_result(result)
+        except Exception as e:
+            future.set_exception(e)
+            # 没有合并请求在等待时避免"exception was never retrieved"警告
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+        if sql and self.cache_size > 0:
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return dict(result, source='model')
+
+    def validate(self, sql: str) -> Dict:
+        """校验SQL"""
+        valid, message = validate_sql(sql, self.schema)
+        return {'valid': valid, 'message': message}
+
+    async def execute(self, sql: str) -> Dict:
+        """执行SQL"""
+        start_time = time.time()
+        success, result_type, result_content = await self._run(self.evaluator.execute_sql, sql)
+        return {
+            'success': success,
+            'result_type': result_type,
+            'result_content': result_content,
+            'time': round(time.time() - start_time, 3)
+        }
+
+    def health(self) -> Dict:
+        """服务状态"""
+        return {
+            'status': 'ok',
+            'tables': len(self.schema),
+            'generators': sorted(self._generators),
+            'cache_size': len(self._cache),
+            'inflight': len(self._inflight),
+            'stats': self.stats,
+            'batching': {model: generator.scheduler.metrics()
+                         for model, generator in self._generators.items()
+                         if getattr(generator, 'scheduler', None) is not None}
+        }
+
+    async def dispatch(self, method: str, path: str, body) -> Dict:
+        """路由请求"""
+        self.stats['requests'] += 1
+
+        if path == '/health':
+            return self.health()
+
+        if path not in ('/generate', '/validate', '/execute'):
+            raise HTTPError(404, f"未知接口: {path}")
+        if method != 'POST':
+            raise HTTPError(405, f"{path} 只支持POST请求")
+        if not isinstance(body, dict):
+            raise HTTPError(400, "请求体必须是JSON对象")
+
+        if path == '/generate':
+            question = _string_field(body, 'question')
+            if not question:
+                raise HTTPError(400, "缺少question参数")
+            model = _string_field(body, 'model') or 'qwen_turbo'
+            if model not in _MODELS:
+                raise HTTPError(400, f"不支持的模型: {model}（可选：{', '.join(_MODELS)}）")
+            return await self.generate(question, model)
+        if path == '/validate':
+            return self.validate(_string_field(body, 'sql'))
+        return await self.execute(_string_field(body, 'sql'))
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个HTTP/1.1连接（支持keep-alive）"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                try:
+                    method, path, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                status, payload = 200, None
+                try:
+                    length = int(headers.get('content-length') or 0)
+                    if length > _MAX_BODY_SIZE:
+                        raise HTTPError(413, "请求体过大")
+                    raw = await reader.readexactly(length) if length else b''
+                    try:
+                        body = json.loads(raw) if raw else {}
+                    except ValueError:
+                        raise HTTPError(400, "请求体不是合法的JSON")
+                    payload = await self.dispatch(method, path.split('?', 1)[0], body)
+                except HTTPError as e:
+                    status, payload = e.status, {'error': e.message}
+                    keep_alive = keep_alive and e.status != 413
+                except Exception as e:
+                    status, payload = 500, {'error': str(e)}
+
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                writer.write(
+                    f"HTTP/1.1 {status} {_STATUS_TEXT.get(status, '')}\r\n"
+                    f"Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + data)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+def _string_field(body: Dict, name: str) -> str:
+    """读取字符串参数，缺少时返回空字符串，类型不对时返回400"""
+    value = body.get(name)
+    if value is None:
+        return ''
+    if not isinstance(value, str):
+        raise HTTPError(400, f"{name}参数必须是字符串")
+    return value
+
+async def serve(host: str = None, port: int = None) -> None:
+    """
+    启动服务
+
+    Args:
+        host: 监听地址
+        port: 监听端口
+    """
+    host = host or config.server_host
+    port = port or config.server_port
+
+    service = SQLCopilotService()
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    print(f"SQL Copilot 服务已启动: http://{host}:{port}")
+
+    async with server:
+        await server.serve_forever()
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='SQL Copilot 服务模式')
+    parser.add_argument('--host', type=str, default=config.server_host, help='监听地址')
+    parser.add_argument('--port', type=int, default=config.server_port, help='监听端口')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\n服务已停止")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+分片运行模块 - 把问题流按序号取模切分为N个分片，多进程并行生成和评测，最后按原顺序合并结果
+
+每个分片在独立进程中运行，使用自己的生成器、示例库副本（只读）、缓存和数据库连接池，
+结果写入各自的分片文件。分片i依次包含第 i、i+N、i+2N... 个问题，
+因此按分片轮流各取一行即可恢复原顺序，合并时不需要把结果整体读入内存。
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import zip_longest
+from typing import Dict, List
+
+from config import config
+
+def shard_file(file_path: str, shard_index: int, shards: int) -> str:
+    """
+    分片文件路径
+
+    Args:
+        file_path: 合并后的文件路径
+        shard_index: 分片序号
+        shards: 分片总数
+
+    Returns:
+        如 output/sql_result.shard0-of-4.jsonl
+    """
+    base, ext = os.path.splitext(file_path)
+    return f"{base}.shard{shard_index}-of-{shards}{ext}"
+
+def shard_outputs(args) -> Dict[str, str]:
+    """
+    分片运行的合并输出文件
+
+    Args:
+        args: 命令行参数
+
+    Returns:
+        {'generate': 生成结果文件, 'evaluate': 评测结果文件（generate模式为None）}
+    """
+    if args.mode == 'generate':
+        output_file = args.output or f"{config.output_dir}/sql_result_{args.model}.jsonl"
+        return {'generate': output_file, 'evaluate': None}
+
+    output_file = args.output or f"{config.output_dir}/sql_result_{args.model}_eval.jsonl"
+    base, ext = os.path.splitext(output_file)
+    return {'generate': f"{base}_sql{ext}", 'evaluate': output_file}
+
+def run_shard(args, shard_index: int) -> Dict:
+    """
+    运行一个分片（在子进程中调用）
+
+    Args:
+        args: 命令行参数
+        shard_index: 分片序号
+
+    Returns:
+        统计信息字典
+    """
+    from dialects import parse_dialects
+    from schema_model import load_schema
+    from stream_io import iter_queries, RecordWriter
+
+    # 子进程重新导入了config，按命令行参数恢复设置
+    config.db_dialect = args.dialect
+    config.eval_targets = parse_dialects(args.targets)
+    config.ensure_output_dir()
+
+    outputs = shard_outputs(args)
+    generate_file = shard_file(outputs['generate'], shard_index, args.shards)
+    evaluate_file = outputs['evaluate'] and shard_file(outputs['evaluate'], shard_index, args.shards)
+    tag = f"[分片 {shard_index + 1}/{args.shards}]"
+    start_time = time.time()
+
+    table_description = load_schema(args.table_desc)
+    if not table_description:
+        raise RuntimeError(f"无法读取数据表描述文件: {args.table_desc}")
+
+    example_store = None
+    if args.few_shot_k > 0:
+        from example_store import ExampleStore
+        config.few_shot_k = args.few_shot_k
+        example_store = ExampleStore(args.example_store)
+        # 各分片只读使用示例库，避免多个进程同时写同一个文件
+        example_store.file_path = None
+
+    queries = iter_queries(args.qa_file, dedup=args.dedup_queries, shards=args.shards, shard_index=shard_index)
+    print(f"{tag} 开始运行")
+
+    if evaluate_file and args.pipeline:
+        from pipeline import run_pipeline
+
+        stats = {'total': 0, 'success': 0}
+        chunk = []
+
+        def write(results: List[Dict]) -> None:
+            # 流水线按问题顺序交回已完成的结果，凑满一块后追加到分片文件（每块刷盘一次）
+            chunk.extend(results)
+            stats['total'] += len(results)
+            stats['success'] += sum(result.get('能否运行') == 'Yes' for result in results)
+            if len(chunk) >= args.chunk_size:
+                writer.write(chunk)
+                chunk.clear()
+
+        with RecordWriter(evaluate_file) as writer:
+            run_pipeline(
+                queries=queries,
+                generator_type=args.model,
+                table_description=table_description,
+                example_store=example_store,
+                sink=write,
+                token_budget=args.token_budget,
+                queue_size=args.queue_size,
+                generate_workers=args.generate_workers,
+                evaluate_workers=args.evaluate_workers,
+                repair_retries=args.repair_retries,
+                repair_budget=args.repair_budget
+            )
+            writer.write(chunk)
+    else:
+        from sql_generator import stream_generate_sql
+
+        stats = stream_generate_sql(
+            queries=queries,
+            output_file=generate_file,
+            generator_type=args.model,
+            table_description=table_description,
+            chunk_size=args.chunk_size,
+            example_store=example_store,
+            token_budget=args.token_budget
+        )
+        if evaluate_file:
+            from sql_evaluator import evaluate_sql_stream
+
+            evaluated = evaluate_sql_stream(generate_file, evaluate_file, chunk_size=args.chunk_size)
+            stats['success'] = evaluated.get('success', 0)
+
+    stats['shard'] = shard_index
+    stats['elapsed'] = round(time.time() - start_time, 2)
+    print(f"{tag} 完成，{stats['total']} 个问题，耗时 {stats['elapsed']}秒")
+    return stats
+
+def merge_shards(file_path: str, shards: int, chunk_size: int = None) -> int:
+    """
+    按原问题顺序合并分片文件
+
+    Args:
+        file_path: 合并后的文件路径（.csv/.jsonl，分片文件由shard_file得到）
+        shards: 分片总数
+        chunk_size: 每写出一块的行数
+
+    Returns:
+        合并的记录数
+    """
+    from stream_io import iter_records, iter_chunks, RecordWriter
+
+    shard_files = [shard_file(file_path, index, shards) for index in range(shards)]
+    missing = [path for path in shard_files if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(f"分片文件不存在: {', '.join(missing)}")
+
+    # 分片i的第k行是第 k*N+i 个问题，轮流各取一行即为原顺序
+    marker = object()
+    rows = (record
+            for group in zip_longest(*(iter_records(path) for path in shard_files), fillvalue=marker)
+            for record in group if record is not marker)
+
+    total = 0
+    with RecordWriter(file_path) as writer:
+        for chunk in iter_chunks(rows, chunk_size or config.eval_chunk_size):
+            writer.write(chunk)
+            total += len(chunk)
+    return total
+
+def run_sharded(args) -> List[Dict]:
+    """
+    用进程池运行所有分片并合并结果
+
+    Args:
+        args: 命令行参数（args.shards为分片数，args.processes为并行进程数）
+
+    Returns:
+        各分片的统计信息
+    """
+    import multiprocessing
+
+    processes = min(args.shards, args.processes or os.cpu_count() or 1)
+    print(f"分片运行: {args.shards} 个分片，{processes} 个进程")
+    start_time = time.time()
+
+    # spawn方式启动子进程，不继承父进程的线程、连接池和已加载的模型
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+        futures = [executor.submit(run_shard, args, index) for index in range(args.shards)]
+        results = [future.result() for future in futures]
+
+    outputs = shard_outputs(args)
+    merged_file = outputs['evaluate'] or outputs['generate']
+    total = merge_shards(merged_file, args.shards, args.chunk_size)
+
+    success = sum(result.get('success', 0) for result in results)
+    print(f"\n分片运行完成！共 {total} 个问题，合并结果已保存到: {merged_file}")
+    if outputs['evaluate']:
+        success_rate = success / total * 100 if total else 0
+        print(f"成功执行: {success}，成功率: {success_rate:.1f}%")
+    for result in results:
+        print(f"  分片 {result['shard']}: {result['total']} 个问题，耗时 {result['elapsed']}秒")
+    print(f"总耗时: {time.time() - start_time:.2f}秒")
+    return results
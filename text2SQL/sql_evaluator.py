@@ -3,32 +3,75 @@
 SQL评测模块 - 执行SQL查询并评测结果
 """
 
-import pandas as pd
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+import threading
+import time
 import traceback
 from typing import Tuple, List, Dict
 from config import config
 from utils import ensure_directory
+from dialects import get_dialect, dialect_of_url, transpile_sql
+from sql_normalizer import DedupExecutor
+from sql_sandbox import check_statement, READ, READ_ONLY_STATEMENTS
 
 class SQLEvaluator:
     """SQL评测器类"""
     
-    def __init__(self, database_url: str = None):
+    def __init__(self, database_url: str = None, dedup: bool = None, allow_writes: bool = None,
+                 source_dialect: str = None):
         """
         初始化SQL评测器
         
         Args:
             database_url: 数据库连接URL
+            dedup: 评测时是否按规范化SQL去重执行（默认读取配置）
+            allow_writes: 是否允许执行INSERT/UPDATE/DELETE（执行后回滚，默认读取配置）
+            source_dialect: 生成SQL时使用的方言，与数据库方言不同时执行前转换（默认读取配置）
         """
         self.database_url = database_url or config.get_database_url()
+        self.dialect = dialect_of_url(self.database_url)
+        self.source_dialect = get_dialect(source_dialect or config.db_dialect)
         self.engine = None
+        self.allow_writes = config.sandbox_allow_writes if allow_writes is None else allow_writes
+        self.dedup = DedupExecutor(self.execute_sql, self.source_dialect.sqlglot_name,
+                                   max_size=config.sql_dedup_cache_size) \
+            if (config.sql_dedup if dedup is None else dedup) else None
+        self.extra_targets: Dict[str, 'SQLEvaluator'] = {}
+        self._stats_lock = threading.Lock()
+        self.run_stats = {'rows': 0, 'time': 0.0}
         self._create_engine()
+        self.rewriter = None
+        if config.summary_tables:
+            from schema_model import load_schema
+            from summary_tables import SummaryRewriter
+            
+            # 只改写为目标数据库中刷新过且没有过期的汇总表
+            self.rewriter = SummaryRewriter(load_schema(), dialect=self.dialect.sqlglot_name, engine=self.engine,
+                                            max_staleness=config.summary_max_staleness,
+                                            settle_seconds=config.summary_settle_seconds)
+    
+    def add_target(self, dialect: str, database_url: str = None) -> 'SQLEvaluator':
+        """
+        增加一个评测目标数据库，同一条SQL会在所有目标上执行，结果写入带方言后缀的列
+        
+        Args:
+            dialect: 目标数据库方言
+            database_url: 目标数据库连接URL（默认读取配置）
+            
+        Returns:
+            目标数据库的评测器
+        """
+        name = get_dialect(dialect).name
+        self.extra_targets[name] = SQLEvaluator(database_url or config.get_database_url(name),
+                                                dedup=self.dedup is not None, allow_writes=self.allow_writes,
+                                                source_dialect=self.source_dialect.name)
+        return self.extra_targets[name]
     
     def _create_engine(self):
-        """创建数据库引擎"""
+        """创建数据库引擎（连接池参数按方言和并发评测数调整）"""
         try:
-            self.engine = create_engine(self.database_url)
+            from sqlalchemy import create_engine
+            
+            self.engine = create_engine(self.database_url, **self.dialect.engine_options(config.evaluate_workers))
             print(f"数据库连接成功: {self.database_url}")
         except Exception as e:
             print(f"数据库连接失败: {e}")
@@ -39,12 +82,14 @@ class SQLEvaluator:
         if self.engine is None:
             raise Exception("数据库引擎未初始化")
         
+        from sqlalchemy.orm import sessionmaker
+        
         Session = sessionmaker(bind=self.engine)
         return Session()
     
     def execute_sql(self, sql: str) -> Tuple[bool, str, str]:
         """
-        执行SQL查询
+        在沙箱中执行SQL查询：只执行白名单内的语句，事务总是回滚
         
         Args:
             sql: SQL语句
@@ -55,19 +100,43 @@ class SQLEvaluator:
         if not sql or sql.strip() == '':
             return False, "error", "SQL语句为空"
         
-        session = None
+        # 如果有多个SQL语句，只执行第一个
+        sqls = sql.split(';')
+        sql = sqls[0].strip()
+        
+        if not sql:
+            return False, "error", "SQL语句为空"
+        
+        allowed, kind, message = check_statement(sql, self.allow_writes, self.source_dialect.sqlglot_name)
+        if not allowed:
+            return False, "error", f"SQL被拒绝执行: {message}"
+        
+        # 生成时的方言与数据库不同时转换语法
+        sql = transpile_sql(sql, self.source_dialect.name, self.dialect.name)
+        
+        if self.rewriter is not None and kind == READ:
+            # 能由汇总表回答的聚合查询改为查询汇总表
+            sql, _ = self.rewriter.rewrite(sql)
+        
+        connection = None
+        read_only = None
         try:
-            session = self.get_session()
+            if self.engine is None:
+                raise Exception("数据库引擎未初始化")
             
-            # 如果有多个SQL语句，只执行第一个
-            sqls = sql.split(';')
-            sql = sqls[0].strip()
+            from sqlalchemy import text
             
-            if not sql:
-                return False, "error", "SQL语句为空"
+            connection = self.engine.connect()
+            if kind == READ:
+                read_only = READ_ONLY_STATEMENTS.get(self.engine.dialect.name)
+                if read_only:
+                    connection.exec_driver_sql(read_only[0])
             
             # 执行SQL查询
-            result = session.execute(text(sql))
+            result = connection.execute(text(sql))
+            
+            if not result.returns_rows:
+                return True, "success", f"影响行数: {result.rowcount}（已回滚）"
             
             # 获取列名
             columns = result.keys()
@@ -87,8 +156,20 @@ class SQLEvaluator:
             traceback_msg = traceback.format_exc()
             return False, "error", f'SQL执行错误: {error_msg}'
         finally:
-            if session:
-                session.close()
+            if connection is not None:
+                self._release(connection, read_only)
+    
+    def _release(self, connection, read_only: tuple = None) -> None:
+        """回滚事务并把连接归还连接池"""
+        try:
+            connection.rollback()
+            if read_only and read_only[1]:
+                connection.exec_driver_sql(read_only[1])
+                connection.rollback()
+        except Exception as e:
+            print(f"回滚事务失败: {e}")
+        finally:
+            connection.close()
     
     def _build_markdown_table(self, columns: List[str], rows: List) -> str:
         """
@@ -111,7 +192,7 @@ class SQLEvaluator:
         
         return markdown
     
-    def evaluate_sql_file(self, input_file: str, output_file: str = None) -> pd.DataFrame:
+    def evaluate_sql_file(self, input_file: str, output_file: str = None) -> 'pd.DataFrame':
         """
         评测SQL文件中的查询
         
@@ -122,6 +203,9 @@ class SQLEvaluator:
         Returns:
             评测结果DataFrame
         """
+        import pandas as pd
+        
+        self.begin_run()
         try:
             # 读取输入文件
             df = pd.read_excel(input_file)
@@ -130,6 +214,9 @@ class SQLEvaluator:
             # 添加评测列
             df['能否运行'] = ''
             df['执行结果'] = ''
+            for name in self.extra_targets:
+                df[f'能否运行[{name}]'] = ''
+                df[f'执行结果[{name}]'] = ''
             
             for index, row in df.iterrows():
                 sql = row['SQL']
@@ -141,18 +228,15 @@ class SQLEvaluator:
                     continue
                 
                 # 执行SQL
-                success, result_type, result_content = self.execute_sql(str(sql))
-                
-                if success:
-                    df.loc[index, '能否运行'] = 'Yes'
-                    df.loc[index, '执行结果'] = result_content
-                else:
-                    df.loc[index, '能否运行'] = f'No {result_content}'
-                    df.loc[index, '执行结果'] = result_content
+                success, columns = self.evaluate_columns(str(sql))
+                for column, value in columns.items():
+                    df.loc[index, column] = value
                 
                 print(f"执行结果: {'成功' if success else '失败'}")
                 print("-" * 50)
             
+            self.report_run()
+            
             # 保存结果
             if output_file:
                 df.to_excel(output_file, index=False)
@@ -168,6 +252,127 @@ class SQLEvaluator:
             print(f"评测过程中出错: {e}")
             return pd.DataFrame()
     
+    def evaluate_sql_stream(self, input_file: str, output_file: str, chunk_size: int = None,
+                            resume: bool = False, workers: int = None) -> Dict:
+        """
+        分块流式评测：逐块读取、评测、追加写出，内存占用与输入行数无关
+        
+        Args:
+            input_file: 输入文件路径（.csv/.jsonl/.parquet/.xlsx）
+            output_file: 输出文件路径（.csv/.jsonl）
+            chunk_size: 每块行数
+            resume: 是否从输出文件已有的行数处继续
+            workers: 每块内并发执行SQL的线程数
+            
+        Returns:
+            统计信息字典
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from itertools import islice
+        from stream_io import iter_records, iter_chunks, count_records, RecordWriter
+        
+        chunk_size = chunk_size or config.eval_chunk_size
+        workers = workers or config.evaluate_workers
+        skipped = count_records(output_file) if resume else 0
+        stats = {'total': skipped, 'success': 0, 'skipped': skipped, 'chunks': 0}
+        
+        if skipped:
+            print(f"断点续跑：跳过已评测的 {skipped} 行")
+        self.begin_run()
+        
+        records = islice(iter_records(input_file, chunk_size), skipped, None)
+        with RecordWriter(output_file, append=resume) as writer, ThreadPoolExecutor(max_workers=workers) as executor:
+            for chunk in iter_chunks(records, chunk_size):
+                for record, (success, columns) in zip(
+                        chunk, executor.map(self.evaluate_columns, (record.get('SQL') for record in chunk))):
+                    record.update(columns)
+                    stats['success'] += int(success)
+                
+                writer.write(chunk)
+                self.end_chunk()
+                stats['total'] += len(chunk)
+                stats['chunks'] += 1
+                print(f"已评测 {stats['total']} 行（本次成功 {stats['success']} 行）")
+        
+        print(f"评测结果已保存到: {output_file}")
+        self.report_run()
+        if self.dedup is not None:
+            stats['dedup'] = self.dedup.stats()
+        return stats
+    
+    def begin_run(self) -> None:
+        """开始一次评测：清空上一次运行的去重结果、改写统计和耗时统计"""
+        if self.dedup is not None:
+            self.dedup.reset()
+        if self.rewriter is not None:
+            self.rewriter.reset()
+        with self._stats_lock:
+            self.run_stats = {'rows': 0, 'time': 0.0}
+        for evaluator in self.extra_targets.values():
+            evaluator.begin_run()
+    
+    def end_chunk(self) -> None:
+        """一块评测结束：释放这一块的去重结果，累计的去重统计保留到report_run"""
+        if self.dedup is not None:
+            self.dedup.clear()
+        for evaluator in self.extra_targets.values():
+            evaluator.end_chunk()
+    
+    def report_run(self) -> None:
+        """打印本次评测的去重、汇总表改写和各目标数据库的耗时统计"""
+        if self.extra_targets:
+            for evaluator in [self] + list(self.extra_targets.values()):
+                rows, total = evaluator.run_stats['rows'], evaluator.run_stats['time']
+                average = total / rows * 1000 if rows else 0
+                print(f"[{evaluator.dialect.title}] 评测 {rows} 条，累计耗时 {total:.2f}秒，平均 {average:.1f}毫秒/条")
+        if self.dedup is not None:
+            self.dedup.report()
+        if self.rewriter is not None:
+            self.rewriter.report()
+    
+    def evaluate_columns(self, sql: str) -> Tuple[bool, Dict[str, str]]:
+        """
+        在主目标和所有附加目标数据库上评测一条SQL
+        
+        Args:
+            sql: SQL语句
+            
+        Returns:
+            (主目标是否成功, {列名: 值})，附加目标的列名带方言后缀，如"能否运行[sqlite]"
+        """
+        start_time = time.time()
+        success, can_run, result_content = self.evaluate_row(sql)
+        with self._stats_lock:
+            self.run_stats['rows'] += 1
+            self.run_stats['time'] += time.time() - start_time
+        
+        columns = {'能否运行': can_run, '执行结果': result_content}
+        for name, evaluator in self.extra_targets.items():
+            _, target_columns = evaluator.evaluate_columns(sql)
+            columns.update({f'{column}[{name}]': value for column, value in target_columns.items()})
+        return success, columns
+    
+    def evaluate_row(self, sql: str) -> Tuple[bool, str, str]:
+        """
+        评测一行结果中的SQL，返回结果文件中使用的列值
+        
+        Args:
+            sql: SQL语句
+            
+        Returns:
+            (是否成功, 能否运行, 执行结果)
+        """
+        if sql is None or str(sql).strip() == '':
+            return False, 'No 没有找到SQL', 'SQL为空'
+        
+        # 写法不同但等价的SQL只执行一次
+        execute = self.dedup or self.execute_sql
+        success, result_type, result_content = execute(str(sql))
+        
+        if success:
+            return True, 'Yes', result_content
+        return False, f'No {result_content}', result_content
+    
     def evaluate_single_sql(self, sql: str) -> Dict:
         """
         评测单个SQL查询
@@ -195,14 +400,36 @@ class SQLEvaluator:
             连接是否成功
         """
         try:
+            from sqlalchemy import text
+            
             session = self.get_session()
             session.execute(text("SELECT 1"))
             session.close()
-            print("数据库连接测试成功")
-            return True
+            print(f"数据库连接测试成功（{self.dialect.title}）")
         except Exception as e:
-            print(f"数据库连接测试失败: {e}")
+            print(f"数据库连接测试失败（{self.dialect.title}）: {e}")
             return False
+        return all(evaluator.test_connection() for evaluator in self.extra_targets.values())
+
+def create_evaluator(database_url: str = None, targets: List[str] = None) -> SQLEvaluator:
+    """
+    创建评测器：指定了多个目标数据库时，第一个为主目标，其余作为附加目标
+    
+    Args:
+        database_url: 数据库连接URL（指定时只评测该数据库）
+        targets: 目标数据库方言列表（默认读取配置）
+        
+    Returns:
+        SQL评测器
+    """
+    targets = config.eval_targets if targets is None else targets
+    if database_url or not targets:
+        return SQLEvaluator(database_url)
+    
+    evaluator = SQLEvaluator(config.get_database_url(targets[0]))
+    for target in targets[1:]:
+        evaluator.add_target(target)
+    return evaluator
 
 def evaluate_sql_results(input_file: str, output_file: str = None, database_url: str = None):
     """
@@ -213,7 +440,7 @@ def evaluate_sql_results(input_file: str, output_file: str = None, database_url:
         output_file: 输出文件路径
         database_url: 数据库连接URL
     """
-    evaluator = SQLEvaluator(database_url)
+    evaluator = create_evaluator(database_url)
     
     # 测试连接
     if not evaluator.test_connection():
@@ -235,3 +462,35 @@ def evaluate_sql_results(input_file: str, output_file: str = None, database_url:
         print(f"成功率: {success_rate:.1f}%")
     
     return result_df
+
+def evaluate_sql_stream(input_file: str, output_file: str, chunk_size: int = None,
+                        resume: bool = False, database_url: str = None) -> Dict:
+    """
+    分块流式评测的便捷函数
+    
+    Args:
+        input_file: 输入文件路径（.csv/.jsonl/.parquet/.xlsx）
+        output_file: 输出文件路径（.csv/.jsonl）
+        chunk_size: 每块行数
+        resume: 是否断点续跑
+        database_url: 数据库连接URL
+        
+    Returns:
+        统计信息字典
+    """
+    evaluator = create_evaluator(database_url)
+    
+    if not evaluator.test_connection():
+        print("数据库连接失败，无法进行评测")
+        return {}
+    
+    stats = evaluator.evaluate_sql_stream(input_file, output_file, chunk_size, resume)
+    
+    evaluated = stats['total'] - stats['skipped']
+    success_rate = (stats['success'] / evaluated) * 100 if evaluated > 0 else 0
+    print(f"\n评测完成!")
+    print(f"本次评测数: {evaluated}")
+    print(f"成功执行: {stats['success']}")
+    print(f"成功率: {success_rate:.1f}%")
+    
+    return stats
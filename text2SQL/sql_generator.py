@@ -3,19 +3,111 @@
 SQL生成器模块 - 使用不同的大语言模型生成SQL查询
 """
 
+import os
 import time
-import dashscope
-from dashscope.api_entities.dashscope_response import Role
-from typing import List, Dict, Tuple
+import threading
+from typing import Iterable, Iterator, List, Dict, Tuple
 from config import config
 from utils import extract_sql_code, clean_query, print_progress
+from schema_model import as_schema
+from prompt_builder import PromptBudget, LEVEL_OVER_BUDGET, estimate_tokens, count_messages_tokens
+from dialects import get_dialect
+
+def _import_dashscope():
+    """首次调用模型时才导入dashscope，避免拖慢启动"""
+    import dashscope
+    
+    if dashscope.api_key != config.dashscope_api_key:
+        dashscope.api_key = config.dashscope_api_key
+    return dashscope
 
 class SQLGenerator:
     """SQL生成器基类"""
     
     def __init__(self):
         self.api_key = config.dashscope_api_key
-        dashscope.api_key = self.api_key
+        self.example_store = None
+        self.token_budget = config.prompt_token_budget
+        self.dialect = get_dialect(config.db_dialect)
+        self.prompt_stats = {'prompts': 0, 'tokens': 0, 'max_tokens': 0, 'compressed': 0, 'over_budget': 0}
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+    
+    def count_tokens(self, text: str) -> int:
+        """统计文本token数（默认使用本地近似估算，有分词器的子类可覆盖）"""
+        return estimate_tokens(text)
+    
+    @property
+    def last_prompt_tokens(self) -> int:
+        """当前线程最近一次调用的提示词token数"""
+        return getattr(self._local, 'prompt_tokens', 0)
+    
+    def _add_dialect_hint(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """在系统提示词中加入目标数据库的语法说明"""
+        if self.dialect is not None and messages and messages[0]['role'] == 'system':
+            messages[0]['content'] = f"{messages[0]['content'].rstrip()}\n{self.dialect.prompt_hint}"
+        return messages
+    
+    def _messages(self, query: str, table_description, examples: str) -> List[Dict[str, str]]:
+        """构建发送给模型的完整提示词（包括方言说明）"""
+        return self._add_dialect_hint(self._build_messages(query, table_description, examples))
+    
+    def _call(self, messages: List[Dict[str, str]]):
+        """统计提示词token数并调用模型（messages已是完整提示词）"""
+        tokens = count_messages_tokens(messages, self.count_tokens)
+        self._local.prompt_tokens = tokens
+        with self._stats_lock:
+            self.prompt_stats['prompts'] += 1
+            self.prompt_stats['tokens'] += tokens
+            self.prompt_stats['max_tokens'] = max(self.prompt_stats['max_tokens'], tokens)
+        return self.get_response(messages)
+    
+    def _fit_table_description(self, query: str, table_description, examples: str = ""):
+        """
+        把表结构压缩到提示词预算内
+        
+        Args:
+            query: 自然语言查询
+            table_description: Schema对象或字段说明文本
+            examples: 注入提示词的示例（与实际发送的提示词相同）
+            
+        Returns:
+            压缩后的表结构（未超出预算时原样返回）
+        """
+        if not table_description or self.token_budget <= 0:
+            return table_description
+        
+        # 除表结构外的部分（包括方言说明和示例）都计入开销
+        overhead = count_messages_tokens(self._messages(query, '', examples), self.count_tokens)
+        budget = PromptBudget(self.token_budget - overhead, self.count_tokens)
+        text, level = budget.fit(table_description, query)
+        if level:
+            with self._stats_lock:
+                self.prompt_stats['compressed'] += 1
+                if level == LEVEL_OVER_BUDGET:
+                    self.prompt_stats['over_budget'] += 1
+        if level == LEVEL_OVER_BUDGET:
+            print(f"表结构压缩后仍超出提示词预算（预算 {self.token_budget}，其他部分已占 {overhead}）: {query[:50]}")
+        return text
+    
+    def report_prompt_stats(self) -> None:
+        """打印提示词token统计"""
+        stats = self.prompt_stats
+        if not stats['prompts']:
+            return
+        print(f"提示词数: {stats['prompts']}")
+        print(f"提示词总token数: {stats['tokens']}")
+        print(f"平均token数: {stats['tokens'] / stats['prompts']:.0f}")
+        print(f"最大token数: {stats['max_tokens']} (预算: {self.token_budget})")
+        print(f"压缩表结构次数: {stats['compressed']}")
+        if stats['over_budget']:
+            print(f"压缩后仍超出预算次数: {stats['over_budget']}")
+    
+    def _format_examples(self, query: str) -> str:
+        """获取注入提示词的已验证示例（未设置示例库时为空）"""
+        if self.example_store is None:
+            return ""
+        return self.example_store.format_examples(query)
     
     def get_response(self, messages: List[Dict[str, str]]):
         """获取模型响应（需要在子类中实现）"""
@@ -27,7 +119,7 @@ class SQLGenerator:
         
         Args:
             query: 自然语言查询
-            table_description: 数据表描述
+            table_description: 数据表描述（Schema对象或文本）
             
         Returns:
             (生成的SQL, 耗时)
@@ -44,8 +136,73 @@ class SQLGenerator:
             print(f"生成SQL时出错: {e}")
             return "", time.time() - start_time
     
+    def generate_sql_with_stats(self, query: str, table_description=None) -> Tuple[str, float, int]:
+        """
+        生成SQL查询，并返回本次提示词token数
+        
+        Args:
+            query: 自然语言查询
+            table_description: 数据表描述（Schema对象或文本）
+            
+        Returns:
+            (生成的SQL, 耗时, 提示词token数)
+        """
+        self._local.prompt_tokens = 0
+        sql, use_time = self.generate_sql(query, table_description)
+        return sql, use_time, self.last_prompt_tokens
+    
+    def repair_sql(self, query: str, sql: str, error: str,
+                   table_description: str = None) -> Tuple[str, float]:
+        """
+        根据数据库报错修复SQL
+        
+        Args:
+            query: 自然语言查询
+            sql: 执行失败的SQL
+            error: 数据库返回的错误信息
+            table_description: 数据表描述（Schema对象或文本，会被裁剪为SQL涉及的表）
+            
+        Returns:
+            (修复后的SQL, 耗时)
+        """
+        start_time = time.time()
+        
+        try:
+            schema = as_schema(table_description).prune(sql, error)
+            sys_prompt = """你是一个专业的SQL查询助手。下面的SQL执行时报错，请根据错误信息和数据表结构修正SQL，只输出修正后的一条SQL，使用```sql标记包围代码。"""
+            
+            user_prompt = f"""数据表结构：
+{schema}
+=====
+问题：{query}
+执行失败的SQL：
+```sql
+{sql}
+```
+数据库错误：{error[:500]}
+"""
+            
+            messages = [
+                {"role": "system", "content": sys_prompt},
+                {"role": "user", "content": user_prompt}
+            ]
+            
+            response = self._call(self._add_dialect_hint(messages))
+            repaired = extract_sql_code(response.output.choices[0].message.content)
+            return repaired, time.time() - start_time
+        except Exception as e:
+            print(f"修复SQL时出错: {e}")
+            return "", time.time() - start_time
+    
     def _get_sql_response(self, query: str, table_description: str = None):
-        """获取SQL响应（需要在子类中实现）"""
+        """获取SQL响应（示例只检索一次，压缩表结构和实际调用使用同一份）"""
+        examples = self._format_examples(query)
+        table_description = self._fit_table_description(query, table_description, examples)
+        return self._call(self._messages(query, table_description, examples))
+    
+    def _build_messages(self, query: str, table_description: str = None,
+                        examples: str = "") -> List[Dict[str, str]]:
+        """构建提示词消息（需要在子类中实现，examples为_format_examples的结果）"""
         raise NotImplementedError
 
 class QwenTurboGenerator(SQLGenerator):
@@ -57,7 +214,7 @@ class QwenTurboGenerator(SQLGenerator):
     
     def get_response(self, messages: List[Dict[str, str]]):
         """获取Qwen-turbo模型响应"""
-        response = dashscope.Generation.call(
+        response = _import_dashscope().Generation.call(
             model=self.model,
             messages=messages,
             result_format='message',
@@ -66,14 +223,15 @@ class QwenTurboGenerator(SQLGenerator):
         )
         return response
     
-    def _get_sql_response(self, query: str, table_description: str = None):
-        """获取SQL响应"""
+    def _build_messages(self, query: str, table_description: str = None,
+                        examples: str = "") -> List[Dict[str, str]]:
+        """构建提示词消息"""
         sys_prompt = """我正在编写SQL，以下是数据库中的数据表和字段，请思考：哪些数据表和字段是该SQL需要的，然后编写对应的SQL，如果有多个查询语句，请尝试合并为一个。编写SQL请采用```sql
         """
         
         user_prompt = f"""{table_description}
 =====
-我要写的SQL是：{query}
+{examples}我要写的SQL是：{query}
 请思考：哪些数据表和字段是该SQL需要的，然后编写对应的SQL
 """
         
@@ -82,7 +240,7 @@ class QwenTurboGenerator(SQLGenerator):
             {"role": "user", "content": user_prompt}
         ]
         
-        return self.get_response(messages)
+        return messages
 
 class QwenCoderGenerator(SQLGenerator):
     """使用Qwen-coder-plus模型生成SQL"""
@@ -93,7 +251,7 @@ class QwenCoderGenerator(SQLGenerator):
     
     def get_response(self, messages: List[Dict[str, str]]):
         """获取Qwen-coder-plus模型响应"""
-        response = dashscope.Generation.call(
+        response = _import_dashscope().Generation.call(
             model=self.model,
             messages=messages,
             result_format='message',
@@ -102,13 +260,14 @@ class QwenCoderGenerator(SQLGenerator):
         )
         return response
     
-    def _get_sql_response(self, query: str, table_description: str = None):
-        """获取SQL响应"""
+    def _build_messages(self, query: str, table_description: str = None,
+                        examples: str = "") -> List[Dict[str, str]]:
+        """构建提示词消息"""
         sys_prompt = """我正在编写SQL，以下是数据库中的数据表和字段，请思考：哪些数据表和字段是该SQL需要的，然后编写对应的SQL，如果有多个查询语句，请尝试合并为一个。编写SQL请采用```sql
         """
         
         user_prompt = f"""-- language: SQL
-### Question: {query}
+{examples}### Question: {query}
 ### Input: {table_description}
 ### Response:
 Here is the SQL query I have generated to answer the question `{query}`:
@@ -120,7 +279,25 @@ Here is the SQL query I have generated to answer the question `{query}`:
             {"role": "user", "content": user_prompt}
         ]
         
-        return self.get_response(messages)
+        return messages
+
+class LocalResponse:
+    """本地模型响应，模拟API响应格式（response.output.choices[0].message.content）"""
+    
+    class Message:
+        def __init__(self, content):
+            self.content = content
+    
+    class Choice:
+        def __init__(self, content):
+            self.message = LocalResponse.Message(content)
+    
+    class Output:
+        def __init__(self, content):
+            self.choices = [LocalResponse.Choice(content)]
+    
+    def __init__(self, content: str):
+        self.output = LocalResponse.Output(content)
 
 class LocalQwenGenerator(SQLGenerator):
     """使用本地Qwen模型生成SQL"""
@@ -130,6 +307,7 @@ class LocalQwenGenerator(SQLGenerator):
         self.model_path = model_path or config.local_model_path
         self.model = None
         self.tokenizer = None
+        self.scheduler = None
         self._load_model()
     
     def _load_model(self):
@@ -138,10 +316,16 @@ class LocalQwenGenerator(SQLGenerator):
             from modelscope import AutoModelForCausalLM, AutoTokenizer
             
             print(f"正在加载本地模型: {self.model_path}")
+            # safetensors权重通过mmap按需读入，分片运行的多个进程共享同一份页缓存，
+            # low_cpu_mem_usage避免先随机初始化再复制权重
+            use_safetensors = os.path.isdir(self.model_path) and any(
+                name.endswith('.safetensors') for name in os.listdir(self.model_path))
             self.model = AutoModelForCausalLM.from_pretrained(
                 self.model_path,
                 torch_dtype="auto",
-                device_map="auto"
+                device_map="auto",
+                low_cpu_mem_usage=True,
+                use_safetensors=use_safetensors or None
             )
             self.tokenizer = AutoTokenizer.from_pretrained(self.model_path)
             print("本地模型加载完成")
@@ -149,55 +333,79 @@ class LocalQwenGenerator(SQLGenerator):
             print(f"加载本地模型失败: {e}")
             print("请确保已安装modelscope和torch，并且模型路径正确")
     
+    def count_tokens(self, text: str) -> int:
+        """使用模型分词器统计token数（分词器未加载时使用近似估算）"""
+        if self.tokenizer is None:
+            return super().count_tokens(text)
+        return len(self.tokenizer.encode(text))
+    
+    def enable_batching(self, max_batch_size: int = None, max_wait_ms: float = None) -> None:
+        """
+        开启微批调度：并发调用get_response的请求会被合并为一次批量generate
+        
+        Args:
+            max_batch_size: 最大批次大小
+            max_wait_ms: 批次最长等待时间（毫秒）
+        """
+        from batch_scheduler import MicroBatchScheduler
+        
+        if self.scheduler is None:
+            self.scheduler = MicroBatchScheduler(
+                self.get_responses,
+                max_batch_size=max_batch_size or config.local_batch_size,
+                max_wait_ms=config.local_batch_wait_ms if max_wait_ms is None else max_wait_ms,
+                name='local-qwen-batch'
+            )
+    
     def get_response(self, messages: List[Dict[str, str]]):
-        """获取本地模型响应"""
+        """获取本地模型响应（开启微批调度时经由调度器合并处理）"""
+        if self.scheduler is not None:
+            return self.scheduler(messages)
+        return self.get_responses([messages])[0]
+    
+    def get_responses(self, messages_list: List[List[Dict[str, str]]]) -> List:
+        """
+        批量获取本地模型响应
+        
+        Args:
+            messages_list: 多组消息
+            
+        Returns:
+            与输入等长的响应列表
+        """
         if self.model is None or self.tokenizer is None:
             raise Exception("本地模型未正确加载")
         
-        text = self.tokenizer.apply_chat_template(
-            messages,
-            tokenize=False,
-            add_generation_prompt=True
-        )
+        texts = [
+            self.tokenizer.apply_chat_template(
+                messages,
+                tokenize=False,
+                add_generation_prompt=True
+            )
+            for messages in messages_list
+        ]
         
-        model_inputs = self.tokenizer([text], return_tensors="pt").to(self.model.device)
+        # 批量推理时左侧填充，保证各条生成内容都从同一位置开始
+        self.tokenizer.padding_side = 'left'
+        model_inputs = self.tokenizer(texts, return_tensors="pt", padding=True).to(self.model.device)
         generated_ids = self.model.generate(
             **model_inputs,
             max_new_tokens=512
         )
         
-        generated_ids = [
-            output_ids[len(input_ids):] for input_ids, output_ids in zip(model_inputs.input_ids, generated_ids)
-        ]
-        response = self.tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
-        
-        # 模拟API响应格式
-        class MockResponse:
-            def __init__(self, content):
-                self.output = MockOutput(content)
-        
-        class MockOutput:
-            def __init__(self, content):
-                self.choices = [MockChoice(content)]
-        
-        class MockChoice:
-            def __init__(self, content):
-                self.message = MockMessage(content)
-        
-        class MockMessage:
-            def __init__(self, content):
-                self.content = content
-        
-        return MockResponse(response)
+        input_length = model_inputs.input_ids.shape[1]
+        responses = self.tokenizer.batch_decode(generated_ids[:, input_length:], skip_special_tokens=True)
+        return [LocalResponse(response) for response in responses]
     
-    def _get_sql_response(self, query: str, table_description: str = None):
-        """获取SQL响应"""
+    def _build_messages(self, query: str, table_description: str = None,
+                        examples: str = "") -> List[Dict[str, str]]:
+        """构建提示词消息"""
         sys_prompt = """你是一个专业的SQL查询助手。请根据用户的问题和数据库表结构，生成准确的SQL查询语句。"""
         
         user_prompt = f"""数据库表结构：
 {table_description}
 
-用户问题：{query}
+{examples}用户问题：{query}
 
 请生成对应的SQL查询语句，使用```sql标记包围代码。"""
         
@@ -206,7 +414,7 @@ class LocalQwenGenerator(SQLGenerator):
             {"role": "user", "content": user_prompt}
         ]
         
-        return self.get_response(messages)
+        return messages
 
 class SQLGeneratorFactory:
     """SQL生成器工厂类"""
@@ -218,59 +426,115 @@ class SQLGeneratorFactory:
         
         Args:
             generator_type: 生成器类型 ("qwen_turbo", "qwen_coder", "local_qwen")
-            **kwargs: 额外参数
+            **kwargs: 额外参数（model_path, example_store, token_budget, dialect）
             
         Returns:
             SQL生成器实例
         """
         if generator_type == "qwen_turbo":
-            return QwenTurboGenerator()
+            generator = QwenTurboGenerator()
         elif generator_type == "qwen_coder":
-            return QwenCoderGenerator()
+            generator = QwenCoderGenerator()
         elif generator_type == "local_qwen":
             model_path = kwargs.get('model_path', config.local_model_path)
-            return LocalQwenGenerator(model_path)
+            generator = LocalQwenGenerator(model_path)
         else:
             raise ValueError(f"不支持的生成器类型: {generator_type}")
+        
+        generator.example_store = kwargs.get('example_store')
+        if kwargs.get('token_budget') is not None:
+            generator.token_budget = kwargs['token_budget']
+        if kwargs.get('dialect'):
+            generator.dialect = get_dialect(kwargs['dialect'])
+        return generator
+
+def _generate_each(generator: SQLGenerator, queries: Iterable[str], table_description: str = None,
+                   total: int = None) -> Iterator[Dict]:
+    """逐条生成SQL并打印进度，产出结果字典"""
+    for i, query in enumerate(queries):
+        print_progress(i + 1, total, query[:50] + "..." if len(query) > 50 else query)
+        
+        sql, use_time, prompt_tokens = generator.generate_sql_with_stats(query, table_description)
+        
+        print(f"SQL生成时间: {use_time:.2f}秒, 提示词token数: {prompt_tokens}")
+        print(f"生成的SQL: {sql[:100]}{'...' if len(sql) > 100 else ''}")
+        print("-" * 50)
+        
+        yield {
+            'QA': query,
+            'SQL': sql,
+            'time': round(use_time, 2),
+            'prompt_tokens': prompt_tokens
+        }
 
-def batch_generate_sql(queries: List[str], generator_type: str = "qwen_turbo", 
-                      table_description: str = None, output_file: str = None) -> List[Dict]:
+def batch_generate_sql(queries: Iterable[str], generator_type: str = "qwen_turbo", 
+                      table_description: str = None, output_file: str = None,
+                      example_store=None, token_budget: int = None) -> List[Dict]:
     """
     批量生成SQL查询
     
     Args:
-        queries: 查询列表
+        queries: 查询列表或迭代器
         generator_type: 生成器类型
         table_description: 数据表描述
         output_file: 输出文件路径
+        example_store: 已验证示例库（用于注入few-shot示例）
+        token_budget: 提示词token预算（默认使用配置）
         
     Returns:
         生成结果列表
     """
-    generator = SQLGeneratorFactory.create_generator(generator_type)
-    results = []
+    generator = SQLGeneratorFactory.create_generator(generator_type, example_store=example_store,
+                                                     token_budget=token_budget)
+    total = len(queries) if hasattr(queries, '__len__') else None
     
     print(f"开始批量生成SQL，使用模型: {generator_type}")
-    print(f"总共 {len(queries)} 个查询")
+    if total is not None:
+        print(f"总共 {total} 个查询")
     
-    for i, query in enumerate(queries):
-        print_progress(i + 1, len(queries), query[:50] + "..." if len(query) > 50 else query)
-        
-        sql, use_time = generator.generate_sql(query, table_description)
-        
-        result = {
-            'QA': query,
-            'SQL': sql,
-            'time': round(use_time, 2)
-        }
-        results.append(result)
-        
-        print(f"SQL生成时间: {use_time:.2f}秒")
-        print(f"生成的SQL: {sql[:100]}{'...' if len(sql) > 100 else ''}")
-        print("-" * 50)
+    results = list(_generate_each(generator, queries, table_description, total))
+    
+    generator.report_prompt_stats()
     
     if output_file:
         from utils import save_results_to_excel
         save_results_to_excel(results, output_file)
     
     return results
+
+def stream_generate_sql(queries: Iterable[str], output_file: str, generator_type: str = "qwen_turbo",
+                        table_description: str = None, chunk_size: int = None,
+                        example_store=None, token_budget: int = None) -> Dict:
+    """
+    流式批量生成SQL：逐条读取问题，按块追加写出结果，内存占用与问题数无关
+    
+    Args:
+        queries: 查询迭代器（如stream_io.iter_queries）
+        output_file: 输出文件路径（.csv/.jsonl）
+        generator_type: 生成器类型
+        table_description: 数据表描述
+        chunk_size: 每写出一块的行数
+        example_store: 已验证示例库（用于注入few-shot示例）
+        token_budget: 提示词token预算（默认使用配置）
+        
+    Returns:
+        统计信息字典 {'total': 问题数, 'time': 累计生成耗时}
+    """
+    from stream_io import iter_chunks, RecordWriter
+    
+    generator = SQLGeneratorFactory.create_generator(generator_type, example_store=example_store,
+                                                     token_budget=token_budget)
+    stats = {'total': 0, 'time': 0.0}
+    
+    print(f"开始流式生成SQL，使用模型: {generator_type}")
+    
+    with RecordWriter(output_file) as writer:
+        for chunk in iter_chunks(_generate_each(generator, queries, table_description),
+                                 chunk_size or config.eval_chunk_size):
+            writer.write(chunk)
+            stats['total'] += len(chunk)
+            stats['time'] += sum(result['time'] for result in chunk)
+    
+    generator.report_prompt_stats()
+    print(f"结果已保存到: {output_file}")
+    return stats
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+SQL规范化与去重模块 - 把写法不同但等价的SQL归一为同一个规范形式，相同语句只执行一次
+
+规范化会去掉注释和多余空白、关键字统一大写、去掉结尾分号、表别名按出现顺序统一改名为t1、t2...
+标识符保留原来的大小写和引号（MySQL在Linux上表名区分大小写，Users和users可能是不同的表）。
+安装了sqlglot时基于语法树规范化，否则使用基于词法的规范化。
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Any
+
+_TOKEN_PATTERN = re.compile(r"""
+    (?P<comment>--[^\n]*|\#[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+  | `(?P<quoted>[^`]*)`
+  | (?P<number>\d+(?:\.\d+)?)
+  | (?P<word>\w+)
+  | (?P<operator><=|>=|<>|!=|\|\||\S)
+""", re.VERBOSE | re.DOTALL)
+
+# 大小写不敏感、统一大写的关键字和常用函数名
+KEYWORDS = frozenset("""
+    SELECT DISTINCT FROM WHERE AND OR NOT IN IS NULL LIKE BETWEEN EXISTS AS ON USING
+    JOIN INNER LEFT RIGHT FULL OUTER CROSS NATURAL GROUP BY HAVING ORDER ASC DESC LIMIT OFFSET
+    UNION ALL INTERSECT EXCEPT CASE WHEN THEN ELSE END WITH RECURSIVE OVER PARTITION ROWS RANGE
+    INSERT INTO VALUES UPDATE SET DELETE REPLACE CREATE DROP ALTER TABLE VIEW INDEX TRUNCATE
+    TRUE FALSE INTERVAL DAY MONTH YEAR HOUR MINUTE SECOND WEEK QUARTER
+    COUNT SUM AVG MIN MAX ROUND IFNULL COALESCE CAST CONVERT CONCAT SUBSTRING LENGTH
+    DATE DATE_FORMAT DATE_SUB DATE_ADD DATEDIFF NOW CURDATE CURRENT_DATE
+    ROW_NUMBER RANK DENSE_RANK LAG LEAD IF
+""".split())
+
+# 表别名出现位置之后、离开FROM子句的关键字
+_CLAUSE_END = frozenset({'WHERE', 'GROUP', 'ORDER', 'HAVING', 'LIMIT', 'UNION', 'ON', 'USING', 'SELECT', ')'})
+
+_sqlglot = None
+
+def first_statement(sql: str) -> str:
+    """
+    取第一条语句（与SQLEvaluator.execute_sql实际执行的语句一致）
+
+    Args:
+        sql: SQL文本
+
+    Returns:
+        第一条语句
+    """
+    return (sql or '').split(';')[0].strip()
+
+def _tokenize(sql: str) -> List[str]:
+    """词法切分，去掉注释，关键字大写，其余词保持原样（带引号的标识符保留反引号）"""
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(sql):
+        kind = match.lastgroup
+        if kind == 'comment':
+            continue
+        if kind == 'word' and match.group('word').upper() in KEYWORDS:
+            tokens.append(match.group('word').upper())
+        else:
+            tokens.append(match.group())
+    return tokens
+
+def _normalize_tokens(sql: str) -> str:
+    """基于词法的规范化"""
+    tokens = _tokenize(sql)
+
+    # 找出 FROM/JOIN 之后的表别名：表名 [AS] 别名
+    aliases = {}
+    optional_as = set()
+    in_from = False
+    for index, token in enumerate(tokens):
+        if token in ('FROM', 'JOIN'):
+            in_from = True
+        elif token in _CLAUSE_END:
+            in_from = False
+            continue
+        elif token != ',' or not in_from:
+            continue
+
+        position = index + 1
+        if position >= len(tokens) or tokens[position] == '(' or tokens[position] in KEYWORDS:
+            continue
+        position += 1
+        # 库名.表名
+        while position + 1 < len(tokens) and tokens[position] == '.':
+            position += 2
+        has_as = position < len(tokens) and tokens[position] == 'AS'
+        if has_as:
+            position += 1
+        if position < len(tokens):
+            alias = tokens[position]
+            if alias not in KEYWORDS and re.fullmatch(r'\w+', alias) and alias not in aliases:
+                aliases[alias] = (position, f't{len(aliases) + 1}')
+                if has_as:
+                    optional_as.add(position - 1)
+
+    if aliases:
+        definitions = {position for position, _ in aliases.values()}
+        for index, token in enumerate(tokens):
+            alias = aliases.get(token)
+            # 只替换别名定义处和"别名.字段"中的别名，避免误改同名字段
+            if alias and (index in definitions or (index + 1 < len(tokens) and tokens[index + 1] == '.')):
+                tokens[index] = alias[1]
+
+    # "表名 AS 别名" 与 "表名 别名" 等价
+    return ' '.join(token for index, token in enumerate(tokens) if index not in optional_as)
+
+def _load_sqlglot():
+    """导入sqlglot（可选依赖），未安装时返回False"""
+    global _sqlglot
+    if _sqlglot is None:
+        try:
+            import sqlglot
+            _sqlglot = sqlglot
+        except ImportError:
+            _sqlglot = False
+    return _sqlglot
+
+def _normalize_ast(sql: str, dialect: str) -> str:
+    """基于sqlglot语法树的规范化（不做标识符的大小写归一，保留引号）"""
+    from sqlglot import exp
+
+    tree = _sqlglot.parse_one(sql, read=dialect)
+    aliases = {}
+    for table in tree.find_all(exp.Table):
+        if table.alias:
+            aliases.setdefault(table.alias, f't{len(aliases) + 1}')
+            table.set('alias', exp.TableAlias(this=exp.to_identifier(aliases[table.alias])))
+    for column in tree.find_all(exp.Column):
+        if column.table in aliases:
+            column.set('table', exp.to_identifier(aliases[column.table]))
+    return tree.sql(dialect=dialect, comments=False)
+
+def normalize_sql(sql: str, dialect: str = 'mysql') -> str:
+    """
+    把SQL规范化为去重用的键
+
+    Args:
+        sql: SQL文本（只取第一条语句）
+        dialect: SQL方言
+
+    Returns:
+        规范化后的SQL，空语句返回空字符串
+    """
+    statement = first_statement(sql)
+    if not statement:
+        return ''
+    if _load_sqlglot():
+        try:
+            return _normalize_ast(statement, dialect)
+        except Exception:
+            # sqlglot解析不了的语句退回词法规范化
+            pass
+    return _normalize_tokens(statement)
+
+class DedupExecutor:
+    """
+    按规范化SQL去重执行：相同语句只执行一次，结果分发给所有共享它的行
+
+    结果按LRU最多保留max_size条，超出时淘汰最久未使用的已完成结果；
+    正在执行的语句不会被淘汰，并发到达的重复语句总是共享同一次执行
+    """
+
+    def __init__(self, execute: Callable[[str], Any], dialect: str = 'mysql', max_size: int = 2000):
+        """
+        初始化去重执行器
+
+        Args:
+            execute: 实际执行SQL的函数
+            dialect: SQL方言
+            max_size: 最多保留的已完成结果数
+        """
+        self.execute = execute
+        self.dialect = dialect
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """清空结果（每次评测开始时调用，避免使用上一次运行的旧结果）"""
+        with self._lock:
+            self._results: 'OrderedDict[str, Future]' = OrderedDict()
+            self.total = 0
+            self.executed = 0
+            self.evicted = 0
+
+    def clear(self) -> None:
+        """丢弃已完成的结果但保留统计（流式评测每块结束时调用，内存不随块数增长）"""
+        with self._lock:
+            for key in [key for key, future in self._results.items() if future.done()]:
+                del self._results[key]
+
+    def _evict(self) -> None:
+        """淘汰最久未使用的已完成结果，直到不超过max_size（调用方持有锁）"""
+        if len(self._results) <= self.max_size:
+            return
+        for key in list(self._results):
+            if len(self._results) <= self.max_size:
+                break
+            if self._results[key].done():
+                del self._results[key]
+                self.evicted += 1
+
+    def __call__(self, sql: str) -> Any:
+        """
+        执行SQL；并发到达的重复语句等待第一次执行的结果
+
+        Args:
+            sql: SQL语句
+
+        Returns:
+            执行函数的返回值
+        """
+        key = normalize_sql(sql, self.dialect)
+        if not key:
+            return self.execute(sql)
+
+        with self._lock:
+            self.total += 1
+            future = self._results.get(key)
+            owner = future is None
+            if owner:
+                future = self._results[key] = Future()
+                self.executed += 1
+                self._evict()
+            else:
+                self._results.move_to_end(key)
+
+        if owner:
+            try:
+                future.set_result(self.execute(sql))
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    def stats(self) -> Dict:
+        """
+        去重统计
+
+        Returns:
+            {'total': 语句数, 'unique': 实际执行数, 'duplicates': 重复数, 'dedup_ratio': 重复占比,
+             'cached': 当前保留的结果数, 'evicted': 被淘汰的结果数}
+        """
+        with self._lock:
+            total, unique = self.total, self.executed
+            cached, evicted = len(self._results), self.evicted
+        return {
+            'total': total,
+            'unique': unique,
+            'duplicates': total - unique,
+            'dedup_ratio': round((total - unique) / total, 4) if total else 0,
+            'cached': cached,
+            'evicted': evicted
+        }
+
+    def report(self) -> None:
+        """打印去重统计"""
+        stats = self.stats()
+        if stats['total']:
+            print(f"SQL去重: {stats['total']} 条语句，实际执行 {stats['unique']} 条，"
+                  f"重复 {stats['duplicates']} 条（{stats['dedup_ratio'] * 100:.1f}%）")
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+SQL执行沙箱 - 评测时只允许执行白名单内的语句，并且事务总是回滚
+
+只读语句（SELECT/WITH/SHOW/DESCRIBE/EXPLAIN）在只读事务中执行；
+INSERT/UPDATE/DELETE 默认拒绝，开启后在普通事务中执行并回滚，只返回影响行数；
+DDL、锁定读（FOR UPDATE）、SELECT ... INTO 等语句，以及调用休眠、加锁、读文件等函数的语句始终拒绝。
+安装了sqlglot时基于语法树判断，sqlglot解析失败或未安装时基于词法判断。
+"""
+
+from typing import List, Tuple, Optional
+
+from sql_normalizer import first_statement, _TOKEN_PATTERN, _load_sqlglot
+
+READ = 'read'
+WRITE = 'write'
+
+READ_KEYWORDS = frozenset({'SELECT', 'WITH', 'SHOW', 'DESCRIBE', 'DESC', 'EXPLAIN'})
+WRITE_KEYWORDS = frozenset({'INSERT', 'UPDATE', 'DELETE'})
+
+# 只读语句中不允许出现的词（写操作、DDL、锁定读、导出文件、执行计划中实际运行语句）
+_FORBIDDEN_IN_READ = frozenset({
+    'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'MERGE', 'CREATE', 'DROP', 'ALTER', 'TRUNCATE',
+    'RENAME', 'GRANT', 'REVOKE', 'LOCK', 'UNLOCK', 'INTO', 'OUTFILE', 'DUMPFILE', 'ANALYZE',
+    'CALL', 'HANDLER', 'LOAD', 'SHARE'
+})
+
+# 写语句中不允许出现的词（DDL在MySQL中会隐式提交，无法回滚）
+_FORBIDDEN_IN_WRITE = frozenset({
+    'CREATE', 'DROP', 'ALTER', 'TRUNCATE', 'RENAME', 'GRANT', 'REVOKE', 'LOCK', 'UNLOCK',
+    'OUTFILE', 'DUMPFILE', 'CALL', 'LOAD', 'COMMIT'
+})
+
+# 不允许调用的函数（小写）：长时间占用连接、持有事务外的锁、读取服务器文件或影响其他会话，
+# 只读事务和回滚都无法限制它们
+_FORBIDDEN_FUNCTIONS = frozenset({
+    # MySQL
+    'sleep', 'benchmark', 'get_lock', 'release_lock', 'release_all_locks', 'is_free_lock', 'is_used_lock',
+    'load_file', 'master_pos_wait', 'source_pos_wait', 'wait_for_executed_gtid_set', 'wait_until_sql_thread_after_gtids',
+    # PostgreSQL
+    'pg_sleep', 'pg_sleep_for', 'pg_sleep_until',
+    'pg_advisory_lock', 'pg_advisory_lock_shared', 'pg_advisory_xact_lock', 'pg_advisory_xact_lock_shared',
+    'pg_try_advisory_lock', 'pg_try_advisory_lock_shared', 'pg_try_advisory_xact_lock',
+    'pg_try_advisory_xact_lock_shared', 'pg_advisory_unlock', 'pg_advisory_unlock_shared', 'pg_advisory_unlock_all',
+    'pg_read_file', 'pg_read_binary_file', 'pg_ls_dir', 'pg_stat_file', 'lo_import', 'lo_export',
+    'pg_terminate_backend', 'pg_cancel_backend', 'pg_reload_conf', 'set_config', 'dblink', 'dblink_exec',
+    # SQLite
+    'load_extension',
+})
+
+# 各数据库开启只读事务的语句：(执行前, 执行后恢复)
+READ_ONLY_STATEMENTS = {
+    'mysql': ('SET TRANSACTION READ ONLY', None),
+    'postgresql': ('SET TRANSACTION READ ONLY', None),
+    'sqlite': ('PRAGMA query_only = ON', 'PRAGMA query_only = OFF'),
+}
+
+def _words(statement: str) -> List[str]:
+    """
+    取出语句中可能是关键字的词（大写）
+
+    跳过注释、字符串、带引号的标识符、函数调用（后面紧跟左括号，如 REPLACE(...)）
+    和限定名中的字段（如 t.load），第一个词总是保留
+    """
+    tokens = [match for match in _TOKEN_PATTERN.finditer(statement) if match.lastgroup != 'comment']
+    words = []
+    for index, match in enumerate(tokens):
+        if match.lastgroup != 'word':
+            continue
+        if words:
+            following = tokens[index + 1].group() if index + 1 < len(tokens) else ''
+            preceding = tokens[index - 1].group() if index > 0 else ''
+            if following == '(' or preceding == '.':
+                continue
+        words.append(match.group('word').upper())
+    return words
+
+def _functions(statement: str) -> List[str]:
+    """取出语句中调用的函数名（小写，后面紧跟左括号的词，包括限定名如 pg_catalog.pg_sleep）"""
+    tokens = [match for match in _TOKEN_PATTERN.finditer(statement) if match.lastgroup != 'comment']
+    return [match.group('word').lower() for match, following in zip(tokens, tokens[1:])
+            if match.lastgroup == 'word' and following.group() == '(']
+
+def _forbidden_functions(names) -> str:
+    """不允许调用的函数，全部允许时返回空字符串"""
+    found = sorted(set(names) & _FORBIDDEN_FUNCTIONS)
+    if found:
+        return f"语句中调用了不允许的函数: {', '.join(found)}"
+    return ""
+
+def _classify_tokens(statement: str) -> Tuple[Optional[str], str]:
+    """基于词法的语句分类（不区分关键字和同名的未加引号标识符，只在sqlglot不可用时使用）"""
+    words = _words(statement)
+    if not words:
+        return None, "无法识别的SQL语句"
+
+    message = _forbidden_functions(_functions(statement))
+    if message:
+        return None, message
+
+    if words[0] in READ_KEYWORDS:
+        kind, forbidden = READ, _FORBIDDEN_IN_READ
+    elif words[0] in WRITE_KEYWORDS:
+        kind, forbidden = WRITE, _FORBIDDEN_IN_WRITE
+    else:
+        return None, f"不允许执行 {words[0]} 语句"
+
+    found = sorted(set(words) & forbidden)
+    if found:
+        return None, f"语句中包含不允许的操作: {', '.join(found)}"
+    return kind, ""
+
+def _classify_ast(statement: str, dialect: str) -> Tuple[Optional[str], str]:
+    """基于sqlglot语法树的语句分类"""
+    from sqlglot import exp
+
+    tree = _load_sqlglot().parse_one(statement, read=dialect)
+    # 不同sqlglot版本的节点类名略有不同，按存在的类判断
+    def node_types(*names):
+        return tuple(getattr(exp, name) for name in names if hasattr(exp, name))
+
+    read_types = node_types('Select', 'Union', 'Intersect', 'Except', 'Subquery', 'Show', 'Describe')
+    write_types = node_types('Insert', 'Update', 'Delete')
+    forbidden = node_types('Create', 'Drop', 'Alter', 'AlterTable', 'TruncateTable', 'Command',
+                           'Merge', 'Into', 'Lock', 'LoadData', 'Grant')
+
+    if isinstance(tree, read_types):
+        kind = READ
+        forbidden += write_types
+        # EXPLAIN ANALYZE 会实际执行语句
+        if str(tree.args.get('style') or '').upper() == 'ANALYZE':
+            return None, "语句中包含不允许的操作: ANALYZE"
+    elif isinstance(tree, write_types):
+        kind = WRITE
+    else:
+        return None, f"不允许执行 {tree.key.upper()} 语句"
+
+    node = tree.find(*forbidden)
+    if node is not None:
+        return None, f"语句中包含不允许的操作: {node.key.upper()}"
+
+    message = _forbidden_functions(
+        (function.name if isinstance(function, exp.Anonymous) else function.sql_name()).lower()
+        for function in tree.find_all(exp.Func))
+    if message:
+        return None, message
+    return kind, ""
+
+def classify_statement(sql: str, dialect: str = 'mysql') -> Tuple[Optional[str], str]:
+    """
+    判断第一条语句的类型
+
+    Args:
+        sql: SQL文本（只取第一条语句，与实际执行的一致）
+        dialect: SQL方言
+
+    Returns:
+        (READ/WRITE，不允许执行时为None, 原因)
+    """
+    statement = first_statement(sql)
+    if not statement:
+        return None, "SQL语句为空"
+
+    if _load_sqlglot():
+        try:
+            return _classify_ast(statement, dialect)
+        except Exception:
+            # sqlglot解析不了的语句以词法判断为准
+            pass
+    return _classify_tokens(statement)
+
+def check_statement(sql: str, allow_writes: bool = False, dialect: str = 'mysql') -> Tuple[bool, Optional[str], str]:
+    """
+    检查语句是否允许在沙箱中执行
+
+    Args:
+        sql: SQL文本
+        allow_writes: 是否允许写语句（执行后回滚）
+        dialect: SQL方言
+
+    Returns:
+        (是否允许, 语句类型, 原因)
+    """
+    kind, message = classify_statement(sql, dialect)
+    if kind is None:
+        return False, None, message
+    if kind == WRITE and not allow_writes:
+        return False, kind, "评测只允许只读查询"
+    return True, kind, ""
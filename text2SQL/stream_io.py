@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+流式读写模块 - 按块读取和增量写出大文件，内存占用与行数无关
+
+支持的输入格式：CSV、JSONL、Parquet（需要pyarrow）、Excel（需要openpyxl，只读流式模式）
+支持的输出格式：CSV、JSONL（追加写入，支持断点续跑）
+查询问题文件：=====分隔的文本、JSONL、CSV，逐条产出清理后的问题，支持去重和分片
+"""
+
+import csv
+import hashlib
+import json
+import os
+from itertools import islice
+from typing import Iterator, Iterable, List, Dict
+
+# JSONL/CSV问题文件中依次尝试的问题字段名
+QUESTION_FIELDS = ('QA', 'question', 'query', '问题')
+
+def iter_records(file_path: str, batch_size: int = 1000) -> Iterator[Dict]:
+    """
+    逐行读取记录
+
+    Args:
+        file_path: 输入文件路径（.csv/.jsonl/.parquet/.xlsx）
+        batch_size: Parquet按批读取的行数
+
+    Returns:
+        记录字典的迭代器
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+
+    if ext == '.csv':
+        with open(file_path, 'r', encoding='utf-8-sig', newline='') as file:
+            yield from csv.DictReader(file)
+    elif ext in ('.jsonl', '.ndjson'):
+        with open(file_path, 'r', encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+    elif ext == '.parquet':
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(file_path).iter_batches(batch_size=batch_size):
+            yield from batch.to_pylist()
+    elif ext in ('.xlsx', '.xlsm'):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(file_path, read_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(cell) if cell is not None else '' for cell in next(rows, ())]
+            for row in rows:
+                yield dict(zip(header, row))
+        finally:
+            workbook.close()
+    else:
+        raise ValueError(f"不支持的输入格式: {ext}")
+
+def iter_chunks(records: Iterable, chunk_size: int) -> Iterator[List]:
+    """
+    按块切分迭代器
+
+    Args:
+        records: 记录迭代器
+        chunk_size: 每块行数
+
+    Returns:
+        记录列表的迭代器
+    """
+    iterator = iter(records)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def _iter_separated(file_path: str, separator: str) -> Iterator[str]:
+    """按分隔符逐段读取文本文件（逐行读取，只缓存当前一段）"""
+    with open(file_path, 'r', encoding='utf-8') as file:
+        buffer = []
+        for line in file:
+            parts = line.split(separator)
+            buffer.append(parts[0])
+            for part in parts[1:]:
+                yield ''.join(buffer)
+                buffer = [part]
+        yield ''.join(buffer)
+
+def _question_of(record: Dict) -> str:
+    """取记录中的问题字段"""
+    for field in QUESTION_FIELDS:
+        value = record.get(field)
+        if value is not None:
+            return str(value)
+    return ''
+
+def iter_queries(file_path: str, dedup: bool = False, shards: int = 1, shard_index: int = 0,
+                 separator: str = '=====') -> Iterator[str]:
+    """
+    逐条读取查询问题
+    
+    Args:
+        file_path: 问题文件路径（.jsonl/.csv按记录读取，其他格式按分隔符切分）
+        dedup: 是否跳过重复的问题（只保存问题的摘要）
+        shards: 分片总数
+        shard_index: 当前分片序号（0开始），只产出序号 i % shards == shard_index 的问题
+        separator: 文本文件的问题分隔符
+        
+    Returns:
+        清理后的问题迭代器（跳过空问题）
+    """
+    from utils import clean_query
+    
+    if not 0 <= shard_index < shards:
+        raise ValueError(f"分片序号必须在0到{shards - 1}之间: {shard_index}")
+    
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in ('.jsonl', '.ndjson', '.csv'):
+        texts = (_question_of(record) for record in iter_records(file_path))
+    else:
+        texts = _iter_separated(file_path, separator)
+    
+    seen = set()
+    index = 0
+    for text in texts:
+        query = clean_query(text)
+        if not query:
+            continue
+        if dedup:
+            digest = hashlib.blake2b(query.encode('utf-8'), digest_size=8).digest()
+            if digest in seen:
+                continue
+            seen.add(digest)
+        # 去重之后再编号，各分片看到的编号一致
+        if index % shards == shard_index:
+            yield query
+        index += 1
+
+def count_records(file_path: str) -> int:
+    """
+    统计已写出的记录数（用于断点续跑），文件不存在时返回0
+
+    Args:
+        file_path: 输出文件路径（.csv/.jsonl）
+
+    Returns:
+        记录数
+    """
+    if not os.path.exists(file_path):
+        return 0
+    if os.path.splitext(file_path)[1].lower() in ('.jsonl', '.ndjson'):
+        # 只统计完整的行（中断时最后一行可能没有写完）
+        count = 0
+        with open(file_path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                count += block.count(b'\n')
+        return count
+    return sum(1 for _ in iter_records(file_path))
+
+def _truncate_partial_line(file_path: str) -> None:
+    """截掉文件末尾没有写完的行"""
+    with open(file_path, 'rb+') as file:
+        size = file.seek(0, os.SEEK_END)
+        position = size
+        while position > 0:
+            step = min(4096, position)
+            file.seek(position - step)
+            block = file.read(step)
+            index = block.rfind(b'\n')
+            if index >= 0:
+                position = position - step + index + 1
+                break
+            position -= step
+        if position != size:
+            file.truncate(position)
+
+class RecordWriter:
+    """增量写出记录（追加模式，每块写完后刷盘）"""
+
+    def __init__(self, file_path: str, append: bool = False):
+        """
+        初始化写出器
+
+        Args:
+            file_path: 输出文件路径（.csv/.jsonl）
+            append: 是否追加到已有文件（断点续跑）
+        """
+        self.file_path = file_path
+        self.ext = os.path.splitext(file_path)[1].lower()
+        if self.ext not in ('.csv', '.jsonl', '.ndjson'):
+            raise ValueError(f"流式输出只支持.csv或.jsonl格式: {file_path}")
+
+        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+        if append and self.ext != '.csv' and os.path.exists(file_path):
+            _truncate_partial_line(file_path)
+        self._has_header = append and os.path.exists(file_path) and os.path.getsize(file_path) > 0
+        self._file = open(file_path, 'a' if append else 'w', encoding='utf-8', newline='')
+        self._csv_writer = None
+
+        if self.ext == '.csv' and self._has_header:
+            with open(file_path, 'r', encoding='utf-8-sig', newline='') as file:
+                fieldnames = next(csv.reader(file), [])
+            self._csv_writer = csv.DictWriter(self._file, fieldnames=fieldnames, extrasaction='ignore')
+
+    def write(self, records: List[Dict]) -> None:
+        """写出一块记录并刷盘"""
+        if not records:
+            return
+
+        if self.ext == '.csv':
+            if self._csv_writer is None:
+                self._csv_writer = csv.DictWriter(self._file, fieldnames=list(records[0]), extrasaction='ignore')
+                self._csv_writer.writeheader()
+            self._csv_writer.writerows(records)
+        else:
+            for record in records:
+                self._file.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        """关闭文件"""
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,554 @@
+# -*- coding: utf-8 -*-
+"""
+汇总表模块 - 为常见的游戏经济报表预先聚合数据
+
+汇总表由原始表按维度分组聚合得到（只包含可累加的COUNT/SUM度量），用法：
+1. 构建/刷新：python summary_tables.py --refresh（财务记录按自增id增量刷新，其余全量刷新，目前只支持MySQL）
+2. 设置 SUMMARY_TABLES=1：提示词中加入汇总表说明，评测执行前把能由汇总表回答的聚合查询改写为查询汇总表
+
+改写需要安装sqlglot；只改写单表、分组键和过滤条件都能映射到汇总表维度、聚合都能由度量重新聚合得到的查询，
+并且只使用目标数据库中刷新过、距上次刷新不超过 SUMMARY_MAX_STALENESS 秒的汇总表。
+增量刷新的汇总表只包含刷新时已写入超过 SUMMARY_SETTLE_SECONDS 秒的记录，
+查询的时间条件必须全部落在这之前才改写（如 DATE(createTime) = CURDATE() 查询原始表）。
+"""
+
+import argparse
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import List, Tuple, Optional, Dict, Set
+
+from config import config
+from schema_model import Schema, Table, Column
+
+STATE_TABLE = 'summary_refresh_state'
+
+# 改写时缓存刷新状态的时间（秒），避免每条查询都读一次状态表
+STATE_CACHE_SECONDS = 30
+
+class SummaryTable:
+    """汇总表定义"""
+
+    def __init__(self, name: str, title: str, description: str, source: str,
+                 dimensions: List[Tuple[str, str, str, str]], measures: List[Tuple[str, str, str, str]],
+                 incremental_key: str = None, settle_column: str = None):
+        """
+        初始化汇总表定义
+
+        Args:
+            name: 汇总表名
+            title: 中文表名
+            description: 表说明
+            source: 原始表名
+            dimensions: 维度列表 [(字段名, 原始表表达式, 类型, 说明)]
+            measures: 度量列表 [(字段名, 聚合表达式COUNT/SUM, 类型, 说明)]
+            incremental_key: 原始表只增不改时用于增量刷新的自增字段
+            settle_column: 记录写入时间字段；增量刷新只推进到写入超过一段时间的记录，
+                避免自增id较小、提交较晚的记录被水位线跳过
+        """
+        self.name = name
+        self.title = title
+        self.description = description
+        self.source = source
+        self.dimensions = dimensions
+        self.measures = measures
+        self.incremental_key = incremental_key
+        self.settle_column = settle_column
+
+    @property
+    def columns(self) -> List[Tuple[str, str, str, str]]:
+        return self.dimensions + self.measures
+
+    def to_table(self) -> Table:
+        """转换为表结构模型中的数据表（用于提示词）"""
+        key = [name for name, _, _, _ in self.dimensions]
+        columns = [Column(name, type, nullable=name not in key, primary_key=name in key, description=description)
+                   for name, _, type, description in self.columns]
+        return Table(self.name, self.title, self.description, columns, key)
+
+    def create_sql(self) -> str:
+        """建表语句"""
+        columns = ',\n'.join(f"    {name} {type}" for name, _, type, _ in self.columns)
+        key = ', '.join(name for name, _, _, _ in self.dimensions)
+        return f"CREATE TABLE IF NOT EXISTS {self.name} (\n{columns},\n    PRIMARY KEY ({key})\n)"
+
+    def select_sql(self, where: str = '') -> str:
+        """从原始表聚合的查询语句"""
+        expressions = ', '.join(expression for _, expression, _, _ in self.columns)
+        group_by = ', '.join(expression for _, expression, _, _ in self.dimensions)
+        return f"SELECT {expressions} FROM {self.source}{where} GROUP BY {group_by}"
+
+SUMMARY_TABLES = [
+    SummaryTable(
+        'summary_game_type_coins', '游戏类型金币汇总表',
+        '按游戏类型汇总的用户数和金币数（由users表汇总）', 'users',
+        dimensions=[('gameType', 'gameType', 'varchar(10) NOT NULL', '游戏类型')],
+        measures=[
+            ('user_count', 'COUNT(*)', 'bigint NOT NULL', '用户数'),
+            ('coin_user_count', 'COUNT(coins)', 'bigint NOT NULL', '金币不为空的用户数'),
+            ('total_coins', 'SUM(coins)', 'decimal(38,2)', '金币总数'),
+        ]),
+    SummaryTable(
+        'summary_user_daily_win_coins', '用户每日输赢汇总表',
+        '按用户和日期汇总的游戏局数和赢得金币（由z_financial_game_records_20250920表汇总）',
+        'z_financial_game_records_20250920',
+        dimensions=[
+            ('userId', 'userId', 'int(11) NOT NULL', '用户ID'),
+            ('day', 'DATE(createTime)', 'date NOT NULL', '日期'),
+        ],
+        measures=[
+            ('game_count', 'COUNT(*)', 'bigint NOT NULL', '游戏局数'),
+            ('win_coins', 'SUM(winCoins)', 'bigint NOT NULL', '赢得金币合计'),
+        ],
+        incremental_key='id', settle_column='createTime'),
+    SummaryTable(
+        'summary_tea_house_rooms', '茶馆房间汇总表',
+        '按茶馆汇总的房间数（由room表汇总）', 'room',
+        dimensions=[('teaHouseId', 'teaHouseId', 'int(11) NOT NULL', '茶馆ID')],
+        measures=[
+            ('room_count', 'COUNT(*)', 'bigint NOT NULL', '房间数'),
+            ('total_turns', 'SUM(numOfTurns)', 'bigint NOT NULL', '游戏轮数合计'),
+        ]),
+]
+
+def add_summary_tables(schema: Schema, names: Set[str] = None) -> Schema:
+    """
+    在表结构模型中加入汇总表（生成SQL时可直接使用）
+
+    Args:
+        schema: 原始表结构模型
+        names: 只加入这些汇总表，None表示全部加入
+
+    Returns:
+        加入汇总表后的新模型
+    """
+    tables = list(schema.tables)
+    tables.extend(summary.to_table() for summary in SUMMARY_TABLES
+                  if schema.table(summary.name) is None and (names is None or summary.name in names))
+    return Schema(tables)
+
+# 提示词使用的刷新状态读取器（连接主目标数据库，首次使用时创建）
+_prompt_reader: Optional['SummaryRewriter'] = None
+
+def fresh_summary_names() -> Set[str]:
+    """
+    主目标数据库中刷新过且没有过期的汇总表名（提示词中只加入这些汇总表，缓存STATE_CACHE_SECONDS秒）
+
+    Returns:
+        汇总表名集合；数据库无法访问或汇总表还没有构建时为空集合
+    """
+    global _prompt_reader
+    if _prompt_reader is None:
+        try:
+            from sqlalchemy import create_engine
+
+            engine = create_engine(config.get_database_url())
+        except Exception as e:
+            print(f"读取汇总表刷新状态出错，提示词中不加入汇总表: {e}")
+            return set()
+        _prompt_reader = SummaryRewriter(engine=engine, max_staleness=config.summary_max_staleness)
+    return set(_prompt_reader.fresh_summaries())
+
+def refresh_summary_tables(database_url: str = None, full: bool = False,
+                           settle_seconds: int = 300) -> Dict[str, Dict]:
+    """
+    构建并刷新汇总表（刷新语句使用ON DUPLICATE KEY UPDATE、REPLACE INTO，目前只支持MySQL）
+
+    Args:
+        database_url: 数据库连接URL（需要写权限）
+        full: 是否强制全量刷新
+        settle_seconds: 增量刷新只处理写入超过这么多秒的记录，更晚的留到下次刷新
+
+    Returns:
+        {汇总表名: {'mode', 'rows', 'time'}}
+    """
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(database_url or config.get_database_url())
+    if engine.dialect.name != 'mysql':
+        engine.dispose()
+        raise ValueError(f"汇总表刷新目前只支持MySQL，当前数据库: {engine.dialect.name}")
+
+    report = {}
+    try:
+        with engine.begin() as connection:
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {STATE_TABLE} ("
+                f"name varchar(64) NOT NULL, watermark bigint NOT NULL DEFAULT 0, "
+                f"refreshed_at timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (name))"))
+
+        for summary in SUMMARY_TABLES:
+            start_time = time.time()
+            # 每张汇总表在一个事务中刷新，刷新过程中查询看到的仍是旧数据
+            with engine.begin() as connection:
+                connection.execute(text(summary.create_sql()))
+                row = connection.execute(text(f"SELECT watermark FROM {STATE_TABLE} WHERE name = :name"),
+                                         {'name': summary.name}).first()
+                watermark = row[0] if row else None
+
+                columns = ', '.join(name for name, _, _, _ in summary.columns)
+                key = summary.incremental_key
+                params = {}
+                if key:
+                    # 本次刷新的上界，刷新过程中新写入的记录留到下次刷新。
+                    # 自增id在插入时分配、提交顺序可能不同，直接取MAX(id)会让还没提交的较小id被水位线跳过，
+                    # 所以只推进到写入超过settle_seconds秒的记录
+                    settled = ''
+                    if summary.settle_column:
+                        settled = f" WHERE {summary.settle_column} <= NOW() - INTERVAL :settle SECOND"
+                        params['settle'] = settle_seconds
+                    params['high'] = connection.execute(
+                        text(f"SELECT MAX({key}) FROM {summary.source}{settled}"), params).scalar() or 0
+                    params.pop('settle', None)
+
+                if key and watermark is not None and not full:
+                    mode = 'incremental'
+                    params['low'] = watermark
+                    updates = ', '.join(f"{name} = {name} + VALUES({name})" for name, _, _, _ in summary.measures)
+                    result = connection.execute(text(
+                        f"INSERT INTO {summary.name} ({columns}) "
+                        f"{summary.select_sql(f' WHERE {key} > :low AND {key} <= :high')} "
+                        f"ON DUPLICATE KEY UPDATE {updates}"), params)
+                else:
+                    mode = 'full'
+                    connection.execute(text(f"DELETE FROM {summary.name}"))
+                    where = f' WHERE {key} <= :high' if key else ''
+                    result = connection.execute(text(
+                        f"INSERT INTO {summary.name} ({columns}) {summary.select_sql(where)}"), params)
+
+                connection.execute(text(
+                    f"REPLACE INTO {STATE_TABLE} (name, watermark, refreshed_at) "
+                    f"VALUES (:name, :watermark, CURRENT_TIMESTAMP)"),
+                    {'name': summary.name, 'watermark': params.get('high', 0)})
+
+            report[summary.name] = {'mode': mode, 'rows': result.rowcount, 'time': round(time.time() - start_time, 3)}
+            print(f"{summary.name}: {mode} 刷新，写入 {result.rowcount} 行，耗时 {report[summary.name]['time']}秒")
+    finally:
+        engine.dispose()
+    return report
+
+class SummaryRewriter:
+    """把能由汇总表回答的聚合查询改写为查询汇总表"""
+
+    def __init__(self, schema: Schema = None, summaries: List[SummaryTable] = None, dialect: str = 'mysql',
+                 engine=None, max_staleness: float = 300, settle_seconds: float = 300):
+        """
+        初始化改写器
+
+        Args:
+            schema: 原始表结构模型（用于判断字段是否可为空）
+            summaries: 汇总表定义
+            dialect: SQL方言
+            engine: 执行查询的数据库引擎，从中读取汇总表的刷新状态；为None时不改写
+            max_staleness: 距上次刷新超过这么多秒的汇总表不再使用，0表示只要求刷新过
+            settle_seconds: 与刷新时的settle_seconds相同；增量刷新的汇总表只改写时间条件
+                全部早于“刷新时间 - settle_seconds”的查询
+        """
+        self.schema = schema
+        self.summaries = summaries or SUMMARY_TABLES
+        self.dialect = dialect
+        self.engine = engine
+        self.max_staleness = max_staleness
+        self.settle_seconds = settle_seconds
+        self._lock = threading.Lock()
+        self._fresh: Optional[Dict[str, datetime]] = None
+        self._fresh_at = 0.0
+        self.reset()
+
+    def reset(self) -> None:
+        """清空改写统计和缓存的刷新状态"""
+        with self._lock:
+            self.total = 0
+            self.rewritten = 0
+            self.stale = 0
+            self._fresh = None
+
+    def fresh_summaries(self) -> Dict[str, datetime]:
+        """
+        读取刷新状态，返回可以使用的汇总表（缓存STATE_CACHE_SECONDS秒）
+
+        Returns:
+            {刷新过且没有过期的汇总表名: 刷新时间（数据库时钟）}；没有引擎或没有刷新状态表时为空字典
+        """
+        with self._lock:
+            if self._fresh is not None and time.time() - self._fresh_at < STATE_CACHE_SECONDS:
+                return self._fresh
+
+        fresh = {}
+        if self.engine is not None:
+            try:
+                from sqlalchemy import text
+
+                # 刷新时间和当前时间都取数据库时钟，避免时区和时钟偏差
+                with self.engine.connect() as connection:
+                    rows = connection.execute(text(
+                        f"SELECT name, refreshed_at, CURRENT_TIMESTAMP FROM {STATE_TABLE}")).fetchall()
+                for name, refreshed_at, now in rows:
+                    age = (_as_datetime(now) - _as_datetime(refreshed_at)).total_seconds()
+                    if not self.max_staleness or age <= self.max_staleness:
+                        fresh[name] = _as_datetime(refreshed_at)
+            except Exception:
+                # 数据库中没有刷新状态表，汇总表还没有构建
+                pass
+
+        with self._lock:
+            self._fresh, self._fresh_at = fresh, time.time()
+        return fresh
+
+    def _covers(self, tree, summary: SummaryTable, refreshed_at: datetime) -> bool:
+        """
+        改写后的查询是否只用到汇总表中已完整的数据
+
+        增量刷新的汇总表只包含刷新时写入超过settle_seconds秒的记录，WHERE中日期维度的
+        上界（只认字面量日期；CURDATE()、NOW()等无法确定）必须早于这个时间所在的日期
+        """
+        if not summary.settle_column:
+            return True
+        day = next((name for name, expression, _, _ in summary.dimensions
+                    if summary.settle_column.lower() in expression.lower()), None)
+        where = tree.args.get('where')
+        upper = _day_upper_bound(where.this, day) if where is not None and day else None
+        cutoff = (refreshed_at - timedelta(seconds=self.settle_seconds)).date()
+        return upper is not None and upper < cutoff
+
+    def _count_key(self, summary: SummaryTable, column: str) -> str:
+        """COUNT(字段)的度量键：字段不可为空时等价于COUNT(*)"""
+        table = self.schema.table(summary.source) if self.schema is not None else None
+        definition = table.column(column) if table is not None else None
+        if definition is not None and not definition.nullable:
+            return 'COUNT(*)'
+        return f'COUNT({column.lower()})'
+
+    def _rewrite_select(self, tree, summary: SummaryTable, table):
+        """按汇总表改写单表聚合查询，无法改写时返回None（或抛出ValueError）"""
+        from sqlglot import exp
+
+        alias = table.alias_or_name.lower()
+
+        def unqualified(node) -> str:
+            node = node.copy()
+            for column in node.find_all(exp.Column):
+                if column.table.lower() not in ('', alias):
+                    raise ValueError(column.table)
+                column.set('table', None)
+            return node.sql(dialect=self.dialect).lower()
+
+        def aggregate_key(node) -> Optional[str]:
+            argument = node.this
+            if isinstance(node, exp.Count):
+                if isinstance(argument, exp.Star) or (isinstance(argument, exp.Literal) and argument.is_int):
+                    return 'COUNT(*)'
+                if isinstance(argument, exp.Column):
+                    return self._count_key(summary, argument.name)
+                return None
+            if isinstance(node, exp.Sum):
+                return unqualified(node)
+            return None
+
+        dimensions = {unqualified(exp.maybe_parse(expression, dialect=self.dialect)): name
+                      for name, expression, _, _ in summary.dimensions}
+        measures = {aggregate_key(exp.maybe_parse(expression, dialect=self.dialect)): name
+                    for name, expression, _, _ in summary.measures}
+
+        grouped = tree.args.get('group') is not None
+
+        def measure(key: Optional[str]):
+            # 度量在汇总表中已按维度聚合，按更粗的分组重新求和即可
+            name = measures.get(key) if key else None
+            if not name:
+                return None
+            total = exp.Sum(this=exp.column(name))
+            if key.startswith('COUNT') and not grouped:
+                # 不分组且没有匹配行时COUNT返回0，SUM返回NULL
+                return exp.Coalesce(this=total, expressions=[exp.Literal.number(0)])
+            return total
+
+        def replace(node):
+            if isinstance(node, exp.AggFunc):
+                if isinstance(node, exp.Avg) and isinstance(node.this, exp.Column):
+                    total = measure(aggregate_key(exp.Sum(this=node.this.copy())))
+                    count = measure(aggregate_key(exp.Count(this=node.this.copy())))
+                    replaced = exp.Div(this=total, expression=count) if total and count else None
+                else:
+                    replaced = measure(aggregate_key(node))
+                if replaced is None:
+                    raise ValueError(node.sql())
+                return replaced
+            if isinstance(node, (exp.Column, exp.Func)):
+                name = dimensions.get(unqualified(node))
+                if name:
+                    return exp.column(name)
+            return node
+
+        original = [projection.alias_or_name if isinstance(projection, (exp.Alias, exp.Column))
+                    else projection.sql(dialect=self.dialect)
+                    for projection in tree.expressions]
+        rewritten = tree.copy()
+        for arg in ('expressions', 'where', 'group', 'having', 'order'):
+            value = rewritten.args.get(arg)
+            if value is None:
+                continue
+            if isinstance(value, list):
+                rewritten.set(arg, [item.transform(replace) for item in value])
+            else:
+                rewritten.set(arg, value.transform(replace))
+
+        # 改写后不能再引用汇总表中没有的字段
+        allowed = {name.lower() for name, _, _, _ in summary.columns}
+        projection_aliases = {projection.alias.lower() for projection in rewritten.expressions
+                              if isinstance(projection, exp.Alias)}
+        for column in rewritten.find_all(exp.Column):
+            if column.name.lower() not in allowed and column.name.lower() not in projection_aliases:
+                return None
+
+        # 保持输出列名不变
+        projections = []
+        for projection, name in zip(rewritten.expressions, original):
+            if not isinstance(projection, exp.Alias) and projection.sql(dialect=self.dialect) != name:
+                projection = exp.alias_(projection, name, quoted=True)
+            projections.append(projection)
+        rewritten.set('expressions', projections)
+        rewritten.find(exp.From).set('this', exp.to_table(summary.name))
+        return rewritten
+
+    def rewrite(self, sql: str) -> Tuple[str, Optional[str]]:
+        """
+        尝试把查询改写为查询汇总表
+
+        Args:
+            sql: 单条SQL语句
+
+        Returns:
+            (改写后的SQL, 使用的汇总表名)，无法改写时返回 (原SQL, None)
+        """
+        from sql_normalizer import _load_sqlglot
+
+        sqlglot = _load_sqlglot()
+        if not sqlglot:
+            return sql, None
+
+        with self._lock:
+            self.total += 1
+        try:
+            from sqlglot import exp
+
+            tree = sqlglot.parse_one(sql, read=self.dialect)
+            source = tree.find(exp.From) if isinstance(tree, exp.Select) else None
+            table = source.this if source is not None else None
+            if (not isinstance(table, exp.Table) or tree.args.get('joins') or tree.args.get('with')
+                    or tree.args.get('distinct') or tree.find(exp.Subquery, exp.Window)
+                    or not tree.find(exp.AggFunc)):
+                return sql, None
+
+            for summary in self.summaries:
+                if summary.source.lower() != table.name.lower():
+                    continue
+                refreshed_at = self.fresh_summaries().get(summary.name)
+                if refreshed_at is None:
+                    # 汇总表没有刷新过或已过期，查询原始表
+                    with self._lock:
+                        self.stale += 1
+                    continue
+                try:
+                    rewritten = self._rewrite_select(tree, summary, table)
+                except ValueError:
+                    rewritten = None
+                if rewritten is not None and not self._covers(rewritten, summary, refreshed_at):
+                    # 查询的时间范围包含汇总表还没有收录的记录，查询原始表
+                    with self._lock:
+                        self.stale += 1
+                    rewritten = None
+                if rewritten is not None:
+                    with self._lock:
+                        self.rewritten += 1
+                    return rewritten.sql(dialect=self.dialect), summary.name
+        except Exception:
+            pass
+        return sql, None
+
+    def stats(self) -> Dict:
+        """改写统计"""
+        with self._lock:
+            return {'total': self.total, 'rewritten': self.rewritten, 'stale': self.stale}
+
+    def report(self) -> None:
+        """打印改写统计"""
+        stats = self.stats()
+        if stats['rewritten']:
+            print(f"汇总表改写: {stats['rewritten']}/{stats['total']} 条查询改为查询汇总表")
+        if stats['stale']:
+            print(f"汇总表改写: {stats['stale']} 条查询因汇总表未刷新、已过期（SUMMARY_MAX_STALENESS）"
+                  f"或时间范围包含未收录的记录查询原始表")
+
+def _as_datetime(value) -> datetime:
+    """数据库返回的时间（SQLite返回字符串）转换为datetime"""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+def _day_upper_bound(condition, column: str) -> Optional[date]:
+    """
+    从AND连接的条件中取出日期字段的上界（包含），无法确定时返回None
+
+    只处理字段与字面量日期比较（=、<、<=、BETWEEN、IN），其他条件不影响上界
+    """
+    from sqlglot import exp
+
+    def is_column(node) -> bool:
+        return isinstance(node, exp.Column) and node.name.lower() == column.lower()
+
+    def literal(node) -> Optional[date]:
+        if node is None or node.find(exp.Column):
+            return None
+        literals = list(node.find_all(exp.Literal))
+        if len(literals) != 1 or not literals[0].is_string:
+            return None
+        try:
+            return date.fromisoformat(literals[0].this[:10])
+        except ValueError:
+            return None
+
+    if isinstance(condition, exp.Paren):
+        return _day_upper_bound(condition.this, column)
+    if isinstance(condition, exp.And):
+        bounds = [bound for bound in (_day_upper_bound(condition.this, column),
+                                      _day_upper_bound(condition.expression, column)) if bound is not None]
+        return min(bounds) if bounds else None
+    if isinstance(condition, exp.Between) and is_column(condition.this):
+        return literal(condition.args.get('high'))
+    if isinstance(condition, exp.In) and is_column(condition.this):
+        values = [literal(value) for value in condition.expressions]
+        return max(values) if values and None not in values else None
+    if isinstance(condition, (exp.EQ, exp.LT, exp.LTE, exp.GT, exp.GTE)):
+        left, right = condition.this, condition.expression
+        if is_column(right):
+            # 'x' >= 字段 等价于 字段 <= 'x'
+            left, right = right, left
+            condition = {exp.GT: exp.LT, exp.GTE: exp.LTE, exp.LT: exp.GT, exp.LTE: exp.GTE}.get(
+                type(condition), type(condition))(this=left, expression=right)
+        if not is_column(left):
+            return None
+        bound = literal(right)
+        if bound is None or isinstance(condition, (exp.GT, exp.GTE)):
+            return None
+        return bound - timedelta(days=1) if isinstance(condition, exp.LT) else bound
+    return None
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='SQL Copilot 汇总表')
+    parser.add_argument('--refresh', action='store_true', help='构建并刷新汇总表')
+    parser.add_argument('--full', action='store_true', help='强制全量刷新')
+    parser.add_argument('--settle-seconds', type=int, default=int(config.summary_settle_seconds),
+                        help='增量刷新只处理写入超过这么多秒的记录（等待较早分配id的事务提交）')
+    parser.add_argument('--show', action='store_true', help='打印汇总表建表语句')
+    args = parser.parse_args()
+
+    if args.show or not args.refresh:
+        for summary in SUMMARY_TABLES:
+            print(summary.create_sql() + ';\n')
+    if args.refresh:
+        refresh_summary_tables(full=args.full, settle_seconds=args.settle_seconds)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+流水线测试 - 迭代器输入、按输入顺序增量写出（包括需要修复的问题）
+"""
+
+import time
+
+from pipeline import SQLPipeline
+
+class StubGenerator:
+    """问题越靠前生成越慢，让完成顺序与输入顺序不同"""
+
+    example_store = None
+
+    def generate_sql_with_stats(self, query, table_description):
+        time.sleep(0.01 * (5 - int(query)) if query.isdigit() and int(query) < 5 else 0)
+        return f"SELECT {query}", 0.0, 0
+
+    def repair_sql(self, query, sql, error, table_description):
+        return f"SELECT {query} -- fixed", 0.0
+
+    def report_prompt_stats(self):
+        pass
+
+class StubEvaluator:
+    """第3个问题第一次执行出错，修复后成功"""
+
+    def begin_run(self):
+        pass
+
+    def report_run(self):
+        pass
+
+    def evaluate_columns(self, sql):
+        success = not sql.startswith('SELECT 3') or sql.endswith('fixed')
+        return success, {'能否运行': 'Yes' if success else 'No',
+                         '执行结果': 'ok' if success else 'SQL执行错误: 出错'}
+
+def make_pipeline():
+    return SQLPipeline(StubGenerator(), StubEvaluator(), queue_size=2, generate_workers=3,
+                       evaluate_workers=2, repair_retries=1, repair_budget=30)
+
+def test_results_in_input_order():
+    results = make_pipeline().run([str(i) for i in range(8)])
+    assert [result['QA'] for result in results] == [str(i) for i in range(8)]
+    assert results[3]['SQL'] == 'SELECT 3 -- fixed' and results[3]['能否运行'] == 'Yes'
+
+def test_sink_receives_results_incrementally():
+    written = []
+    pipeline = make_pipeline()
+    queries = (str(i) for i in range(8))
+    assert pipeline.run(queries, sink=lambda records: written.append(list(records))) == []
+    assert [result['QA'] for chunk in written for result in chunk] == [str(i) for i in range(8)]
+    assert len(written) > 1
+    assert pipeline.stats.total == 8 and pipeline.stats.success == 8
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+服务模式测试 - 请求参数校验
+"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+from server import HTTPError, SQLCopilotService
+
+class StubService(SQLCopilotService):
+    """不加载表结构和数据库，只记录收到的参数"""
+
+    def __init__(self):
+        self.stats = {'requests': 0}
+        self.calls = []
+
+    async def generate(self, question, model):
+        self.calls.append(('generate', question, model))
+        return {}
+
+    def validate(self, sql):
+        self.calls.append(('validate', sql))
+        return {}
+
+    async def execute(self, sql):
+        self.calls.append(('execute', sql))
+        return {}
+
+@pytest.mark.parametrize('path, body', [
+    ('/generate', ['question']),
+    ('/generate', "统计用户数"),
+    ('/generate', {'question': ['统计用户数']}),
+    ('/generate', {'question': '统计用户数', 'model': 1}),
+    ('/generate', {'question': '统计用户数', 'model': 'gpt'}),
+    ('/generate', {}),
+    ('/validate', {'sql': 1}),
+    ('/execute', None),
+])
+def test_invalid_body_is_bad_request(path, body):
+    service = StubService()
+    with pytest.raises(HTTPError) as error:
+        asyncio.run(service.dispatch('POST', path, body))
+    assert error.value.status == 400
+    assert service.calls == []
+
+def test_valid_body_dispatched():
+    service = StubService()
+    asyncio.run(service.dispatch('POST', '/generate', {'question': '统计用户数'}))
+    asyncio.run(service.dispatch('POST', '/validate', {}))
+    asyncio.run(service.dispatch('POST', '/execute', {'sql': 'SELECT 1'}))
+    assert service.calls == [('generate', '统计用户数', 'qwen_turbo'), ('validate', ''), ('execute', 'SELECT 1')]
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+SQL生成器测试 - 提示词预算（包括方言说明和示例）
+"""
+
+from prompt_builder import (PromptBudget, LEVEL_TRUNCATED_COLUMNS, LEVEL_OVER_BUDGET,
+                            count_messages_tokens, estimate_tokens)
+from schema_model import Schema, Table, Column
+from sql_generator import SQLGeneratorFactory, LocalResponse
+
+class CountingStore:
+    """记录检索次数的示例库"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def format_examples(self, query):
+        self.calls += 1
+        return "示例问题：统计用户数\n```sql\nSELECT COUNT(*) FROM users\n```\n" * 5
+
+def make_generator(generator_type, token_budget):
+    generator = SQLGeneratorFactory.create_generator(generator_type, example_store=CountingStore(),
+                                                     token_budget=token_budget, dialect='postgresql')
+    sent = []
+    generator.get_response = lambda messages: sent.append(messages) or LocalResponse("```sql\nSELECT 1\n```")
+    return generator, sent
+
+def make_schema(tables=60):
+    return Schema([Table(f"table_{i}", f"表{i}", f"第{i}张表的说明", [
+        Column('id', 'int', nullable=False, primary_key=True, description='主键'),
+        Column('name', 'varchar(20)', description='名称'),
+        Column('amount', 'decimal(10,2)', description='金额'),
+        Column('created_at', 'datetime', description='创建时间'),
+    ], ['id']) for i in range(tables)])
+
+def test_prompt_fits_budget_including_dialect_hint():
+    for generator_type in ('qwen_turbo', 'qwen_coder'):
+        generator, sent = make_generator(generator_type, token_budget=600)
+        sql, _, tokens = generator.generate_sql_with_stats("统计每个用户的金额", make_schema())
+        assert sql == "SELECT 1"
+        assert generator.dialect.prompt_hint in sent[0][0]['content']
+        assert tokens == count_messages_tokens(sent[0], generator.count_tokens)
+        assert tokens <= 600
+        assert generator.prompt_stats['compressed'] == 1
+
+def test_examples_retrieved_once_per_prompt():
+    generator, sent = make_generator('qwen_turbo', token_budget=600)
+    generator.generate_sql("统计每个用户的金额", make_schema())
+    assert generator.example_store.calls == 1
+    assert "SELECT COUNT(*) FROM users" in sent[0][1]['content']
+
+def test_repair_prompt_has_dialect_hint():
+    generator, sent = make_generator('qwen_turbo', token_budget=0)
+    generator.repair_sql("统计用户数", "SELECT COUNT(*) FROM user", "relation \"user\" does not exist",
+                         "表 users：id int 主键")
+    assert generator.dialect.prompt_hint in sent[0][0]['content']
+
+def test_single_table_columns_truncated():
+    schema = Schema([Table('orders', '订单', '订单表', [Column('id', 'int', primary_key=True, description='主键')] + [
+        Column(f"amount_{i}", 'decimal(10,2)', description=f"金额{i}") for i in range(40)], ['id'])])
+    text, level = PromptBudget(30).fit(schema, "订单的金额")
+    assert level == LEVEL_TRUNCATED_COLUMNS
+    assert estimate_tokens(text) <= 30 and 'id' in text
+
+def test_over_budget_reported():
+    text, level = PromptBudget(1).fit(make_schema(3), "统计每个用户的金额")
+    assert level == LEVEL_OVER_BUDGET and text
+
+    generator, sent = make_generator('qwen_turbo', token_budget=10)
+    generator.generate_sql("统计每个用户的金额", make_schema())
+    assert generator.prompt_stats['over_budget'] == 1
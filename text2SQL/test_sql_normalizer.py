@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+SQL规范化测试 - 去重键（语法树和词法两种方式）
+"""
+
+import pytest
+
+import sql_normalizer
+from sql_normalizer import normalize_sql, DedupExecutor
+
+@pytest.fixture(params=['lexical', 'ast'])
+def mode(request, monkeypatch):
+    """分别在词法和语法树两种方式下运行"""
+    if request.param == 'lexical':
+        monkeypatch.setattr(sql_normalizer, '_sqlglot', False)
+    else:
+        pytest.importorskip('sqlglot')
+    return request.param
+
+@pytest.mark.parametrize('first, second', [
+    ("select name from users where id = 1;", "SELECT  name\nFROM users  WHERE id = 1 -- 注释"),
+    ("SELECT u.name FROM users u", "SELECT x.name FROM users AS x"),
+    ("SELECT count(*) FROM orders", "SELECT COUNT(*) FROM orders"),
+])
+def test_equivalent_statements_share_key(mode, first, second):
+    assert normalize_sql(first) == normalize_sql(second)
+
+@pytest.mark.parametrize('first, second', [
+    ("SELECT * FROM Users", "SELECT * FROM users"),
+    ("SELECT Name FROM users", "SELECT name FROM users"),
+    ("SELECT * FROM users WHERE name = 'Bob'", "SELECT * FROM users WHERE name = 'bob'"),
+    ("SELECT U.id FROM users u", "SELECT u.id FROM users u"),
+])
+def test_different_statements_have_different_keys(mode, first, second):
+    assert normalize_sql(first) != normalize_sql(second)
+
+def test_quoted_identifier_differs_in_postgres(mode):
+    # PostgreSQL中 "Name" 区分大小写，Name 会折叠成 name
+    assert normalize_sql('SELECT "Name" FROM users', 'postgres') != normalize_sql('SELECT Name FROM users', 'postgres')
+
+def test_identifier_case_and_quotes_kept(mode):
+    key = normalize_sql("select `Order Id` from Users")
+    assert '`Order Id`' in key
+    assert 'Users' in key
+
+def test_empty_statement(mode):
+    assert normalize_sql('') == ''
+    assert normalize_sql(' ; SELECT 1') == ''
+
+def test_dedup_executor(mode):
+    executed = []
+    executor = DedupExecutor(lambda sql: executed.append(sql) or len(executed))
+    assert executor("SELECT * FROM users") == 1
+    assert executor("select * from users;") == 1
+    assert executor("SELECT * FROM Users") == 2
+    assert executor.stats() == {'total': 3, 'unique': 2, 'duplicates': 1, 'dedup_ratio': 0.3333,
+                                'cached': 2, 'evicted': 0}
+
+def test_dedup_executor_bounded():
+    executed = []
+    executor = DedupExecutor(lambda sql: executed.append(sql) or len(executed), max_size=2)
+    for sql in ("SELECT 1", "SELECT 2", "SELECT 1", "SELECT 3"):
+        executor(sql)
+    # SELECT 2 最久未使用，被淘汰后需要重新执行
+    assert executor("SELECT 1") == 1
+    assert executor("SELECT 2") == 4
+    stats = executor.stats()
+    assert stats['cached'] == 2 and stats['evicted'] == 2 and stats['unique'] == 4
+
+def test_dedup_executor_clear_keeps_stats():
+    executed = []
+    executor = DedupExecutor(lambda sql: executed.append(sql) or len(executed))
+    executor("SELECT 1")
+    executor("SELECT 1")
+    executor.clear()
+    # 结果被丢弃，统计仍然累计
+    assert executor("SELECT 1") == 2
+    stats = executor.stats()
+    assert stats['total'] == 3 and stats['unique'] == 2 and stats['cached'] == 1
+
+def test_dedup_executor_keeps_running_statements():
+    import threading
+
+    started, release = threading.Event(), threading.Event()
+    executed = []
+
+    def execute(sql):
+        executed.append(sql)
+        if sql == "SELECT 1":
+            started.set()
+            release.wait(5)
+        return sql
+
+    executor = DedupExecutor(execute, max_size=1)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(executor("SELECT 1")))]
+    threads[0].start()
+    started.wait(5)
+    # 正在执行的语句不会被淘汰，之后到达的重复语句共享同一次执行
+    executor("SELECT 2")
+    executor("SELECT 3")
+    threads.append(threading.Thread(target=lambda: results.append(executor("select 1"))))
+    threads[1].start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ["SELECT 1", "SELECT 1"]
+    assert executed.count("SELECT 1") == 1
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+SQL执行沙箱测试 - 语句分类（语法树和词法两种方式）
+"""
+
+import pytest
+
+import sql_normalizer
+from sql_sandbox import READ, WRITE, classify_statement, check_statement
+
+# 两种方式都应允许的只读查询（函数名、带引号的标识符、限定名与关键字同名）
+VALID_READS = [
+    "SELECT REPLACE(name, 'a', 'b') FROM users",
+    "SELECT `load`, `share` FROM stocks",
+    "SELECT t.load FROM stocks t",
+    "SELECT LEFT(name, 2), IF(age > 18, 1, 0) FROM users -- DROP TABLE users",
+    "WITH a AS (SELECT 1 AS x) SELECT x FROM a",
+    "SHOW TABLES",
+    "DESCRIBE users",
+]
+
+# 两种方式都应拒绝的语句
+REJECTED = [
+    "DROP TABLE users",
+    "SELECT * FROM users FOR UPDATE",
+    "SELECT * FROM users LOCK IN SHARE MODE",
+    "SELECT name INTO @x FROM users",
+    "SELECT * INTO OUTFILE '/tmp/users' FROM users",
+    "LOAD DATA INFILE 'x' INTO TABLE users",
+    "EXPLAIN ANALYZE SELECT 1",
+    "CALL cleanup()",
+    "",
+    # 休眠、加锁、读文件等函数在只读事务中也会生效
+    "SELECT SLEEP(10)",
+    "SELECT name FROM users WHERE id = 1 AND sleep (5) = 0",
+    "SELECT BENCHMARK(100000000, MD5('a'))",
+    "SELECT GET_LOCK('evaluate', 10)",
+    "SELECT LOAD_FILE('/etc/passwd')",
+    "SELECT * FROM users WHERE id IN (SELECT pg_sleep(5))",
+    "SELECT pg_catalog.pg_advisory_lock(1)",
+    "UPDATE users SET age = SLEEP(1)",
+]
+
+@pytest.fixture
+def lexical(monkeypatch):
+    """模拟未安装sqlglot，只使用词法判断"""
+    monkeypatch.setattr(sql_normalizer, '_sqlglot', False)
+
+@pytest.mark.parametrize('sql', VALID_READS)
+def test_lexical_allows_valid_reads(lexical, sql):
+    assert classify_statement(sql) == (READ, "")
+
+@pytest.mark.parametrize('sql', REJECTED)
+def test_lexical_rejects(lexical, sql):
+    kind, message = classify_statement(sql)
+    assert kind is None and message
+
+def test_lexical_writes(lexical):
+    assert classify_statement("UPDATE users SET age = 1 WHERE id = 2")[0] == WRITE
+    assert classify_statement("DELETE FROM users; DROP TABLE users")[0] == WRITE
+    assert classify_statement("INSERT INTO users SELECT * FROM users; COMMIT")[0] == WRITE
+    assert classify_statement("UPDATE users SET age = 1; TRUNCATE users")[0] == WRITE
+
+@pytest.mark.parametrize('sql', VALID_READS + ["SELECT share FROM stocks"])
+def test_ast_allows_valid_reads(sql):
+    pytest.importorskip('sqlglot')
+    assert classify_statement(sql) == (READ, "")
+
+@pytest.mark.parametrize('sql', REJECTED + ["WITH a AS (DELETE FROM users RETURNING *) SELECT * FROM a"])
+def test_ast_rejects(sql):
+    pytest.importorskip('sqlglot')
+    kind, message = classify_statement(sql)
+    assert kind is None and message
+
+def test_forbidden_function_message(lexical):
+    assert classify_statement("SELECT pg_sleep(1), SLEEP(2)") == (None, "语句中调用了不允许的函数: pg_sleep, sleep")
+
+@pytest.mark.parametrize('sqlglot', [True, False])
+def test_function_names_as_identifiers_allowed(monkeypatch, sqlglot):
+    if sqlglot:
+        pytest.importorskip('sqlglot')
+    else:
+        monkeypatch.setattr(sql_normalizer, '_sqlglot', False)
+    # 同名的字段、字符串和注释不是函数调用
+    for sql in ("SELECT sleep, `get_lock` FROM settings", "SELECT 'SLEEP(1)' FROM users -- sleep(1)"):
+        assert check_statement(sql) == (True, READ, "")
+
+def test_check_statement_writes():
+    assert check_statement("SELECT 1") == (True, READ, "")
+    assert check_statement("DELETE FROM users")[:2] == (False, WRITE)
+    assert check_statement("DELETE FROM users", allow_writes=True) == (True, WRITE, "")
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+汇总表测试 - 改写前检查刷新状态、刷新只支持MySQL
+"""
+
+import pytest
+
+pytest.importorskip('sqlglot')
+sqlalchemy = pytest.importorskip('sqlalchemy')
+
+from schema_model import Schema
+from summary_tables import STATE_TABLE, SummaryRewriter, add_summary_tables, refresh_summary_tables
+
+QUERY = "SELECT gameType, COUNT(*) AS n FROM users GROUP BY gameType"
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'summary.db'}")
+    yield engine
+    engine.dispose()
+
+def set_refreshed(engine, name, seconds_ago):
+    """写入一条刷新状态：seconds_ago秒之前刷新过"""
+    from sqlalchemy import text
+
+    with engine.begin() as connection:
+        connection.execute(text(f"CREATE TABLE IF NOT EXISTS {STATE_TABLE} "
+                                f"(name varchar(64) PRIMARY KEY, watermark bigint, refreshed_at timestamp)"))
+        connection.execute(text(f"DELETE FROM {STATE_TABLE} WHERE name = :name"), {'name': name})
+        connection.execute(text(f"INSERT INTO {STATE_TABLE} VALUES (:name, 0, datetime('now', :offset))"),
+                           {'name': name, 'offset': f'-{seconds_ago} seconds'})
+
+def test_no_rewrite_without_engine():
+    rewriter = SummaryRewriter(dialect='sqlite')
+    assert rewriter.rewrite(QUERY) == (QUERY, None)
+    assert rewriter.stats() == {'total': 1, 'rewritten': 0, 'stale': 1}
+
+def test_no_rewrite_before_first_refresh(engine):
+    rewriter = SummaryRewriter(dialect='sqlite', engine=engine)
+    assert rewriter.rewrite(QUERY) == (QUERY, None)
+
+def test_rewrite_when_fresh(engine):
+    set_refreshed(engine, 'summary_game_type_coins', 10)
+    rewriter = SummaryRewriter(dialect='sqlite', engine=engine, max_staleness=60)
+    sql, name = rewriter.rewrite(QUERY)
+    assert name == 'summary_game_type_coins'
+    assert 'FROM summary_game_type_coins' in sql and 'SUM(user_count)' in sql
+
+def test_no_rewrite_when_stale(engine):
+    set_refreshed(engine, 'summary_game_type_coins', 120)
+    rewriter = SummaryRewriter(dialect='sqlite', engine=engine, max_staleness=60)
+    assert rewriter.rewrite(QUERY) == (QUERY, None)
+    assert rewriter.stats()['stale'] == 1
+
+    # 0表示不限制刷新时间
+    rewriter = SummaryRewriter(dialect='sqlite', engine=engine, max_staleness=0)
+    assert rewriter.rewrite(QUERY)[1] == 'summary_game_type_coins'
+
+def test_reset_rereads_state(engine):
+    rewriter = SummaryRewriter(dialect='sqlite', engine=engine, max_staleness=60)
+    assert rewriter.rewrite(QUERY)[1] is None
+    set_refreshed(engine, 'summary_game_type_coins', 0)
+    rewriter.reset()
+    assert rewriter.rewrite(QUERY)[1] == 'summary_game_type_coins'
+
+DAILY = "SELECT userId, SUM(winCoins) AS coins FROM z_financial_game_records_20250920 WHERE {} GROUP BY userId"
+
+@pytest.mark.parametrize('condition, rewritten', [
+    ("DATE(createTime) = '2025-09-20'", True),
+    ("DATE(createTime) BETWEEN '2025-09-01' AND '2025-09-20' AND userId = 1", True),
+    ("DATE(createTime) < '2025-09-21'", True),
+    # 时间范围包含刷新时还没有收录的记录
+    ("DATE(createTime) = CURRENT_DATE", False),
+    ("DATE(createTime) >= '2025-09-01'", False),
+    ("DATE(createTime) = DATE('now')", False),
+    ("userId = 1", False),
+])
+def test_incremental_summary_needs_settled_time_range(engine, condition, rewritten):
+    set_refreshed(engine, 'summary_user_daily_win_coins', 10)
+    rewriter = SummaryRewriter(dialect='sqlite', engine=engine, max_staleness=60, settle_seconds=300)
+    assert (rewriter.rewrite(DAILY.format(condition))[1] is not None) == rewritten
+
+def test_add_summary_tables_only_fresh():
+    schema = add_summary_tables(Schema(), {'summary_game_type_coins'})
+    assert [table.name for table in schema.tables] == ['summary_game_type_coins']
+    assert len(add_summary_tables(Schema()).tables) == 3
+
+def test_refresh_requires_mysql(tmp_path):
+    with pytest.raises(ValueError, match='MySQL'):
+        refresh_summary_tables(f"sqlite:///{tmp_path / 'summary.db'}")
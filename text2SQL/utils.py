@@ -5,7 +5,6 @@
 
 import re
 import time
-import pandas as pd
 from typing import List, Tuple, Optional
 import os
 
@@ -64,6 +63,8 @@ def save_results_to_excel(data: List[dict], file_path: str) -> None:
         file_path: 保存路径
     """
     try:
+        import pandas as pd
+        
         df = pd.DataFrame(data)
         df.to_excel(file_path, index=False)
         print(f"结果已保存到: {file_path}")
@@ -104,6 +105,27 @@ def clean_query(query: str) -> str:
     """
     return query.replace('\n', '').strip()
 
+WORD_PATTERN = re.compile(r'[a-z0-9_]+|[一-鿿]+')
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词：英文/数字按单词切分，中文按单字和相邻二字切分
+    
+    Args:
+        text: 文本
+        
+    Returns:
+        词项列表
+    """
+    tokens = []
+    for word in WORD_PATTERN.findall(text.lower()):
+        if word[0] < '一':
+            tokens.append(word)
+            continue
+        tokens.extend(word)
+        tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
 def split_queries(query_list: str, separator: str = '=====') -> List[str]:
     """
     分割查询列表
@@ -115,14 +137,15 @@ def split_queries(query_list: str, separator: str = '=====') -> List[str]:
     Returns:
         分割后的查询列表
     """
-    return [clean_query(q) for q in query_list.split(separator) if clean_query(q)]
+    return [query for query in map(clean_query, query_list.split(separator)) if query]
 
-def validate_sql(sql: str) -> Tuple[bool, str]:
+def validate_sql(sql: str, schema=None) -> Tuple[bool, str]:
     """
     验证SQL语法（基础验证）
     
     Args:
         sql: SQL语句
+        schema: 数据库结构模型（schema_model.Schema），提供时检查引用的数据表是否存在
         
     Returns:
         (是否有效, 错误信息)
@@ -135,6 +158,11 @@ def validate_sql(sql: str) -> Tuple[bool, str]:
     if not any(keyword in sql_upper for keyword in ['SELECT', 'INSERT', 'UPDATE', 'DELETE']):
         return False, "SQL语句缺少主要操作关键字"
     
+    if schema is not None:
+        unknown = schema.unknown_tables(sql)
+        if unknown:
+            return False, f"数据表不存在: {', '.join(unknown)}"
+    
     return True, ""
 
 def print_progress(current: int, total: int, item: str = "") -> None:
@@ -143,9 +171,12 @@ def print_progress(current: int, total: int, item: str = "") -> None:
     
     Args:
         current: 当前进度
-        total: 总数
+        total: 总数（未知时为None）
         item: 当前处理的项目
     """
+    if not total:
+        print(f"[{current}] {item}")
+        return
     percentage = (current / total) * 100
     print(f"[{current}/{total}] ({percentage:.1f}%) {item}")
 